@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout du moniteur, contre un serveur IMAP et un webhook factices
+
+Usage: python benchmarks/bench_monitor.py [--scenario NOM ...] [--messages N] [--output FICHIER]
+
+Aucun compte iCloud n'est nécessaire : le serveur IMAP (fakeimap.py) et le récepteur
+webhook (fakewebhook.py) tournent dans le processus de benchmark. Scénarios :
+- burst : alertes déposées par lots de --burst, chaque lot traité par un appel à check_email()
+- poll, idle, async-idle : main() complet (polling, IDLE, moteur asyncio), alertes déposées
+  par groupes de --burst toutes les --interval secondes
+
+Chaque scénario tourne dans un processus neuf (base d'état temporaire, modules rechargés).
+Résultats au format JSON, sur la sortie standard ou dans --output :
+- detection_latency_ms : dépôt du message → premier FETCH de son corps (p50/p95/max)
+- delivery_latency_ms : dépôt du message → arrivée du signal au webhook
+- messages_per_second : messages / (dernière arrivée − premier dépôt)
+- round_trips_per_signal : commandes IMAP reçues par le serveur, rapportées aux signaux
+  (le moniteur n'envoie que le signal le plus récent d'un lot : signals_delivered ≤ messages)
+- cpu_ms_per_message : CPU du processus, hors threads des serveurs factices
+"""
+
+import argparse
+import email
+import imaplib
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from fakeimap import FakeIMAPServer, tradingview_message
+from fakewebhook import FakeWebhookServer
+from harness import ROOT, load_monitor
+
+SCENARIOS = {
+    "burst": {"burst": 20},
+    "poll": {"argv": [], "burst": 1},
+    "idle": {"argv": ["--idle"], "burst": 1},
+    "async-idle": {"argv": ["--idle", "--engine", "async"], "burst": 1},
+}
+
+# Formats d'alerte rencontrés en production, déposés à tour de rôle
+ALERTS = (
+    "BUY",
+    "Strategy: trend-v2 | action=sell | ticker=BINANCE:BTCUSDT | price=64250.5 | qty: 0.25",
+    '{"action": "buy", "ticker": "NASDAQ:AAPL", "close": "189.52", "contracts": 3, "strategy": "mean-rev"}',
+    "SELL",
+)
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {"p50": round(pick(0.50) * 1000, 2), "p95": round(pick(0.95) * 1000, 2), "max": round(values[-1] * 1000, 2)}
+
+class Harness:
+    """Serveurs factices et moniteur chargé contre eux"""
+
+    def __init__(self, options, workdir):
+        self.imap = FakeIMAPServer().start()
+        self.imap.mailbox.latency = options.latency / 1000
+        self.webhook = FakeWebhookServer(latency=options.webhook_latency / 1000).start()
+        self.monitor = load_monitor({
+            "IMAP_SERVER": "127.0.0.1",
+            "ACCOUNTS": None,
+            "DISPATCH_TARGETS": None,
+            "WEBHOOK_URL_LOCAL": self.webhook.url,
+            "STATE_DB": os.path.join(workdir, "state.db"),
+            "LATENCY_EXPORT": None,
+            "METRICS_PORT": None,
+            "CHECK_INTERVAL": options.poll_interval,
+            # Ni limite ni dédoublonnage : chaque alerte déposée doit atteindre le webhook
+            "MAX_DAILY_SIGNALS": 10 ** 9,
+            "SIGNALS_PER_MINUTE": None,
+            "SIDE_DAILY_LIMITS": {},
+            "SYMBOL_DAILY_LIMITS": {},
+            "DEDUP_WINDOW": 0,
+            "IMAP_STANDBY": False,
+        })
+        self.monitor.MonitoredIMAP4_SSL = self._plain_imap_class()
+        self.messages = [tradingview_message(ALERTS[i % len(ALERTS)]) for i in range(options.messages)]
+        self.keys = {}  # {uid: Message-ID}, la clé d'idempotence du signal envoyé au webhook
+
+    def _plain_imap_class(self):
+        fake_port = self.imap.port
+
+        class PlainIMAP(self.monitor.MonitoredIMAP4_SSL):
+            """Même instrumentation que la connexion de production, sans TLS"""
+
+            def __init__(self, host, port=None, timeout=None):
+                imaplib.IMAP4.__init__(self, host, fake_port, timeout)
+                self.tls_resumed = False
+
+            def _create_socket(self, timeout):
+                return imaplib.IMAP4._create_socket(self, timeout)
+
+            def remember_tls_session(self):
+                pass
+
+        return PlainIMAP
+
+    def mark(self):
+        """Point de départ d'une mesure"""
+        return {"commands": len(self.imap.commands), "received": len(self.webhook.received),
+                "uids": [], "cpu": time.process_time(), "fake_cpu": self.imap.cpu + self.webhook.cpu}
+
+    def inject(self, start, count):
+        """Dépose les messages start..start+count ; retourne leurs UID"""
+        uids = []
+        for raw in self.messages[start:start + count]:
+            uid = self.imap.mailbox.add(raw)
+            self.keys[uid] = email.message_from_bytes(raw)["Message-ID"]
+            uids.append(uid)
+        return uids
+
+    def wait_for_last(self, uids, timeout):
+        """Attend le signal du dernier message déposé : il est toujours retenu dans son lot"""
+        if not self.webhook.wait_for(self.keys[uids[-1]], timeout):
+            print("Délai dépassé : le dernier signal n'a pas atteint le webhook", file=sys.stderr)
+
+    def results(self, mark):
+        cpu = time.process_time() - mark["cpu"] - (self.imap.cpu + self.webhook.cpu - mark["fake_cpu"])
+        added = {m["uid"]: m["added_at"] for m in self.imap.mailbox.messages}
+        received = self.webhook.received[mark["received"]:]
+        commands = [command for _, command in self.imap.commands[mark["commands"]:]]
+        uids = mark["uids"]
+        first_added = min(added[uid] for uid in uids)
+        # Un seul signal par lot (le plus récent) : chaque signal reçu est rattaché à son message par sa clé
+        uid_by_key = {self.keys[uid]: uid for uid in uids}
+        delivery = [arrived - added[uid_by_key[key]] for arrived, _, key in received if key in uid_by_key]
+        return {
+            "messages": len(uids),
+            "signals_delivered": len(received),
+            "detection_latency_ms": percentiles([self.imap.fetched[uid] - added[uid] for uid in uids if uid in self.imap.fetched]),
+            "delivery_latency_ms": percentiles(delivery),
+            "messages_per_second": round(len(uids) / (received[-1][0] - first_added), 1) if received else 0,
+            "round_trips_per_signal": round(len(commands) / max(1, len(received)), 2),
+            "cpu_ms_per_message": round(cpu * 1000 / len(uids), 3),
+            "commands": dict(Counter(commands).most_common()),
+        }
+
+def run_burst(harness, options):
+    """Lots de --burst alertes, un appel à check_email() par lot : débit et coût par message"""
+    monitor = harness.monitor
+    monitor.start_headless_logging()
+    monitor.accounts.update(monitor.load_accounts("local"))
+    account = next(iter(monitor.accounts.values()))
+    for target in account.targets:
+        target.client = monitor.WebhookClient(target.url, target.headers, *target.timeouts, target.retries, target.retry_backoff)
+        target.client.warm()
+    monitor.limiter.load()
+    outbox = monitor.OutboxWorker("local")
+    outbox.start()
+    manager = monitor.ConnectionManager(account, standby=False)
+    mail, _ = manager.connect()
+    monitor.check_email(mail, outbox, "local", account)  # Premier passage : filigrane initial
+
+    mark = harness.mark()
+    for start in range(0, options.messages, options.burst):
+        uids = harness.inject(start, options.burst)
+        mark["uids"] += uids
+        monitor.check_email(mail, outbox, "local", account)
+        harness.wait_for_last(uids, options.timeout)
+    result = harness.results(mark)
+    outbox.stop()
+    monitor.close_mailbox(mail)
+    return result
+
+def run_main(harness, options, argv):
+    """main() complet ; un thread dépose les alertes puis arrête le moniteur par SIGINT"""
+    result = {}
+
+    def drive():
+        # Connexion établie et premier passage terminé avant de commencer la mesure
+        deadline = time.monotonic() + options.timeout
+        while "SELECT" not in (command for _, command in harness.imap.commands) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(options.interval)
+        mark = harness.mark()
+        for start in range(0, options.messages, options.burst):
+            mark["uids"] += harness.inject(start, options.burst)
+            time.sleep(options.interval)
+        harness.wait_for_last(mark["uids"], options.timeout)
+        result.update(harness.results(mark))
+        os.kill(os.getpid(), signal.SIGINT)
+
+    threading.Thread(target=drive, name="bench-driver", daemon=True).start()
+    sys.argv = ["icloud-Webhook.py", "--mode", "local", "--headless"] + argv
+    try:
+        harness.monitor.main()
+    except SystemExit:
+        pass
+    return result
+
+def run_child(options):
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = Harness(options, workdir)
+        scenario = SCENARIOS[options.child]
+        options.burst = options.burst or scenario["burst"]
+        if "argv" in scenario:
+            result = run_main(harness, options, scenario["argv"])
+        else:
+            result = run_burst(harness, options)
+    with open(options.result, "w") as f:
+        json.dump(result, f)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du moniteur contre des serveurs IMAP et webhook factices")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Scénario à exécuter (répétable, tous par défaut)")
+    parser.add_argument("--messages", type=int, default=100, help="Nombre d'alertes déposées par scénario")
+    parser.add_argument("--burst", type=int, help="Alertes déposées ensemble (20 pour burst, 1 sinon)")
+    parser.add_argument("--interval", type=float, default=0.1, help="Pause entre deux dépôts (secondes, scénarios main)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="CHECK_INTERVAL du scénario poll (secondes)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latence injectée par commande IMAP (ms)")
+    parser.add_argument("--webhook-latency", type=float, default=0.0, help="Latence injectée par requête webhook (ms)")
+    parser.add_argument("--timeout", type=float, default=60, help="Délai max d'attente des signaux (secondes)")
+    parser.add_argument("--output", help="Fichier JSON de résultats (sortie standard par défaut)")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        run_child(options)
+        return
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {k: v for k, v in vars(options).items()
+                    if k not in ("scenario", "output", "child", "result") and v is not None},
+        "scenarios": {},
+    }
+    for name in options.scenario or SCENARIOS:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_path = f.name
+        try:
+            # Processus neuf par scénario : état global du moniteur et CPU mesuré isolés
+            args = [sys.executable, os.path.abspath(__file__), "--child", name, "--result", result_path]
+            args += [f"--{k.replace('_', '-')}={v}" for k, v in report["options"].items()]
+            completed = subprocess.run(args, stdout=subprocess.DEVNULL, timeout=options.timeout * 2 + 30)
+            with open(result_path) as f:
+                report["scenarios"][name] = json.load(f) if completed.returncode == 0 else {"error": completed.returncode}
+        except (subprocess.TimeoutExpired, ValueError) as e:
+            report["scenarios"][name] = {"error": str(e)}
+        finally:
+            os.remove(result_path)
+        print(f"{name:<11} {json.dumps(report['scenarios'][name])[:120]}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
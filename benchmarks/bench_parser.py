@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de l'analyse des alertes (AlertParser.parse)
+
+Usage: python benchmarks/bench_parser.py [--number N]
+
+Mesure le coût moyen d'analyse d'un message, par format d'alerte, en microsecondes.
+Utilise config.py s'il existe, sinon config.example.py (seul ALERT_PATTERNS est lu ici).
+"""
+
+import argparse
+import timeit
+
+from harness import load_monitor
+
+SAMPLES = {
+    "mot seul": "BUY",
+    "texte libre": ("Strategy: trend-v2 | action=buy | ticker=BINANCE:BTCUSDT | price=64250.5 "
+                    "| qty: 0.25 | time=2024-05-01T12:00:00Z"),
+    "json": ('{"action": "sell", "ticker": "NASDAQ:AAPL", "close": "189.52", "contracts": 3, '
+             '"strategy": "mean-rev", "time": "2024-05-01T12:00:00Z"}'),
+    "sans signal": "Alerte de prix : BTCUSDT a franchi 65000 (BUYSELL ratio 1.2)",
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de l'analyse des alertes")
+    parser.add_argument("--number", type=int, default=100000, help="Nombre d'analyses par format")
+    args = parser.parse_args()
+
+    alert_parser = load_monitor().alert_parser
+    print(f"{'Format':<14} {'µs/message':>10}  Résultat")
+    for name, text in SAMPLES.items():
+        # Meilleur de 5 séries : écarte le bruit de l'ordonnanceur
+        best = min(timeit.repeat(lambda: alert_parser.parse(text), number=args.number, repeat=5))
+        print(f"{name:<14} {best / args.number * 1e6:>10.2f}  {alert_parser.parse(text)}")
+
+if __name__ == "__main__":
+    main()
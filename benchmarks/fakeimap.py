@@ -0,0 +1,327 @@
+"""
+Serveur IMAP factice, en mémoire, pour les benchmarks
+
+Implémente le sous-ensemble utilisé par le moniteur : LOGIN, SELECT/EXAMINE, STATUS, NOOP,
+UID SEARCH, UID FETCH (BODYSTRUCTURE, sections et fetch partiel), UID STORE et IDLE.
+Le serveur tourne dans des threads du processus de benchmark ; il mesure lui-même ce qui
+intéresse le runner :
+- `commands` : commandes reçues (allers-retours), horodatées
+- `fetched` : instant du premier FETCH de corps de chaque UID (détection effective)
+- `cpu` : temps CPU consommé par ses threads, à soustraire de celui du processus
+Une latence réseau peut être injectée avant chaque réponse (`mailbox.latency`, en secondes).
+"""
+
+import email
+import re
+import select
+import socketserver
+import threading
+import time
+from functools import lru_cache
+from datetime import datetime, timezone
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+
+CAPABILITIES = "IMAP4rev1 IDLE CONDSTORE UIDPLUS"
+
+def tradingview_message(text, sender="noreply@tradingview.com", date=None):
+    """Email au format des alertes TradingView : texte brut + HTML volumineux, quoted-printable"""
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = "me@icloud.com"
+    message["Subject"] = f"Alerte : {text[:40]}"
+    message["Date"] = format_datetime(date or datetime.now(timezone.utc))
+    message["Message-ID"] = make_msgid(domain="tradingview.com")
+    message.set_content(text, cte="quoted-printable")
+    # Le gabarit HTML de TradingView pèse plusieurs dizaines de Ko : c'est lui que le fetch partiel évite
+    message.add_alternative(f"<html><body>{'<div>&nbsp;</div>' * 1500}<p>{text}</p></body></html>", subtype="html")
+    return message.as_bytes().replace(b"\n", b"\r\n")
+
+def _quote(value):
+    return "NIL" if value is None else '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _bodystructure(message):
+    if message.is_multipart():
+        return "(" + "".join(_bodystructure(part) for part in message.get_payload()) + f" {_quote(message.get_content_subtype().upper())})"
+    params = (message.get_params() or [])[1:]
+    plist = "(" + " ".join(f"{_quote(k.upper())} {_quote(v)}" for k, v in params) + ")" if params else "NIL"
+    payload = message.get_payload()
+    encoding = (message.get("Content-Transfer-Encoding") or "7BIT").upper()
+    structure = (f"({_quote(message.get_content_maintype().upper())} {_quote(message.get_content_subtype().upper())} "
+                 f"{plist} NIL NIL {_quote(encoding)} {len(payload.encode())}")
+    if message.get_content_maintype() == "text":
+        structure += f" {payload.count(chr(10))}"
+    return structure + ")"
+
+@lru_cache(maxsize=64)  # Même ensemble évalué pour chaque message d'un SEARCH
+def _parse_set(spec, highest):
+    result = set()
+    for part in spec.split(","):
+        low, _, high = part.partition(":")
+        low = highest if low == "*" else int(low)
+        high = low if not high else highest if high == "*" else int(high)
+        result.update(range(min(low, high), max(low, high) + 1))
+    return result
+
+class Mailbox:
+    """Contenu du dossier surveillé, partagé par toutes les connexions"""
+
+    def __init__(self):
+        self.messages = []        # [{"uid", "raw", "from", "flags", "added_at", "internaldate"}]
+        self.uidnext = 1
+        self.uidvalidity = 42
+        self.modseq = 1
+        self.latency = 0.0        # Délai injecté avant chaque réponse (secondes)
+        self.changed = threading.Condition()
+
+    def add(self, raw, internaldate=None):
+        """Dépose un message ; retourne son UID
+
+        `internaldate` (datetime) antidate la réception, pour simuler l'arriéré d'une coupure.
+        """
+        with self.changed:
+            uid = self.uidnext
+            # Expéditeur extrait une fois : SEARCH FROM reste linéaire sur une boîte de plusieurs milliers d'emails
+            sender = email.message_from_bytes(raw).get("From", "")
+            self.messages.append({"uid": uid, "raw": raw, "from": sender, "flags": set(), "added_at": time.perf_counter(),
+                                  "internaldate": internaldate or datetime.now(timezone.utc)})
+            self.uidnext += 1
+            self.modseq += 1
+            self.changed.notify_all()
+        return uid
+
+class Handler(socketserver.StreamRequestHandler):
+    # Réponse écrite d'un bloc à la fin de chaque commande : pas d'interaction Nagle / ACK retardé
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def send(self, data):
+        self.wfile.write(data.encode() if isinstance(data, str) else data)
+
+    def handle(self):
+        server = self.server
+        self.known = len(server.mailbox.messages)
+        self.send(f"* OK [CAPABILITY {CAPABILITIES}] fake\r\n")
+        self.wfile.flush()
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                started = time.thread_time()
+                if server.mailbox.latency:
+                    time.sleep(server.mailbox.latency)
+                tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+                command, _, args = rest.partition(" ")
+                command, uid = command.upper(), False
+                if command == "UID":
+                    command, _, args = args.partition(" ")
+                    command, uid = command.upper(), True
+                server.record(("UID " if uid else "") + command)
+                handler = getattr(self, "do_" + command.lower(), None)
+                if handler:
+                    handler(tag, args, uid)
+                else:
+                    self.send(f"{tag} BAD commande inconnue\r\n")
+                self.wfile.flush()
+                server.add_cpu(time.thread_time() - started)
+                if command == "LOGOUT":
+                    return
+        except (ConnectionError, OSError):
+            return
+
+    def do_capability(self, tag, args, uid):
+        self.send(f"* CAPABILITY {CAPABILITIES}\r\n{tag} OK done\r\n")
+
+    def do_login(self, tag, args, uid):
+        self.send(f"{tag} OK [CAPABILITY {CAPABILITIES}] logged in\r\n")
+
+    def do_select(self, tag, args, uid):
+        box = self.server.mailbox
+        self.known = len(box.messages)
+        self.send(f"* {len(box.messages)} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY {box.uidvalidity}] v\r\n"
+                  f"* OK [UIDNEXT {box.uidnext}] n\r\n* OK [HIGHESTMODSEQ {box.modseq}] m\r\n{tag} OK [READ-WRITE] done\r\n")
+
+    do_examine = do_select
+
+    def do_noop(self, tag, args, uid):
+        box = self.server.mailbox
+        if len(box.messages) != self.known:
+            self.known = len(box.messages)
+            self.send(f"* {self.known} EXISTS\r\n")
+        self.send(f"{tag} OK noop\r\n")
+
+    do_check = do_noop
+
+    def do_status(self, tag, args, uid):
+        box = self.server.mailbox
+        unseen = sum(1 for m in box.messages if "\\Seen" not in m["flags"])
+        self.send(f"* STATUS INBOX (MESSAGES {len(box.messages)} UIDNEXT {box.uidnext} UIDVALIDITY {box.uidvalidity} "
+                  f"UNSEEN {unseen} HIGHESTMODSEQ {box.modseq})\r\n{tag} OK status\r\n")
+
+    def do_close(self, tag, args, uid):
+        self.send(f"{tag} OK closed\r\n")
+
+    def do_logout(self, tag, args, uid):
+        self.send(f"* BYE\r\n{tag} OK bye\r\n")
+
+    def do_idle(self, tag, args, uid):
+        box = self.server.mailbox
+        self.send("+ idling\r\n")
+        self.wfile.flush()
+        while True:
+            with box.changed:
+                if len(box.messages) == self.known:
+                    box.changed.wait(0.001)
+                if len(box.messages) != self.known:
+                    self.known = len(box.messages)
+                    self.send(f"* {self.known} EXISTS\r\n")
+                    self.wfile.flush()
+            readable, _, _ = select.select([self.request], [], [], 0)
+            if readable:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b"DONE":
+                    break
+        self.send(f"{tag} OK idle done\r\n")
+
+    def _matches(self, message, criteria):
+        tokens = re.findall(r'"[^"]*"|\(|\)|\S+', criteria)
+        i, match = 0, True
+        while i < len(tokens):
+            token = tokens[i].upper()
+            if token == "UNSEEN":
+                match &= "\\Seen" not in message["flags"]
+            elif token == "FROM":
+                i += 1
+                match &= tokens[i].strip('"').lower() in message["from"].lower()
+            elif token in ("SINCE", "SENTSINCE", "SENTON"):
+                i += 1
+            elif token == "UID":
+                i += 1
+                match &= message["uid"] in _parse_set(tokens[i], self.server.mailbox.uidnext - 1)
+            i += 1
+        return match
+
+    def do_search(self, tag, args, uid):
+        if args.upper().startswith("CHARSET"):
+            args = args.split(" ", 2)[2]
+        found = [str(m["uid"] if uid else n) for n, m in enumerate(self.server.mailbox.messages, 1)
+                 if self._matches(m, args)]
+        self.send(f"* SEARCH {' '.join(found)}\r\n{tag} OK search\r\n")
+
+    def _select(self, spec, uid):
+        messages = self.server.mailbox.messages
+        if not messages:
+            return []
+        if uid:
+            wanted = _parse_set(spec, messages[-1]["uid"])
+            return [(n, m) for n, m in enumerate(messages, 1) if m["uid"] in wanted]
+        wanted = _parse_set(spec, len(messages))
+        return [(n, m) for n, m in enumerate(messages, 1) if n in wanted]
+
+    def _section(self, message, section):
+        raw = message["raw"]
+        header, _, body = raw.partition(b"\r\n\r\n")
+        if section == "":
+            return raw
+        if section.upper() == "HEADER":
+            return header + b"\r\n\r\n"
+        if section.upper().startswith("HEADER.FIELDS"):
+            names = {n.upper() for n in re.findall(r"[\w-]+", section[len("HEADER.FIELDS"):])}
+            lines = [l for l in header.split(b"\r\n") if l.split(b":")[0].decode().upper() in names]
+            return b"\r\n".join(lines) + b"\r\n\r\n"
+        part = email.message_from_bytes(raw)
+        if not part.is_multipart():
+            return body
+        for number in section.split("."):
+            part = part.get_payload()[int(number) - 1]
+        return part.get_payload().encode()
+
+    def do_fetch(self, tag, args, uid):
+        spec, _, items = args.partition(" ")
+        items = items.strip()
+        if items.startswith("("):
+            items = items[1:-1]
+        tokens = re.findall(r"BODY(?:\.PEEK)?\[[^\]]*\](?:<[\d.]+>)?|\S+", items)
+        for n, message in self._select(spec, uid):
+            parts = []
+            if uid and "UID" not in (t.upper() for t in tokens):
+                parts.append(f"UID {message['uid']}")
+            for token in tokens:
+                upper = token.upper()
+                if upper == "UID":
+                    parts.append(f"UID {message['uid']}")
+                elif upper == "FLAGS":
+                    parts.append(f"FLAGS ({' '.join(message['flags'])})")
+                elif upper == "INTERNALDATE":
+                    parts.append(f'INTERNALDATE "{message["internaldate"].astimezone(timezone.utc).strftime("%d-%b-%Y %H:%M:%S +0000")}"')
+                elif upper == "BODYSTRUCTURE":
+                    parts.append("BODYSTRUCTURE " + _bodystructure(email.message_from_bytes(message["raw"])))
+                elif upper == "RFC822.SIZE":
+                    parts.append(f"RFC822.SIZE {len(message['raw'])}")
+                elif upper.startswith("BODY"):
+                    peek, section, offset, length = re.match(r"BODY(\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?", token, re.I).groups()
+                    data = self._section(message, section)
+                    name = f"BODY[{section}]"
+                    if offset is not None:
+                        data = data[int(offset):int(offset) + int(length)]
+                        name += f"<{offset}>"
+                    if not peek:
+                        message["flags"].add("\\Seen")
+                    if not section.upper().startswith("HEADER"):
+                        self.server.fetched.setdefault(message["uid"], time.perf_counter())
+                    parts.append((name, data))
+            response = f"* {n} FETCH ("
+            for i, part in enumerate(parts):
+                response += " " if i else ""
+                if isinstance(part, tuple):
+                    self.send(response + f"{part[0]} {{{len(part[1])}}}\r\n")
+                    self.send(part[1])
+                    response = ""
+                else:
+                    response += part
+            self.send(response + ")\r\n")
+        self.send(f"{tag} OK fetch\r\n")
+
+    def do_store(self, tag, args, uid):
+        spec, operation, flags = args.split(" ", 2)
+        flags = set(re.findall(r"\\\w+", flags))
+        for n, message in self._select(spec, uid):
+            if operation.startswith("+"):
+                message["flags"] |= flags
+            else:
+                message["flags"] -= flags
+            if ".SILENT" not in operation.upper():
+                self.send(f"* {n} FETCH (UID {message['uid']} FLAGS ({' '.join(message['flags'])}))\r\n")
+        self.server.mailbox.modseq += 1
+        self.send(f"{tag} OK store\r\n")
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """Serveur IMAP en clair sur 127.0.0.1 ; `start()` le lance dans un thread"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.mailbox = Mailbox()
+        self.commands = []        # [(instant, commande)]
+        self.fetched = {}         # {uid: instant du premier FETCH de corps}
+        self.cpu = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def record(self, command):
+        with self._lock:
+            self.commands.append((time.perf_counter(), command))
+
+    def add_cpu(self, seconds):
+        with self._lock:
+            self.cpu += seconds
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-imap", daemon=True).start()
+        return self
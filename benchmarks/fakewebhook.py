@@ -0,0 +1,72 @@
+"""
+Récepteur webhook factice pour les benchmarks
+
+Répond 200 à chaque POST et enregistre l'instant d'arrivée (horloge perf_counter, commune
+au processus de benchmark), la charge utile JSON et la clé d'idempotence. Comme le serveur
+IMAP factice, il comptabilise le temps CPU de ses threads pour que le runner l'écarte de
+celui du moniteur. Un délai de réponse peut être injecté (`latency`, en secondes).
+"""
+
+import http.server
+import json
+import threading
+import time
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, comme le bot de trading
+
+    def do_POST(self):
+        arrived_at = time.perf_counter()
+        started = time.thread_time()
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if server.latency:
+            time.sleep(server.latency)
+        server.record(arrived_at, json.loads(body or b"null"), self.headers.get("X-Idempotency-Key"))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        server.add_cpu(time.thread_time() - started)
+
+    def do_HEAD(self):
+        # Sonde de keep-alive du client webhook
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeWebhookServer(http.server.ThreadingHTTPServer):
+    """Récepteur sur 127.0.0.1 ; `wait_for(clé)` attend l'arrivée d'un signal donné"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0):
+        super().__init__(("127.0.0.1", port), Handler)
+        self.latency = latency
+        self.received = []        # [(instant d'arrivée, charge utile, clé d'idempotence)]
+        self.cpu = 0.0
+        self._arrived = threading.Condition()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/webhook"
+
+    def record(self, arrived_at, payload, key):
+        with self._arrived:
+            self.received.append((arrived_at, payload, key))
+            self._arrived.notify_all()
+
+    def add_cpu(self, seconds):
+        with self._arrived:
+            self.cpu += seconds
+
+    def wait_for(self, key, timeout=30):
+        """Attend la requête portant la clé d'idempotence `key` ; retourne False si le délai expire"""
+        with self._arrived:
+            return self._arrived.wait_for(lambda: any(k == key for _, _, k in reversed(self.received)), timeout)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-webhook", daemon=True).start()
+        return self
@@ -0,0 +1,31 @@
+"""
+Outils communs aux benchmarks : chargement du moniteur avec une configuration de test
+"""
+
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_monitor(overrides=None):
+    """Charge icloud-Webhook.py comme module (le nom du fichier contient un tiret)
+
+    Utilise config.py s'il existe, sinon config.example.py. Les valeurs de `overrides`
+    remplacent celles du fichier avant le chargement du script, qui lit sa configuration
+    à l'import.
+    """
+    sys.path.insert(0, ROOT)
+    if os.path.exists(os.path.join(ROOT, "config.py")):
+        import config
+    else:
+        spec = importlib.util.spec_from_file_location("config", os.path.join(ROOT, "config.example.py"))
+        config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(config)
+        sys.modules["config"] = config
+    for name, value in (overrides or {}).items():
+        setattr(config, name, value)
+    spec = importlib.util.spec_from_file_location("icloud_webhook", os.path.join(ROOT, "icloud-Webhook.py"))
+    monitor = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(monitor)
+    return monitor
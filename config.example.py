@@ -10,13 +10,140 @@ WEBHOOK_URL_PUBLIC = "https://votre-url-ngrok.ngrok.io/webhook"  # URL publique
 # Token d'authentification pour le webhook
 WEBHOOK_TOKEN = "votre_token_secret"  # Token pour sécuriser les requêtes 
 
+# Envoi du même signal à plusieurs cibles en parallèle (facultatif)
+# Sans DISPATCH_TARGETS, le signal part vers WEBHOOK_URL_LOCAL / WEBHOOK_URL_PUBLIC (selon --mode)
+# avec WEBHOOK_TOKEN. Chaque cible a son URL ("url", ou "url_local" / "url_public"), son token,
+# ses timeouts et relances ; les clés omises reprennent les valeurs WEBHOOK_* de ce fichier.
+# Un rejeu (--replay) sans --replay-sink n'accepte que des cibles à "url_local".
+# "payload" est un modèle de charge utile : les chaînes "{side}", "{symbol}", "{price}",
+# "{quantity}", "{strategy}", "{alert_time}" sont remplacées par les champs du signal.
+# DISPATCH_TARGETS = [
+#     {"name": "bot", "url_local": "http://127.0.0.1:5001/webhook",
+#      "url_public": "https://votre-url-ngrok.ngrok.io/webhook", "token": "votre_token_secret"},
+#     {"name": "paper", "url": "http://127.0.0.1:5002/webhook", "token": "token_paper",
+#      "payload": {"action": "{side}", "ticker": "{symbol}", "price": "{price}"}},
+#     {"name": "audit", "url": "http://127.0.0.1:5003/log", "token": "token_audit",
+#      "read_timeout": 2, "retries": 0, "required": False},
+# ]
+# Cibles devant accuser réception pour que le signal soit validé (compté, email marqué comme lu) :
+# "all" (toutes), "any" (au moins une), "required" (celles sans "required": False), ou un nombre
+DISPATCH_QUORUM = "all"
+
+# Surveillance de plusieurs comptes / dossiers (facultatif)
+# Sans ACCOUNTS, seul le compte ci-dessus (EMAIL_ACCOUNT, dossier INBOX) est surveillé.
+# Chaque entrée a sa propre connexion IMAP, son filtre d'expéditeur, son webhook et sa limite
+# quotidienne ; les clés omises reprennent les valeurs globales de ce fichier.
+# EMAIL_ACCOUNT / APP_PASSWORD restent utilisés pour l'envoi des emails d'alerte.
+# ACCOUNTS = [
+#     {
+#         "name": "strategie-a",                        # Nom affiché et label des métriques
+#         "email": "votre_email@icloud.com",
+#         "password": "votre_mot_de_passe_app",
+#         "folder": "INBOX",                            # Dossier IMAP surveillé
+#         "sender": "noreply@tradingview.com",          # Expéditeur des alertes
+#         "webhook_url_local": "http://127.0.0.1:5001/webhook",
+#         "webhook_url_public": "https://votre-url-ngrok.ngrok.io/webhook",
+#         "webhook_token": "votre_token_secret",
+#         "max_daily_signals": 15,
+#         "signals_per_minute": 3,                      # Limites du limiteur propres au compte
+#         "symbol_daily_limits": {"BTCUSDT": 4},
+#         # "targets": [...], "quorum": "any",        # Cibles d'envoi propres au compte (cf. DISPATCH_TARGETS)
+#     },
+#     {
+#         "name": "strategie-b",
+#         "email": "autre_email@icloud.com",
+#         "password": "autre_mot_de_passe_app",
+#         "folder": "TradingView",
+#         "webhook_url_local": "http://127.0.0.1:5002/webhook",
+#         "max_daily_signals": 5,
+#     },
+# ]
+
+# Connexion au webhook (session keep-alive préchauffée)
+WEBHOOK_CONNECT_TIMEOUT = 3       # Délai max d'établissement de la connexion (en secondes)
+WEBHOOK_READ_TIMEOUT = 10         # Délai max d'attente de la réponse (en secondes)
+WEBHOOK_RETRIES = 2               # Nouvelles tentatives si le webhook n'a pas reçu la requête
+WEBHOOK_RETRY_BACKOFF = 0.2       # Base du backoff exponentiel aléatoire entre tentatives (en secondes)
+WEBHOOK_KEEPALIVE_INTERVAL = 30   # Préchauffage de la connexion après cette durée d'inactivité (en secondes)
+
+# Outbox (file d'envoi persistante entre la détection et le webhook)
+OUTBOX_MAX_ATTEMPTS = 5           # Nombre de tentatives avant abandon d'un signal
+OUTBOX_RETRY_DELAY = 2            # Délai de base entre deux tentatives (en secondes, doublé à chaque échec)
+SIGNAL_TTL = 120                  # Âge maximum d'un signal : au-delà, il est abandonné au lieu d'être exécuté (en secondes)
+
+# Emails d'alerte (envoyés en arrière-plan sur une connexion SMTP réutilisée)
+SMTP_SERVER = "smtp.mail.me.com"
+SMTP_PORT = 587                   # 587 : STARTTLS ; 465 : SSL implicite
+SMTP_TIMEOUT = 10                 # Délai max de chaque opération SMTP (en secondes)
+SMTP_IDLE_TIMEOUT = 60            # Fermeture de la connexion après cette durée sans envoi (en secondes)
+ALERT_COOLDOWN = 300              # Alertes identiques regroupées dans un récapitulatif pendant ce délai (en secondes)
+
 # Paramètres de l'historique
 MAX_SIGNAL_HISTORY = 15    # Nombre de signaux BUY/SELL à conserver
 MAX_EVENT_HISTORY = 30     # Nombre d'événements relatifs aux signaux à conserver
 MAX_ALERT_HISTORY = 30     # Nombre d'alertes et erreurs à conserver
+DISPLAY_MAX_FPS = 10       # Nombre max de rafraîchissements du terminal par seconde
+PERSIST_HISTORY = False    # True : événements et alertes enregistrés à l'arrêt et réaffichés au lancement suivant
+
+# Mesure des latences (de l'envoi de l'email par TradingView à la réponse du webhook)
+LATENCY_SAMPLES = 500                   # Nombre de mesures conservées par étape pour le calcul des percentiles
+LATENCY_EXPORT = "latency_stats.json"   # Fichier d'export des percentiles p50/p95/p99 (None pour désactiver)
+
+# Métriques Prometheus (/metrics) et santé (/healthz)
+METRICS_PORT = None        # Port HTTP du serveur de métriques, ex. 9317 (None pour désactiver)
+METRICS_HOST = "127.0.0.1" # Adresse d'écoute ("0.0.0.0" pour l'exposer sur le réseau)
+HEALTH_GRACE = 60          # Marge (en secondes) au-delà d'un cycle de surveillance avant que /healthz passe en échec
+
+# Moteur asyncio (--engine async)
+ASYNC_QUEUE_SIZE = 32      # Nombre max de lots d'emails en attente entre l'ingestion IMAP et l'analyse
+
+# Analyse des alertes : expressions régulières remplaçant celles par défaut, champ par champ
+# (champs : side, symbol, price, quantity, strategy, alert_time ; le groupe 1 capture la valeur)
+# ALERT_PATTERNS = {
+#     "symbol": r"\bsur\s+([A-Z0-9:._-]+)",
+# }
+
+# Dédoublonnage des signaux (alertes TradingView envoyées en double)
+DEDUP_WINDOW = 10          # Fenêtre (en secondes) pendant laquelle un même signal est ignoré (0 pour désactiver)
+DEDUP_MAX_ENTRIES = 1024   # Nombre max de signaux retenus dans le cache
 
 # Paramètres de sécurité et performance
-MAX_DAILY_SIGNALS = 15     # Limite de signaux BUY/SELL par jour
+MAX_DAILY_SIGNALS = 15     # Limite de signaux BUY/SELL par jour (remise à zéro à minuit, heure de Paris)
+SIGNALS_PER_MINUTE = None  # Rafale max : N signaux d'affilée, puis N par minute (None pour désactiver)
+SIDE_DAILY_LIMITS = {}     # Budgets quotidiens par sens, ex. {"BUY": 8}
+SYMBOL_DAILY_LIMITS = {}   # Budgets quotidiens par symbole, ex. {"BTCUSDT": 4, "*": 6} ("*" = autres symboles)
+LIMIT_EXEMPT_SIDES = ("SELL",)  # Sens toujours exécutés, même limite atteinte (clôture de position)
 CHECK_INTERVAL = 10        # Délai entre chaque vérification des emails (en secondes)
-RECONNECT_DELAY = 10       # Délai initial avant reconnexion en cas d'erreur (en secondes)
-MAX_RECONNECT_DELAY = 300  # Délai maximum de reconnexion (en secondes) 
\ No newline at end of file
+IDLE_TIMEOUT = 1500        # Durée max d'une commande IMAP IDLE avant relance (en secondes, < 29 minutes)
+BODY_FETCH_LIMIT = 2048    # Nombre d'octets max récupérés de la partie texte des alertes
+RECONNECT_DELAY = 10       # Délai initial avant reconnexion en cas d'erreurs répétées (la première tentative est immédiate)
+MAX_RECONNECT_DELAY = 300  # Délai maximum de reconnexion (en secondes)
+
+# Reconnexion rapide
+IMAP_TIMEOUT = 30          # Timeout des opérations IMAP, connexion comprise (en secondes)
+IMAP_STANDBY = True        # Connexion de secours ouverte en arrière-plan : bascule immédiate en cas de coupure
+STANDBY_KEEPALIVE = 300    # Intervalle initial des NOOP de la connexion de secours (en secondes, adaptatif)
+KEEPALIVE_MIN = 30         # Plancher des intervalles de maintien (NOOP de secours, durée d'IDLE)
+KEEPALIVE_MAX = 900        # Plafond de l'intervalle des NOOP de secours
+
+# Réception directe des alertes webhook TradingView (en plus de l'IMAP, qui reste la voie de secours)
+# URL à déclarer dans l'alerte TradingView : https://<votre-url-ngrok>/alert?token=<HTTP_INGEST_TOKEN>
+HTTP_INGEST_PORT = None    # Port d'écoute, ex. 8081 (None pour désactiver)
+HTTP_INGEST_HOST = "127.0.0.1"  # Adresse d'écoute ("0.0.0.0" pour toutes les interfaces)
+HTTP_INGEST_TOKEN = None   # Secret exigé sur chaque alerte (URL ?token=, en-tête X-WEBHOOK-TOKEN ou champ JSON "token")
+HTTP_INGEST_ALLOWED_IPS = None  # Adresses autorisées, ex. ["52.89.214.238", "34.212.75.30", "54.218.53.128", "52.32.178.7"]
+HTTP_INGEST_TRUSTED_PROXIES = 1  # Proxys locaux qui ajoutent une entrée à X-Forwarded-For (ngrok seul = 1, ngrok + nginx = 2)
+HTTP_INGEST_MAX_BODY = 16384    # Taille max du corps d'une alerte (en octets)
+CROSS_SOURCE_WINDOW = 600  # Délai max (en secondes) entre l'alerte HTTP et son email pour les rapprocher
+
+# Rattrapage après une coupure (emails reçus pendant que le script ne tournait pas)
+SIGNAL_MAX_AGE = 300       # Âge max (en secondes, date de réception iCloud) d'un email traité comme une alerte en direct
+STALE_SIGNAL_POLICY = "skip"  # Emails plus vieux : "skip" (ignorés), "reconcile" (dernier signal envoyé avec
+                              # "catchup": true et son âge) ou "send" (traités comme des alertes en direct)
+CATCHUP_THRESHOLD = 20     # Au-delà de ce nombre de nouveaux emails, l'arriéré est traité en arrière-plan
+
+# Rechargement à chaud (limites, cibles d'envoi, intervalles), aussi déclenché par SIGHUP
+CONFIG_WATCH_INTERVAL = 2  # Vérification des modifications de ce fichier, en secondes (None = SIGHUP seulement)
+
+# Fichier d'état local (filigrane UID des emails déjà traités)
+STATE_DB = "monitor_state.db"
@@ -7,31 +7,115 @@
 - Envoie une requête POST avec le bon JSON (BUY ou SELL)
 
 Usage:
-    python icloud-Webhook.py --mode [local|public]
+    python icloud-Webhook.py --mode [local|public] [--idle] [--engine thread|async] [--headless]
+    python icloud-Webhook.py --mode local --replay ARCHIVE [--replay-speed X] [--replay-sink FICHIER]
     
 Options:
     --mode local   Utilise le serveur local (http://127.0.0.1:5001/webhook)
     --mode public  Utilise le serveur public (URL NGROK)
+    --idle         Utilise IMAP IDLE (push) au lieu du polling toutes les CHECK_INTERVAL secondes
+    --engine async Ingestion IMAP, analyse et envoi en étapes asyncio concurrentes
+    --headless     Aucun affichage : une ligne JSON par événement (systemd, Docker)
+    --replay       Rejoue une archive mbox ou Maildir (analyse, dédoublonnage, limites, envoi) sans IMAP
 """
 
 import imaplib
 import email
 import json
-import requests
 import time
+import random
 import argparse
 import sys
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import select
+import re
+import base64
+import quopri
+import sqlite3
+import threading
+import asyncio
+import socket
+import tempfile
+import hmac
+import importlib
+import signal as os_signal
+import uuid
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from types import SimpleNamespace
+import ssl
 from config import (IMAP_SERVER, EMAIL_ACCOUNT, APP_PASSWORD, 
                    WEBHOOK_URL_LOCAL, WEBHOOK_URL_PUBLIC, WEBHOOK_TOKEN,
                    MAX_SIGNAL_HISTORY, MAX_EVENT_HISTORY, MAX_ALERT_HISTORY,
                    MAX_DAILY_SIGNALS, CHECK_INTERVAL, RECONNECT_DELAY, MAX_RECONNECT_DELAY)
-from datetime import datetime, timezone
+import config
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo  # Ajout de l'import pour les fuseaux horaires
 import os
 import shutil
+import unicodedata
+import logging
+import logging.handlers
+import queue
+from collections import OrderedDict, deque, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import parsedate_to_datetime
+
+# Paramètres optionnels (valeurs par défaut si absents de config.py)
+IDLE_TIMEOUT = getattr(config, "IDLE_TIMEOUT", 25 * 60)  # Relance d'IDLE avant le timeout serveur de 29 minutes
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_DB = os.path.join(SCRIPT_DIR, getattr(config, "STATE_DB", "monitor_state.db"))
+BODY_FETCH_LIMIT = getattr(config, "BODY_FETCH_LIMIT", 2048)  # Octets max récupérés de la partie text/plain
+WEBHOOK_CONNECT_TIMEOUT = getattr(config, "WEBHOOK_CONNECT_TIMEOUT", 3)     # Secondes pour établir la connexion
+WEBHOOK_READ_TIMEOUT = getattr(config, "WEBHOOK_READ_TIMEOUT", 10)          # Secondes pour recevoir la réponse
+WEBHOOK_RETRIES = getattr(config, "WEBHOOK_RETRIES", 2)                     # Nouvelles tentatives si la requête n'a pas abouti
+WEBHOOK_RETRY_BACKOFF = getattr(config, "WEBHOOK_RETRY_BACKOFF", 0.2)       # Base du backoff aléatoire (secondes)
+WEBHOOK_KEEPALIVE_INTERVAL = getattr(config, "WEBHOOK_KEEPALIVE_INTERVAL", 30)  # Préchauffage après inactivité (secondes)
+OUTBOX_MAX_ATTEMPTS = getattr(config, "OUTBOX_MAX_ATTEMPTS", 5)    # Tentatives d'envoi avant abandon d'un signal
+OUTBOX_RETRY_DELAY = getattr(config, "OUTBOX_RETRY_DELAY", 2)      # Délai de base entre deux tentatives (secondes)
+SIGNAL_TTL = getattr(config, "SIGNAL_TTL", 120)                    # Âge max d'un signal avant abandon (secondes)
+DISPLAY_MAX_FPS = getattr(config, "DISPLAY_MAX_FPS", 10)           # Fréquence max de rafraîchissement du terminal
+PERSIST_HISTORY = getattr(config, "PERSIST_HISTORY", False)        # Historiques d'événements et d'alertes conservés entre deux lancements
+LATENCY_SAMPLES = getattr(config, "LATENCY_SAMPLES", 500)          # Mesures conservées par étape pour les percentiles
+LATENCY_EXPORT = getattr(config, "LATENCY_EXPORT", "latency_stats.json")  # Export des percentiles (None pour désactiver)
+METRICS_PORT = getattr(config, "METRICS_PORT", None)               # Port HTTP de /metrics et /healthz (None pour désactiver)
+METRICS_HOST = getattr(config, "METRICS_HOST", "127.0.0.1")        # Adresse d'écoute du serveur de métriques
+HEALTH_GRACE = getattr(config, "HEALTH_GRACE", 60)                 # Marge au-delà du tick attendu avant /healthz en échec
+ASYNC_QUEUE_SIZE = getattr(config, "ASYNC_QUEUE_SIZE", 32)         # Capacité des files entre étapes du moteur async
+ALERT_PATTERNS = getattr(config, "ALERT_PATTERNS", {})             # Expressions régulières remplaçant celles par défaut
+DEDUP_WINDOW = getattr(config, "DEDUP_WINDOW", 10)                 # Fenêtre de dédoublonnage des signaux (secondes, 0 = désactivé)
+DEDUP_MAX_ENTRIES = getattr(config, "DEDUP_MAX_ENTRIES", 1024)     # Taille max du cache de dédoublonnage
+SIGNALS_PER_MINUTE = getattr(config, "SIGNALS_PER_MINUTE", None)   # Rafale max de signaux par minute (None = illimitée)
+SIDE_DAILY_LIMITS = getattr(config, "SIDE_DAILY_LIMITS", {})       # Budgets quotidiens par sens, ex. {"BUY": 10}
+SYMBOL_DAILY_LIMITS = getattr(config, "SYMBOL_DAILY_LIMITS", {})   # Budgets quotidiens par symbole ("*" = autres symboles)
+LIMIT_EXEMPT_SIDES = tuple(getattr(config, "LIMIT_EXEMPT_SIDES", ("SELL",)))  # Sens toujours autorisés au-delà des limites
+DISPATCH_TARGETS = getattr(config, "DISPATCH_TARGETS", None)       # Cibles d'envoi (None = le webhook WEBHOOK_URL_*)
+DISPATCH_QUORUM = getattr(config, "DISPATCH_QUORUM", "all")        # Cibles à atteindre pour valider un signal
+SMTP_SERVER = getattr(config, "SMTP_SERVER", "smtp.mail.me.com")   # Serveur d'envoi des emails d'alerte
+SMTP_PORT = getattr(config, "SMTP_PORT", 587)                      # 587 : STARTTLS ; 465 : SSL implicite
+SMTP_TIMEOUT = getattr(config, "SMTP_TIMEOUT", 10)                 # Timeout de chaque opération SMTP (secondes)
+SMTP_IDLE_TIMEOUT = getattr(config, "SMTP_IDLE_TIMEOUT", 60)       # Fermeture de la connexion SMTP inactive (secondes)
+ALERT_COOLDOWN = getattr(config, "ALERT_COOLDOWN", 300)            # Délai min entre deux alertes identiques (secondes)
+IMAP_TIMEOUT = getattr(config, "IMAP_TIMEOUT", 30)                 # Timeout des opérations IMAP, connexion comprise (secondes)
+IMAP_STANDBY = getattr(config, "IMAP_STANDBY", True)               # Connexion de secours ouverte en arrière-plan
+STANDBY_KEEPALIVE = getattr(config, "STANDBY_KEEPALIVE", 300)      # Intervalle initial des NOOP de la connexion de secours
+KEEPALIVE_MIN = getattr(config, "KEEPALIVE_MIN", 30)               # Plancher des intervalles de maintien adaptatifs
+KEEPALIVE_MAX = getattr(config, "KEEPALIVE_MAX", 900)              # Plafond de l'intervalle des NOOP de secours
+HTTP_INGEST_PORT = getattr(config, "HTTP_INGEST_PORT", None)       # Port d'écoute des alertes webhook TradingView (None = désactivé)
+HTTP_INGEST_HOST = getattr(config, "HTTP_INGEST_HOST", "127.0.0.1")  # Adresse d'écoute (derrière ngrok ou un reverse proxy)
+HTTP_INGEST_TOKEN = getattr(config, "HTTP_INGEST_TOKEN", None)     # Secret exigé sur chaque alerte (obligatoire)
+HTTP_INGEST_ALLOWED_IPS = getattr(config, "HTTP_INGEST_ALLOWED_IPS", None)  # Adresses sources autorisées (None = toutes)
+HTTP_INGEST_TRUSTED_PROXIES = getattr(config, "HTTP_INGEST_TRUSTED_PROXIES", 1)  # Proxys locaux de confiance devant l'écoute (ngrok = 1)
+HTTP_INGEST_MAX_BODY = getattr(config, "HTTP_INGEST_MAX_BODY", 16384)  # Taille max du corps d'une alerte (octets)
+CROSS_SOURCE_WINDOW = getattr(config, "CROSS_SOURCE_WINDOW", 600)  # Fenêtre de rapprochement email/HTTP d'une même alerte (secondes)
+SIGNAL_MAX_AGE = getattr(config, "SIGNAL_MAX_AGE", 300)            # Âge max d'un email (INTERNALDATE) traité en direct (secondes)
+STALE_SIGNAL_POLICY = getattr(config, "STALE_SIGNAL_POLICY", "skip")  # Emails plus vieux : "skip", "reconcile" ou "send"
+CATCHUP_THRESHOLD = getattr(config, "CATCHUP_THRESHOLD", 20)       # Nouveaux emails au-delà desquels l'arriéré part en rattrapage
+CONFIG_WATCH_INTERVAL = getattr(config, "CONFIG_WATCH_INTERVAL", 2)  # Vérification des modifications de config.py (secondes, None = SIGHUP seul)
+
+# Expéditeur des alertes TradingView
+TRADINGVIEW_SENDER = "noreply@tradingview.com"
 
 # Couleurs pour le terminal
 class Colors:
@@ -79,9 +163,13 @@ def parse_arguments():
                    f'  {Colors.GREEN}Mode Public :{Colors.ENDC}\n'
                    f'    python3 icloud-Webhook.py --mode public\n'
                    f'    → Utilise l\'URL NGROK configurée dans config.py\n'
-                   f'    → Pour un serveur distant ou accessible via Internet\n',
+                   f'    → Pour un serveur distant ou accessible via Internet\n\n'
+                   f'  {Colors.GREEN}Mode IDLE (push) :{Colors.ENDC}\n'
+                   f'    python3 icloud-Webhook.py --mode local --idle\n'
+                   f'    → Le serveur IMAP notifie l\'arrivée des emails (RFC 2177)\n'
+                   f'    → Retour automatique au polling si le serveur ne supporte pas IDLE\n',
         formatter_class=argparse.RawDescriptionHelpFormatter,
-        usage=f'{Colors.BOLD}%(prog)s{Colors.ENDC} --mode {Colors.BLUE}[local|public]{Colors.ENDC}'
+        usage=f'{Colors.BOLD}%(prog)s{Colors.ENDC} --mode {Colors.BLUE}[local|public]{Colors.ENDC} [--idle] [--engine thread|async] [--headless]'
     )
     
     parser.add_argument('--mode', 
@@ -91,8 +179,53 @@ def parse_arguments():
                       help=f'Mode de fonctionnement :\n\n'
                            f'  {Colors.GREEN}local{Colors.ENDC}  : Utilise le serveur webhook local (127.0.0.1:5001)\n'
                            f'  {Colors.GREEN}public{Colors.ENDC} : Utilise le serveur webhook distant (NGROK)\n')
-    
-    return parser.parse_args()
+
+    parser.add_argument('--idle',
+                      action='store_true',
+                      help=f'Utilise IMAP IDLE pour être notifié immédiatement des nouveaux emails\n'
+                           f'au lieu d\'interroger le serveur toutes les {CHECK_INTERVAL} secondes')
+
+    parser.add_argument('--engine',
+                      choices=['thread', 'async'],
+                      default='thread',
+                      help='Moteur de traitement :\n\n'
+                           f'  {Colors.GREEN}thread{Colors.ENDC} : boucle de surveillance unique, envoi dans un thread dédié (défaut)\n'
+                           f'  {Colors.GREEN}async{Colors.ENDC}  : étapes asyncio (ingestion IMAP, analyse, envoi) reliées par des files bornées\n')
+
+    parser.add_argument('--headless',
+                      action='store_true',
+                      help='Désactive l\'affichage et écrit une ligne JSON par événement sur la sortie standard\n'
+                           '(pour systemd, Docker ou tout environnement sans terminal interactif)')
+
+    parser.add_argument('--replay',
+                      metavar='ARCHIVE',
+                      help='Rejoue une archive mbox (fichier) ou Maildir (dossier) au lieu de surveiller iCloud :\n'
+                           'analyse, dédoublonnage, limites et envoi au webhook local (ou à --replay-sink)')
+
+    parser.add_argument('--replay-speed',
+                      type=float,
+                      default=0,
+                      metavar='X',
+                      help='Vitesse du rejeu : 0 = au plus vite (défaut), 1 = temps réel d\'après l\'en-tête Date,\n'
+                           '60 = une minute d\'archive par seconde')
+
+    parser.add_argument('--replay-sink',
+                      metavar='FICHIER',
+                      help='Enregistre les signaux rejoués dans un fichier JSON Lines au lieu de les envoyer')
+
+    parser.add_argument('--replay-workers',
+                      type=int,
+                      metavar='N',
+                      help='Processus d\'analyse des emails rejoués (défaut : nombre de cœurs)')
+
+    parser.add_argument('--replay-account',
+                      metavar='NOM',
+                      help='Compte dont l\'expéditeur, les limites et les cibles s\'appliquent au rejeu (défaut : le premier)')
+
+    args = parser.parse_args()
+    if args.replay and args.mode == 'public' and not args.replay_sink:
+        parser.error("le rejeu n'envoie qu'au webhook local (--mode local) ou dans un fichier (--replay-sink)")
+    return args
 
 def get_webhook_url(mode):
     if mode == 'local':
@@ -105,289 +238,1976 @@ HEADERS = {
     "X-WEBHOOK-TOKEN": WEBHOOK_TOKEN
 }
 
+class DispatchTarget:
+    """Destinataire des signaux : URL, token, timeouts, relances et modèle de charge utile propres
+
+    Le modèle (`payload`) est un objet JSON dont les chaînes "{champ}" sont remplacées par les
+    champs du signal (side, symbol, price, quantity, strategy, alert_time) ; une chaîne réduite
+    à "{champ}" garde le type de la valeur. Sans modèle, le signal est envoyé tel quel.
+    Le client HTTP (`client`) est attaché au démarrage, partagé entre cibles identiques.
+    """
+
+    _FIELD_RE = re.compile(r"\{(\w+)\}")
+
+    def __init__(self, name, mode, url=None, url_local=None, url_public=None, token=WEBHOOK_TOKEN,
+                 connect_timeout=WEBHOOK_CONNECT_TIMEOUT, read_timeout=WEBHOOK_READ_TIMEOUT,
+                 retries=WEBHOOK_RETRIES, retry_backoff=WEBHOOK_RETRY_BACKOFF, payload=None, required=True):
+        self.name = name
+        self.url = url or (url_local if mode == "local" else url_public)
+        # URL locale (url_local en mode local) : seule destination permise à un rejeu sans --replay-sink
+        self.local = not url and mode == "local"
+        if not self.url:
+            raise ValueError(f"Cible d'envoi sans URL pour le mode {mode} : {name}")
+        self.headers = dict(HEADERS, **{"X-WEBHOOK-TOKEN": token})
+        self.timeouts = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.template = payload
+        self.required = required
+        self.client = None
+
+    @property
+    def client_key(self):
+        return (self.url, self.headers["X-WEBHOOK-TOKEN"], self.timeouts, self.retries, self.retry_backoff)
+
+    def render(self, signal):
+        """Charge utile envoyée à cette cible pour le signal"""
+        return signal if self.template is None else self._fill(self.template, signal)
+
+    def _fill(self, value, signal):
+        if isinstance(value, dict):
+            return {key: self._fill(item, signal) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._fill(item, signal) for item in value]
+        if isinstance(value, str):
+            match = self._FIELD_RE.fullmatch(value)
+            if match:
+                return signal.get(match.group(1))
+            return self._FIELD_RE.sub(lambda m: str(signal.get(m.group(1), "")), value)
+        return value
+
+class Account:
+    """Boîte surveillée : connexion IMAP, filtre d'expéditeur, cibles d'envoi et limites de signaux propres
+
+    Les comptes partagent l'outbox et son thread d'envoi, le registre, les métriques et
+    l'affichage ; les clients webhook sont partagés entre cibles de même configuration.
+    """
+
+    QUORUMS = ("all", "any", "required")
+
+    def __init__(self, name, email, password, mode, imap_server=IMAP_SERVER, folder="INBOX",
+                 sender=TRADINGVIEW_SENDER, webhook_url_local=WEBHOOK_URL_LOCAL,
+                 webhook_url_public=WEBHOOK_URL_PUBLIC, webhook_token=WEBHOOK_TOKEN,
+                 max_daily_signals=MAX_DAILY_SIGNALS, signals_per_minute=SIGNALS_PER_MINUTE,
+                 side_daily_limits=SIDE_DAILY_LIMITS, symbol_daily_limits=SYMBOL_DAILY_LIMITS,
+                 targets=None, quorum=DISPATCH_QUORUM):
+        self.name = name
+        self.email = email
+        self.password = password
+        self.imap_server = imap_server
+        self.folder = folder
+        self.sender = sender
+        self.webhook_url = webhook_url_local if mode == "local" else webhook_url_public
+        self.max_daily_signals = max_daily_signals
+        self.signals_per_minute = signals_per_minute
+        self.side_daily_limits = side_daily_limits
+        self.symbol_daily_limits = symbol_daily_limits
+        # Sans liste de cibles, le webhook unique historique (WEBHOOK_URL_* et WEBHOOK_TOKEN)
+        entries = targets if targets is not None else DISPATCH_TARGETS
+        if not entries:
+            entries = [{"name": "webhook", "url_local": webhook_url_local, "url_public": webhook_url_public,
+                        "token": webhook_token}]
+        # Réglages globaux lus ici plutôt que figés dans la signature : un rechargement les applique
+        defaults = {"token": WEBHOOK_TOKEN, "connect_timeout": WEBHOOK_CONNECT_TIMEOUT, "read_timeout": WEBHOOK_READ_TIMEOUT,
+                    "retries": WEBHOOK_RETRIES, "retry_backoff": WEBHOOK_RETRY_BACKOFF}
+        self.targets = [DispatchTarget(mode=mode, **dict(defaults, **entry)) for entry in entries]
+        if len({target.name for target in self.targets}) != len(self.targets):
+            raise ValueError(f"Noms de cibles d'envoi en double pour le compte {name}")
+        if quorum not in self.QUORUMS and not (isinstance(quorum, int) and quorum > 0):
+            raise ValueError(f"Quorum d'envoi inconnu pour le compte {name} : {quorum!r}")
+        self.quorum = quorum
+        self.key = f"{email}/{folder}"  # Clé du filigrane, de l'outbox et du registre
+        self.signal_count = 0
+        self.last_queued_at = {}   # {symbole: dernier signal mis en outbox}, qui l'emporte sur un email plus ancien
+
+    def quorum_reached(self, delivered):
+        """Le signal est-il validé, sachant les noms des cibles qui en ont accusé réception ?
+
+        "all" : toutes les cibles ; "any" : au moins une ; "required" : toutes celles marquées
+        required ; un entier N : au moins N cibles.
+        """
+        if self.quorum == "any":
+            return bool(delivered)
+        if self.quorum == "required":
+            return all(target.name in delivered for target in self.targets if target.required)
+        if isinstance(self.quorum, int):
+            return len(delivered) >= min(self.quorum, len(self.targets))
+        return all(target.name in delivered for target in self.targets)
+
+def load_accounts(mode):
+    """Comptes à surveiller : liste ACCOUNTS de config.py, sinon le compte unique historique"""
+    entries = getattr(config, "ACCOUNTS", None) or [{"name": "principal", "email": EMAIL_ACCOUNT, "password": APP_PASSWORD}]
+    # Valeurs par défaut lues à l'appel (et non à la définition d'Account) : un rechargement les applique
+    defaults = {"imap_server": IMAP_SERVER, "webhook_url_local": WEBHOOK_URL_LOCAL, "webhook_url_public": WEBHOOK_URL_PUBLIC,
+                "webhook_token": WEBHOOK_TOKEN, "max_daily_signals": MAX_DAILY_SIGNALS,
+                "signals_per_minute": SIGNALS_PER_MINUTE, "side_daily_limits": SIDE_DAILY_LIMITS,
+                "symbol_daily_limits": SYMBOL_DAILY_LIMITS, "quorum": DISPATCH_QUORUM}
+    loaded = {}
+    for entry in entries:
+        entry = dict(entry)
+        account = Account(entry.pop("name", entry.get("email")), entry.pop("email"), entry.pop("password"), mode,
+                          **dict(defaults, **entry))
+        if account.key in loaded:
+            raise ValueError(f"Boîte surveillée deux fois dans ACCOUNTS : {account.key}")
+        loaded[account.key] = account
+    return loaded
+
+# Comptes surveillés, indexés par clé de boîte (renseigné au démarrage)
+accounts = {}
+
+def sync_signal_count():
+    """Recalcule le total des signaux du jour, tous comptes confondus (affichage)"""
+    global signal_count
+    signal_count = sum(account.signal_count for account in accounts.values())
+
+class WebhookClient:
+    """Client webhook persistant : connexions keep-alive en pool, préchauffage et timeouts explicites
+
+    La poignée de main TCP+TLS vers le webhook (tunnel NGROK en mode public) est faite au
+    démarrage puis entretenue en arrière-plan, pour ne plus la payer au moment du signal.
+    """
+
+    # Codes renvoyés quand la requête n'a pas atteint le bot (tunnel ou proxy indisponible).
+    # 504 n'en fait pas partie : la passerelle a transmis la requête et l'ordre a pu s'exécuter.
+    RETRY_STATUS = (502, 503)
+
+    def __init__(self, url, headers, connect_timeout=WEBHOOK_CONNECT_TIMEOUT, read_timeout=WEBHOOK_READ_TIMEOUT,
+                 retries=WEBHOOK_RETRIES, retry_backoff=WEBHOOK_RETRY_BACKOFF):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        # Importé au premier client (~40 ms) : la connexion IMAP s'ouvre pendant ce temps
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.last_used = 0.0
+        self._stop = threading.Event()
+
+    def warm(self):
+        """Ouvre (ou rafraîchit) une connexion vers le webhook sans envoyer de signal"""
+        import requests
+        try:
+            self.session.head(self.url, timeout=self.timeout, allow_redirects=False)
+            self.last_used = time.monotonic()
+            return True
+        except requests.exceptions.RequestException:
+            return False
+
+    def start_keepalive(self):
+        """Préchauffe la connexion puis la maintient ouverte après chaque période d'inactivité"""
+        def keepalive():
+            self.warm()
+            while not self._stop.wait(WEBHOOK_KEEPALIVE_INTERVAL):
+                if time.monotonic() - self.last_used >= WEBHOOK_KEEPALIVE_INTERVAL:
+                    self.warm()
+        threading.Thread(target=keepalive, name="webhook-keepalive", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.session.close()
+
+    @staticmethod
+    def never_sent(error):
+        """L'erreur de connexion est-elle survenue avant que la requête ne parte ?"""
+        import requests
+        from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+        if isinstance(error, (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError)):
+            return True
+        # MaxRetryError de urllib3 : sa raison dit si la connexion a seulement pu s'ouvrir
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+    def post(self, payload, headers=None):
+        """Envoie le signal avec les timeouts configurés
+
+        Les nouvelles tentatives (backoff exponentiel aléatoire) ne concernent que les échecs
+        où le bot n'a pas pu recevoir la requête : connexion impossible à établir ou 502/503.
+        Un timeout de lecture, un 504 ou une connexion coupée après l'envoi ne sont jamais
+        relancés pour ne pas exécuter deux fois un ordre.
+        """
+        import requests
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, headers=headers, timeout=self.timeout)
+            except requests.exceptions.ConnectionError as e:
+                if attempt >= self.retries or not self.never_sent(e):
+                    raise
+            else:
+                self.last_used = time.monotonic()
+                if response.status_code not in self.RETRY_STATUS or attempt >= self.retries:
+                    return response
+            time.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+
+class OutboxWorker:
+    """Thread d'envoi des signaux de l'outbox vers les cibles de chaque compte
+
+    La détection IMAP ne fait qu'inscrire les signaux dans l'outbox ; ce thread les envoie
+    avec un nombre de tentatives borné et abandonne ceux devenus trop vieux (SIGNAL_TTL)
+    plutôt que d'exécuter un ordre périmé. Les cibles d'un compte reçoivent le signal en
+    parallèle : le délai ajouté est celui de la cible la plus lente, pas leur somme.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        # Créé à la première diffusion vers plusieurs cibles, agrandi si un rechargement en ajoute
+        self._pool, self._pool_size = None, 0
+        self._thread = None
+
+    def recover(self):
+        """Traite les envois interrompus par un arrêt brutal
+
+        Une entrée restée in_flight a pu atteindre le bot : comme une réponse ambiguë, elle part
+        en dead-letter sans renvoi, garde sa place dans les budgets et fait l'objet d'un email
+        de vérification.
+        """
+        db = get_state_db()
+        error = "envoi interrompu par l'arrêt du moniteur"
+        with _state_lock:
+            rows = db.execute("""SELECT id, mailbox, uid, side, attempts, created_at, delivered_targets
+                                 FROM outbox WHERE state = 'in_flight'""").fetchall()
+        for entry_id, mailbox, uid, side, attempts, created_at, delivered_targets in rows:
+            finish_outbox_entry(entry_id, "dead", error)
+            account = accounts.get(mailbox)
+            record_signal(mailbox, uid, side, datetime.fromtimestamp(created_at, timezone.utc), error, False)
+            metrics.inc("signals_dead_total", reason="ambiguous")
+            log_event("dead_letter", level=logging.ERROR, side=side, uid=uid, mailbox=mailbox, reason="ambiguous",
+                      attempts=attempts, error=error, delivered_targets=json.loads(delivered_targets or "[]"))
+            report_unconfirmed_signal(account.name if account else mailbox, side, uid, error)
+            update_display(self.mode, account.webhook_url if account else None, signal_count,
+                           error=f"[☠️] {get_current_time()} Signal {side} non confirmé, à vérifier sans renvoi : {error}")
+
+    def start(self):
+        self.recover()
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+        self._thread.start()
+
+    def notify(self):
+        """Réveille le thread après l'ajout d'un signal"""
+        self._wake.set()
+
+    def stop(self):
+        """Arrête le thread d'envoi après l'envoi en cours : un ordre n'est pas coupé en plein POST"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pool:
+            self._pool.shutdown(wait=False)
+
+    def deliver_next(self):
+        """Envoie le prochain signal prêt ; retourne 0 si un signal a été traité, sinon le délai
+        avant la prochaine échéance (None si l'outbox est vide)"""
+        entry, wait = claim_outbox_entry()
+        if entry is not None:
+            self._deliver(*entry)
+        return wait
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                wait = self.deliver_next()
+            except Exception as e:
+                update_display(self.mode, None, signal_count,
+                               error=f"[❌] {get_current_time()} Erreur de l'outbox : {e}")
+                # Même pause que le moteur asynchrone : une base indisponible ne fait pas tourner la boucle à vide
+                self._wake.wait(OUTBOX_RETRY_DELAY)
+                self._wake.clear()
+                continue
+            if wait != 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+
+    def _dispatch_pool(self, size):
+        """Pool d'envoi d'au moins `size` threads (une cible unique est servie directement)"""
+        if size > self._pool_size:
+            previous, self._pool = self._pool, ThreadPoolExecutor(max_workers=size, thread_name_prefix="dispatch")
+            self._pool_size = size
+            if previous is not None:
+                previous.shutdown(wait=False)
+        return self._pool
+
+    def _post(self, target, signal, key):
+        """Envoie le signal à une cible ; retourne (erreur ou None, issue de la requête, nature de l'échec)
+
+        Nature de l'échec : "retry" si le bot n'a pas pu recevoir la requête (seul cas renvoyé
+        plus tard), "ambiguous" s'il a pu exécuter l'ordre sans que la réponse n'arrive (timeout
+        de lecture, 5xx hors 502/503, connexion coupée après l'envoi), "rejected" s'il l'a refusée.
+        """
+        import requests
+        started = time.perf_counter()
+        try:
+            body = target.render(signal)
+        except Exception as e:
+            # Modèle de charge utile inapplicable : rien n'est parti, un nouvel essai échouerait de même
+            return f"charge utile impossible à construire : {e}", "render_error", "rejected"
+        try:
+            response = target.client.post(body, headers={"X-Idempotency-Key": key})
+        except requests.exceptions.ConnectionError as e:
+            if WebhookClient.never_sent(e):
+                error, outcome, failure = f"impossible de se connecter au serveur webhook {target.url}", "connection_error", "retry"
+            else:
+                error, outcome, failure = f"connexion au serveur webhook {target.url} coupée après l'envoi", "connection_lost", "ambiguous"
+        except requests.exceptions.Timeout:
+            error, outcome, failure = f"pas de réponse du serveur webhook après {target.timeouts[1]}s", "timeout", "ambiguous"
+        except (requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError,
+                requests.exceptions.TooManyRedirects) as e:
+            # Réponse reçue mais illisible, ou redirections en boucle : le bot a pu exécuter l'ordre
+            error, outcome, failure = f"réponse invalide du serveur webhook : {e}", "invalid_response", "ambiguous"
+        except requests.exceptions.RequestException as e:
+            # URL, schéma ou en-tête invalide : la requête n'a pas pu partir
+            error, outcome, failure = f"requête webhook invalide : {e}", "request_error", "rejected"
+        except Exception as e:
+            # Erreur inattendue : impossible de savoir si la requête est partie, elle n'est pas renvoyée
+            error, outcome, failure = f"erreur inattendue lors de l'envoi : {e!r}", "error", "ambiguous"
+        else:
+            status = response.status_code
+            outcome = str(status)
+            if status == 200:
+                error, failure = None, None
+            else:
+                error = f"code {status} : {response.text}"
+                failure = ("retry" if status in WebhookClient.RETRY_STATUS
+                           else "rejected" if 300 <= status < 500 else "ambiguous")
+        metrics.observe("webhook_request_duration_seconds", time.perf_counter() - started,
+                        outcome=outcome, target=target.name)
+        return error, outcome, failure
+
+    def _deliver(self, entry_id, key, mailbox, uid, side, payload, attempts, created_at, delivered_targets):
+        detected_at = datetime.fromtimestamp(created_at, timezone.utc)
+        age = time.time() - created_at
+        signal = json.loads(payload)
+        account = accounts.get(mailbox)
+        delivered = set(json.loads(delivered_targets or "[]"))
+        if account is None:
+            # Compte retiré de la configuration : aucune cible sûre vers laquelle envoyer
+            finish_outbox_entry(entry_id, "dead", "Compte inconnu")
+            limiter.release(mailbox, signal, created_at)
+            record_signal(mailbox, uid, side, detected_at, "compte inconnu", False)
+            latency.discard(key)
+            metrics.inc("signals_dead_total", reason="unknown_account")
+            log_event("dead_letter", level=logging.ERROR, side=side, uid=uid, mailbox=mailbox, reason="unknown_account")
+            return
+        if age > SIGNAL_TTL:
+            finish_outbox_entry(entry_id, "dead", f"Signal périmé ({age:.0f}s)")
+            # Un signal déjà reçu par une cible a pu être exécuté : il garde sa place dans les budgets
+            if not delivered:
+                limiter.release(mailbox, signal, created_at)
+            latency.discard(key)
+            metrics.inc("signals_dead_total", reason="expired")
+            record_signal(mailbox, uid, side, detected_at, "expiré", False)
+            log_event("dead_letter", level=logging.WARNING, side=side, uid=uid, mailbox=mailbox,
+                      reason="expired", age=round(age, 1), delivered_targets=sorted(delivered))
+            update_display(self.mode, account.webhook_url, signal_count,
+                           error=f"[⌛] {get_current_time()} Signal {side} abandonné : reçu il y a {age:.0f}s (max {SIGNAL_TTL}s)")
+            if uid is not None:
+                wake_idle(mailbox)
+            return
+
+        # Seules les cibles n'ayant pas encore accusé réception reçoivent le signal
+        pending = [target for target in account.targets if target.name not in delivered]
+        latency.mark(key, "webhook_start")
+        if len(pending) > 1:
+            results = list(self._dispatch_pool(len(pending)).map(lambda target: self._post(target, signal, key), pending))
+        else:
+            results = [self._post(target, signal, key) for target in pending]
+        failures = {}
+        kinds = set()
+        for target, (target_error, _, failure) in zip(pending, results):
+            if target_error is None:
+                delivered.add(target.name)
+            else:
+                failures[target.name] = target_error
+                kinds.add(failure)
+        if len(account.targets) > 1:
+            webhook_result = ", ".join(f"{target.name}={outcome}" for target, (_, outcome, _) in zip(pending, results))
+            error = "; ".join(f"{name} : {target_error}" for name, target_error in failures.items()) or None
+        else:
+            webhook_result = results[0][1]
+            error = failures.get(account.targets[0].name)
+
+        if account.quorum_reached(delivered):
+            latency.mark(key, "webhook_ack")
+            finish_outbox_entry(entry_id, "delivered", error, delivered_targets=delivered)
+            if uid is not None:
+                wake_idle(mailbox)
+            record_signal(mailbox, uid, side, detected_at, webhook_result, True)
+            account.signal_count += 1
+            sync_signal_count()
+            metrics.inc("signals_dispatched_total", side=side, account=account.name)
+            log_event("dispatched", side=side, uid=uid, mailbox=mailbox, status=webhook_result,
+                      attempts=attempts, signal_count=account.signal_count, targets=sorted(delivered))
+            if failures:
+                # Quorum atteint : les cibles restantes ne sont plus relancées
+                for name in failures:
+                    metrics.inc("dispatch_target_abandoned_total", target=name, account=account.name)
+                log_event("targets_abandoned", level=logging.WARNING, side=side, uid=uid, mailbox=mailbox,
+                          errors=failures)
+            add_to_signal_history(side, account=account.name, uid=uid)  # Ajouter le signal à l'historique
+            spans = latency.finish(key)
+            update_display(self.mode, account.webhook_url, signal_count,
+                           last_event=f"[🚀] {get_current_time()} Signal {side} envoyé avec succès"
+                                      + (f" ({len(delivered)}/{len(account.targets)} cibles)" if len(account.targets) > 1 else ""))
+            if spans:
+                for stage, duration in spans.items():
+                    metrics.observe("signal_stage_duration_seconds", max(0.0, duration / 1000), stage=stage)
+                log_event("latency", side=side, uid=uid, mailbox=mailbox, **spans)
+                try:
+                    latency.export()
+                except OSError as e:
+                    update_display(self.mode, account.webhook_url, signal_count,
+                                   error=f"[❌] {get_current_time()} Export des latences impossible : {e}")
+        elif kinds - {"retry"} or attempts >= OUTBOX_MAX_ATTEMPTS:
+            # Un ordre n'est renvoyé que si aucune cible n'a pu le recevoir : réponse ambiguë
+            # ou refus du bot vont directement en dead-letter
+            reason = "ambiguous" if "ambiguous" in kinds else "rejected" if "rejected" in kinds else "max_attempts"
+            finish_outbox_entry(entry_id, "dead", error, delivered_targets=delivered)
+            if uid is not None:
+                wake_idle(mailbox)
+            # Un ordre peut-être exécuté garde sa place dans les budgets
+            if not delivered and reason != "ambiguous":
+                limiter.release(mailbox, signal, created_at)
+            latency.discard(key)
+            metrics.inc("signals_dead_total", reason=reason)
+            record_signal(mailbox, uid, side, detected_at, error, False)
+            log_event("dead_letter", level=logging.ERROR, side=side, uid=uid, mailbox=mailbox,
+                      reason=reason, attempts=attempts, error=error, delivered_targets=sorted(delivered))
+            if reason == "ambiguous":
+                report_unconfirmed_signal(account.name, side, uid, error)
+                message = f"Signal {side} non confirmé, à vérifier sans renvoi : {error}"
+            elif reason == "rejected":
+                message = f"Signal {side} refusé : {error}"
+            else:
+                message = f"Signal {side} abandonné après {attempts} tentatives : {error}"
+            update_display(self.mode, account.webhook_url, signal_count,
+                           error=f"[☠️] {get_current_time()} {message}")
+        else:
+            retry_in = random.uniform(0.5, 1.5) * OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+            finish_outbox_entry(entry_id, "queued", error, retry_in, delivered_targets=delivered)
+            log_event("dispatch_failed", level=logging.WARNING, side=side, uid=uid, mailbox=mailbox,
+                      attempts=attempts, retry_in=round(retry_in, 2), error=error, delivered_targets=sorted(delivered))
+            update_display(self.mode, account.webhook_url, signal_count,
+                           error=f"[❌] {get_current_time()} Erreur lors de l'envoi ({error}), nouvelle tentative dans {retry_in:.1f}s")
+
+class LatencyRecorder:
+    """Chronométrage de chaque signal, de l'envoi de l'email par TradingView à la réponse du webhook
+
+    Les jalons (epoch en secondes) sont posés au fil du traitement, sous la clé d'idempotence
+    du signal : sent (en-tête Date), internaldate (réception par le serveur IMAP), detected,
+    fetched, parsed, webhook_start et webhook_ack. À l'acquittement, les durées de chaque
+    étape sont ajoutées à des fenêtres glissantes dont on tire p50/p95/p99. L'en-tête Date et
+    INTERNALDATE sont à la seconde près : les deux premières étapes sont donc approximatives.
+    """
+
+    SEGMENTS = (
+        ("email", "sent", "internaldate"),          # TradingView → serveur iCloud
+        ("détection", "internaldate", "detected"),  # Push IDLE / polling + SEARCH
+        ("fetch", "detected", "fetched"),
+        ("analyse", "fetched", "parsed"),
+        ("outbox", "parsed", "webhook_start"),
+        ("webhook", "webhook_start", "webhook_ack"),
+        ("total", "sent", "webhook_ack"),
+    )
+    MAX_PENDING = 1000
+
+    def __init__(self, max_samples, export_path=None):
+        self.export_path = export_path
+        self.count = 0
+        self._pending = {}
+        self._samples = {name: deque(maxlen=max_samples) for name, _, _ in self.SEGMENTS}
+        self._recent = deque(maxlen=20)
+        self._lock = threading.Lock()
+
+    def begin(self, key, **marks):
+        """Ouvre le chronométrage d'un signal avec les jalons déjà connus"""
+        with self._lock:
+            if len(self._pending) >= self.MAX_PENDING:
+                self._pending.pop(next(iter(self._pending)))
+            self._pending[key] = {name: moment for name, moment in marks.items() if moment is not None}
+
+    def mark(self, key, name, moment=None):
+        """Pose un jalon ; sans effet pour un signal non chronométré (ex. repris après redémarrage)"""
+        with self._lock:
+            marks = self._pending.get(key)
+            if marks is not None:
+                marks[name] = moment or time.time()
+
+    def discard(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def finish(self, key):
+        """Clôt le chronométrage d'un signal et retourne la durée de chaque étape (ms)"""
+        with self._lock:
+            marks = self._pending.pop(key, None)
+            if marks is None:
+                return None
+            spans = {name: round((marks[end] - marks[start]) * 1000, 1)
+                     for name, start, end in self.SEGMENTS if start in marks and end in marks}
+            for name, value in spans.items():
+                self._samples[name].append(value)
+            self._recent.append({"key": key, "at": marks.get("webhook_ack"), **spans})
+            self.count += 1
+        return spans
+
+    def percentiles(self):
+        """{étape: (nombre de mesures, p50, p95, p99)} pour les étapes mesurées au moins une fois"""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items() if values}
+        stats = {}
+        for name, values in samples.items():
+            rank = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            stats[name] = (len(values), rank(0.50), rank(0.95), rank(0.99))
+        return stats
+
+    def export(self):
+        """Écrit les percentiles et les dernières mesures dans le fichier d'export (remplacement atomique)"""
+        if not self.export_path:
+            return
+        with self._lock:
+            recent = list(self._recent)
+        report = {
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "signals": self.count,
+            "unit": "ms",
+            "segments": {name: {"count": n, "p50": p50, "p95": p95, "p99": p99}
+                         for name, (n, p50, p95, p99) in self.percentiles().items()},
+            "recent": recent,
+        }
+        tmp_path = self.export_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.export_path)
+
+latency = LatencyRecorder(LATENCY_SAMPLES, os.path.join(SCRIPT_DIR, LATENCY_EXPORT) if LATENCY_EXPORT else None)
+
+class Metrics:
+    """Compteurs et histogrammes exposés au format texte Prometheus
+
+    Les mises à jour ne font qu'incrémenter des valeurs en mémoire sous un verrou ; le
+    rendu est fait par le thread du serveur HTTP, à la demande du scraper.
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    # Histogrammes dont les valeurs se comptent en fractions de milliseconde
+    FINE_BUCKETS = {"http_ingest_duration_seconds": (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)}
+    HELP = {
+        "signals_detected_total": "Signaux BUY/SELL trouvés dans les emails et les alertes HTTP",
+        "signals_dispatched_total": "Signaux acquittés par le webhook",
+        "signals_dead_total": "Signaux abandonnés par l'outbox",
+        "signals_coalesced_total": "Signaux dédoublonnés ou annulés par un signal récent, par décision (duplicate, opposite, cross_source)",
+        "dispatch_target_abandoned_total": "Cibles d'envoi abandonnées une fois le quorum atteint",
+        "signal_limit_hits_total": "Signaux refusés ou autorisés au-delà de la limite quotidienne",
+        "imap_reconnects_total": "Reconnexions IMAP après une erreur",
+        "imap_ticks_total": "Vérifications de la boîte terminées",
+        "imap_command_duration_seconds": "Durée des commandes IMAP",
+        "imap_tls_handshakes_total": "Négociations TLS IMAP, complètes ou reprises (resumed)",
+        "imap_standby_lost_total": "Connexions de secours perdues entre deux sondes",
+        "imap_reconnect_duration_seconds": "Durée entre la perte de la connexion IMAP et la reprise de la surveillance",
+        "webhook_request_duration_seconds": "Durée des requêtes webhook (relances comprises)",
+        "signal_stage_duration_seconds": "Durée de chaque étape d'un signal (voir LatencyRecorder)",
+        "http_alerts_total": "Alertes reçues par l'écoute HTTP, par issue",
+        "signals_rejected_total": "Signaux refusés faute de pouvoir lire une valeur sans ambiguïté (ex. prix « 1234,567 »)",
+        "alert_emails_total": "Emails d'alerte, par issue (sent, failed, coalesced, dropped)",
+        "config_reloads_total": "Rechargements de config.py (applied, failed)",
+        "catchup_emails_total": "Emails d'arriéré traités par le rattrapage en arrière-plan",
+        "stale_signals_total": "Signaux d'emails reçus depuis plus de SIGNAL_MAX_AGE, ignorés, rapprochés ou remplacés",
+        "http_ingest_duration_seconds": "Traitement d'une alerte HTTP, de la requête à la réponse",
+    }
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.last_ticks = {}     # {clé de boîte: instant de la dernière vérification réussie}
+        self.max_tick_ages = {}  # {clé de boîte: âge max toléré du dernier tick}
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def total(self, name, **labels):
+        """Somme d'un compteur sur toutes ses séries portant (au moins) les labels donnés"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(value for (counter, series), value in self._counters.items()
+                       if counter == name and wanted <= set(series))
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.FINE_BUCKETS.get(name, self.BUCKETS)), 0.0, 0]
+            for i, bound in enumerate(self.FINE_BUCKETS.get(name, self.BUCKETS)):
+                if value <= bound:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def watch(self, mailbox, max_tick_age):
+        """Déclare (ou met à jour) l'âge max toléré entre deux vérifications d'une boîte"""
+        self.max_tick_ages[mailbox] = max_tick_age
+
+    def tick(self, mailbox):
+        """Signale une vérification de la boîte terminée (battement de cœur de /healthz)"""
+        self.last_ticks[mailbox] = time.time()
+        self.inc("imap_ticks_total", account=accounts[mailbox].name if mailbox in accounts else mailbox)
+
+    def health(self):
+        """Retourne (sain, détail) : une boucle IMAP est bloquée si sa boîte n'a pas eu de tick à temps"""
+        now = time.time()
+        detail = {}
+        for mailbox, max_age in self.max_tick_ages.items():
+            last_tick = self.last_ticks.get(mailbox)
+            age = now - (last_tick or self.started_at)
+            detail[mailbox] = {"status": "ok" if age <= max_age else "stalled",
+                               "last_tick_age": round(age, 1) if last_tick else None,
+                               "max_tick_age": max_age}
+        healthy = all(box["status"] == "ok" for box in detail.values())
+        return healthy, {"status": "ok" if healthy else "stalled", "mailboxes": detail}
+
+    def render(self):
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(b), total, n)) for key, (b, total, n) in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP tradingview_{name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE tradingview_{name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name, "counter")
+            lines.append(f"tradingview_{name}{fmt(labels)} {value}")
+        for (name, labels), (buckets, total, n) in histograms:
+            describe(name, "histogram")
+            for bound, count in zip(self.FINE_BUCKETS.get(name, self.BUCKETS), buckets):
+                lines.append(f"tradingview_{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+            lines.append(f"tradingview_{name}_bucket{fmt(labels, [('le', '+Inf')])} {n}")
+            lines.append(f"tradingview_{name}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"tradingview_{name}_count{fmt(labels)} {n}")
+
+        now = time.time()
+        per_account = {name: [] for name in ("signals_today", "signals_max_daily", "signals_headroom",
+                                             "outbox_pending", "last_tick_age_seconds")}
+        for account in list(accounts.values()):
+            pending = count_pending_signals(account.key)
+            last_tick = self.last_ticks.get(account.key)
+            label = fmt([("account", account.name)])
+            per_account["signals_today"].append((label, account.signal_count))
+            per_account["signals_max_daily"].append((label, account.max_daily_signals))
+            per_account["signals_headroom"].append((label, max(0, account.max_daily_signals - limiter.used(account.key))))
+            per_account["outbox_pending"].append((label, pending))
+            per_account["last_tick_age_seconds"].append((label, round(now - last_tick, 3) if last_tick else -1))
+        gauges = [
+            ("signals_today", "Signaux envoyés aujourd'hui"),
+            ("signals_max_daily", "Limite quotidienne de signaux"),
+            ("signals_headroom", "Signaux encore autorisés aujourd'hui (outbox comprise)"),
+            ("outbox_pending", "Signaux en attente dans l'outbox"),
+            ("last_tick_age_seconds", "Secondes depuis la dernière vérification réussie de la boîte"),
+        ]
+        for name, help_text in gauges:
+            lines += [f"# HELP tradingview_{name} {help_text}", f"# TYPE tradingview_{name} gauge"]
+            lines += [f"tradingview_{name}{label} {value}" for label, value in per_account[name]]
+        lines += ["# HELP tradingview_last_signal_timestamp_seconds Heure (epoch) du dernier signal envoyé, par sens",
+                  "# TYPE tradingview_last_signal_timestamp_seconds gauge"]
+        for side in ("BUY", "SELL"):
+            last = events.query("signal", side=side, limit=1)
+            if last:
+                lines.append(f'tradingview_last_signal_timestamp_seconds{{side="{side}"}} {events.epoch(last[0]):.3f}')
+        lines += ["# HELP tradingview_healthy 1 si toutes les boucles IMAP sont actives", "# TYPE tradingview_healthy gauge",
+                  f"tradingview_healthy {int(self.health()[0])}"]
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Sert /metrics (format Prometheus) et /healthz (200 ou 503 si la boucle IMAP est bloquée)"""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            status, content_type = 200, "text/plain; version=0.0.4; charset=utf-8"
+            body = metrics.render().encode()
+        elif self.path == "/healthz":
+            healthy, detail = metrics.health()
+            status, content_type = (200 if healthy else 503), "application/json"
+            body = json.dumps(detail).encode()
+        else:
+            status, content_type, body = 404, "text/plain", b"Not found\n"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Pas de journal d'accès : le scraping ne doit pas polluer l'affichage
+
+def start_metrics_server(host, port):
+    """Lance le serveur de métriques dans un thread en arrière-plan"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
 # Sécurité : compteur de signaux
 signal_count = 0
-last_signal_date = datetime.now(timezone.utc).date()
 
 # Historique des messages et des signaux
-message_history = []      # Pour les événements relatifs aux signaux
-alert_history = []       # Pour les alertes et erreurs
-signal_history = []      # Historique des signaux BUY/SELL
-
-def get_current_datetime():
-    """Retourne la date et l'heure au format JJ/MM/YYYY HH:MM:SS"""
-    return datetime.now(ZoneInfo("Europe/Paris")).strftime("%d/%m/%Y %H:%M:%S")
+PARIS_TZ = ZoneInfo("Europe/Paris")
+# Décalage entre l'horloge monotone des historiques et l'heure réelle, fixé au démarrage
+EPOCH_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+
+@lru_cache(maxsize=256)
+def format_paris_time(second, fmt="%d/%m/%Y %H:%M:%S"):
+    """Formate un instant (secondes entières) à l'heure de Paris ; une chaîne par seconde, mise en cache"""
+    return datetime.fromtimestamp(second, PARIS_TZ).strftime(fmt)
+
+HistoryRecord = namedtuple("HistoryRecord", "ns side uid account text")
+
+class EventStore:
+    """Historiques du tableau de bord : un tampon circulaire de capacité fixe par type
+
+    Types : "event" (événements relatifs aux signaux), "alert" (alertes et erreurs) et
+    "signal" (signaux BUY/SELL envoyés). Un enregistrement est un simple tuple
+    (horloge monotone en ns, sens, UID, compte, texte) : l'ajout ne coûte qu'un appel
+    d'horloge et un append, sans verrou ni formatage. Les dates et libellés ne sont
+    produits qu'à l'affichage.
+    """
+
+    PERSISTED = ("event", "alert")  # Les signaux sont rechargés depuis le registre
+
+    def __init__(self, capacities):
+        self._buffers = {kind: deque(maxlen=capacity) for kind, capacity in capacities.items()}
+
+    def record(self, kind, text=None, side=None, uid=None, account=None, ns=None):
+        """Ajoute un enregistrement ; le plus ancien est écrasé une fois la capacité atteinte"""
+        self._buffers[kind].append((time.monotonic_ns() if ns is None else ns, side, uid, account, text))
+
+    def capacity(self, kind):
+        return self._buffers[kind].maxlen
+
+    def count(self, kind):
+        return len(self._buffers[kind])
+
+    def clear(self, kind):
+        self._buffers[kind].clear()
+
+    def query(self, kind, side=None, account=None, since=None, limit=None):
+        """Enregistrements du plus récent au plus ancien, filtrés par sens, compte ou ancienneté (epoch)"""
+        records = list(self._buffers[kind])  # Copie atomique sous le GIL, sans bloquer les écrivains
+        since_ns = None if since is None else int(since * 1e9) - EPOCH_OFFSET_NS
+        result = []
+        for record in reversed(records):
+            if since_ns is not None and record[0] < since_ns:
+                break
+            if (side is not None and record[1] != side) or (account is not None and record[3] != account):
+                continue
+            result.append(HistoryRecord._make(record))
+            if limit and len(result) >= limit:
+                break
+        return result
+
+    @staticmethod
+    def epoch(record):
+        """Heure réelle (epoch, secondes) d'un enregistrement"""
+        return (record.ns + EPOCH_OFFSET_NS) / 1e9
+
+    def save(self):
+        """Enregistre les événements et alertes dans la base d'état (à l'arrêt)"""
+        rows = [(kind, ns + EPOCH_OFFSET_NS, side, uid, account, text)
+                for kind in self.PERSISTED for ns, side, uid, account, text in list(self._buffers[kind])]
+        db = get_state_db()
+        with _state_lock:
+            db.execute("BEGIN")
+            db.execute("DELETE FROM history")
+            db.executemany("INSERT INTO history (kind, at_ns, side, uid, account, text) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            db.execute("COMMIT")
+
+    def load(self):
+        """Recharge les événements et alertes enregistrés lors de l'exécution précédente"""
+        db = get_state_db()
+        with _state_lock:
+            rows = db.execute("SELECT kind, at_ns, side, uid, account, text FROM history ORDER BY at_ns").fetchall()
+        for kind, at_ns, side, uid, account, text in rows:
+            if kind in self.PERSISTED:
+                self.record(kind, text, side, uid, account, ns=at_ns - EPOCH_OFFSET_NS)
+
+events = EventStore({"event": MAX_EVENT_HISTORY, "alert": MAX_ALERT_HISTORY, "signal": MAX_SIGNAL_HISTORY})
 
 def add_to_history(message, is_alert=False):
-    """Ajoute un message à l'historique avec la date et l'heure"""
-    global message_history, alert_history
-    
-    # Extraire l'icône si elle existe (format [emoji])
+    """Ajoute un message à l'historique (la date est ajoutée à l'affichage)"""
+    events.record("alert" if is_alert else "event", message)
+
+def add_to_signal_history(signal_type, timestamp=None, account=None, uid=None):
+    """Ajoute un signal à l'historique ; `timestamp` (epoch) vaut par défaut l'instant présent"""
+    ns = None if timestamp is None else int(timestamp * 1e9) - EPOCH_OFFSET_NS
+    events.record("signal", side=signal_type, uid=uid, account=account, ns=ns)
+
+@lru_cache(maxsize=512)
+def format_history_line(ns, text):
+    """Ligne d'historique « [date] icône message », l'horodatage éventuel du message étant retiré"""
     icon = ""
-    if message.startswith('[') and ']' in message:
-        icon_end = message.find(']') + 1
-        icon = message[:icon_end]
-        message = message[icon_end:].strip()
-        
+    if text.startswith('[') and ']' in text:
+        icon_end = text.find(']') + 1
+        icon = text[:icon_end]
+        text = text[icon_end:].strip()
+
         # Si le message contient un timestamp après l'icône, on le supprime
-        if message.startswith('[') and ']' in message:
-            message = message.split('] ', 1)[1]
-    
-    # Ajouter le timestamp complet au début, suivi de l'icône si elle existe
-    message_with_date = f"[{get_current_datetime()}] {icon} {message}" if icon else f"[{get_current_datetime()}] {message}"
-    
-    if is_alert:
-        alert_history.append(message_with_date)
-        if len(alert_history) > MAX_ALERT_HISTORY:
-            alert_history.pop(0)
+        if text.startswith('[') and ']' in text:
+            text = text.split('] ', 1)[1]
+    date = format_paris_time((ns + EPOCH_OFFSET_NS) // 1_000_000_000)
+    return f"[{date}] {icon} {text}" if icon else f"[{date}] {text}"
+
+def format_signal_line(record):
+    """Ligne d'historique d'un signal : date, emoji vert pour BUY, rouge pour SELL, compte s'il y en a plusieurs"""
+    emoji = "🟢" if record.side == "BUY" else "🔴"
+    line = f"[{format_paris_time((record.ns + EPOCH_OFFSET_NS) // 1_000_000_000)}] {emoji} {record.side}"
+    if record.account and len(accounts) > 1:
+        line += f" ({record.account})"
+    return line
+
+# Analyse des réponses IMAP (atomes, chaînes, NIL, listes et littéraux)
+_IMAP_TOKEN_RE = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()\[]+(?:\[[^\]]*\][^\s()]*)?')
+
+def parse_imap_response(data):
+    """Transforme une réponse imaplib (octets et tuples de littéraux) en listes imbriquées"""
+    stack = [[]]
+    for item in data:
+        head, literal = (item[0], item[1]) if isinstance(item, tuple) else (item, None)
+        if not isinstance(head, bytes):
+            continue
+        for token in _IMAP_TOKEN_RE.findall(head):
+            if token == b"(":
+                stack.append([])
+            elif token == b")":
+                if len(stack) > 1:
+                    closed = stack.pop()
+                    stack[-1].append(closed)
+            elif token.startswith(b"{") and token.endswith(b"}"):
+                stack[-1].append(literal)
+            elif token.startswith(b'"'):
+                stack[-1].append(re.sub(rb'\\(.)', rb'\1', token[1:-1]))
+            elif token.upper() == b"NIL":
+                stack[-1].append(None)
+            else:
+                stack[-1].append(token)
+    return stack[0]
+
+def parse_fetch_response(data):
+    """Regroupe les éléments d'une réponse UID FETCH par UID : {uid: {"ELEMENT": valeur}}"""
+    messages = {}
+    for entry in parse_imap_response(data):
+        if not isinstance(entry, list):
+            continue
+        items = {key.decode().upper(): value
+                 for key, value in zip(entry[0::2], entry[1::2]) if isinstance(key, bytes)}
+        if "UID" in items:
+            messages[int(items["UID"])] = items
+    return messages
+
+def find_text_part(structure, section=""):
+    """Localise la partie text/plain dans un BODYSTRUCTURE
+
+    Retourne (section, encodage, charset) ou None si la structure est inhabituelle.
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+    if isinstance(structure[0], list):
+        # Multipart : sous-parties, puis sous-type et données d'extension
+        for index, part in enumerate(structure, 1):
+            if not isinstance(part, list):
+                break
+            found = find_text_part(part, f"{section}.{index}" if section else str(index))
+            if found:
+                return found
+        return None
+    if len(structure) < 7 or (structure[0] or b"").upper() != b"TEXT" or (structure[1] or b"").upper() != b"PLAIN":
+        return None
+    charset = "utf-8"
+    params = structure[2] if isinstance(structure[2], list) else []
+    for key, value in zip(params[0::2], params[1::2]):
+        if key and key.upper() == b"CHARSET" and value:
+            charset = value.decode("ascii", "replace")
+    encoding = (structure[5] or b"7BIT").decode("ascii", "replace").upper()
+    return section or "1", encoding, charset
+
+def decode_text_part(data, encoding, charset):
+    """Décode une partie text/plain, éventuellement tronquée à BODY_FETCH_LIMIT octets"""
+    if encoding == "BASE64":
+        data = re.sub(rb"[^A-Za-z0-9+/=]", b"", data)
+        data = base64.b64decode(data[:len(data) - len(data) % 4])
+    elif encoding == "QUOTED-PRINTABLE":
+        # Une séquence "=XX" coupée par la troncature est ignorée
+        data = quopri.decodestring(re.sub(rb"=[0-9A-Fa-f]?$", b"", data))
+    elif encoding not in ("7BIT", "8BIT", "BINARY"):
+        raise ValueError(f"Encodage non géré : {encoding}")
+    return data.decode(charset, errors="replace")
+
+def extract_text_payload(raw_email):
+    """Extrait la partie text/plain d'un email complet via le module email"""
+    return text_payload(email.message_from_bytes(raw_email))
+
+def text_payload(email_msg):
+    """Partie text/plain décodée d'un email déjà analysé par le module email (None si absente)"""
+    payload = None
+    if email_msg.is_multipart():
+        for part in email_msg.walk():
+            if part.get_content_type() == "text/plain":
+                payload = part.get_payload(decode=True)
+                break
     else:
-        message_history.append(message_with_date)
-        if len(message_history) > MAX_EVENT_HISTORY:
-            message_history.pop(0)
-
-def add_to_signal_history(signal_type, timestamp=None):
-    """Ajoute un signal à l'historique avec sa date et heure"""
-    global signal_history
-    if timestamp is None:
-        timestamp = get_current_datetime()
-    # Emoji vert pour BUY, rouge pour SELL
-    emoji = "🟢" if signal_type == "BUY" else "🔴"
-    signal_entry = f"[{timestamp}] {emoji} {signal_type}"
-    signal_history.append(signal_entry)
-    if len(signal_history) > MAX_SIGNAL_HISTORY:
-        signal_history.pop(0)
-
-def count_todays_signals(mail):
-    """Compte le nombre de signaux déjà envoyés aujourd'hui"""
-    global signal_count
-    today = datetime.now(ZoneInfo("Europe/Paris")).date()
-    today_str = today.strftime("%d-%b-%Y")  # Format: 24-Mar-2024
-    
-    # Recherche des emails de TradingView d'aujourd'hui
-    status, messages = mail.search(None, f'(FROM "noreply@tradingview.com" SENTON {today_str})')
-    if status != "OK" or not messages[0]:
-        return 0
-        
-    count = 0
-    for e_id in messages[0].split():
-        try:
-            status, msg_data = mail.fetch(e_id, '(BODY[])')
-            if not msg_data or not msg_data[0]:
-                continue
-
-            raw_email = None
-            for part in msg_data:
-                if isinstance(part, tuple) and len(part) > 1:
-                    raw_email = part[1]
-                    break
+        payload = email_msg.get_payload(decode=True)
+    if not payload:
+        return None
+    return payload.decode('utf-8', errors="replace")
+
+def format_message_set(uids):
+    """Construit un ensemble de messages IMAP compact ("3:7,9") à partir d'une liste d'UID"""
+    numbers = sorted({int(uid) for uid in uids})
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(f"{low}:{high}" if low != high else str(low) for low, high in ranges)
+
+def parse_header_fields(raw_headers):
+    """Analyse un bloc d'en-têtes brut (BODY[HEADER.FIELDS ...]) en {nom en minuscules: valeur}"""
+    if not isinstance(raw_headers, bytes):
+        return {}
+    unfolded = re.sub(rb"\r?\n[ \t]+", b" ", raw_headers)
+    return {name.decode("ascii", "replace").lower(): value.decode("utf-8", "replace").strip()
+            for name, value in re.findall(rb"^([A-Za-z0-9-]+):(.*?)\r?$", unfolded, re.M)}
+
+def parse_email_date(value):
+    """En-tête Date en epoch (None s'il est absent ou illisible)"""
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+def parse_internaldate(value):
+    """INTERNALDATE (ex. b'17-Jul-1996 02:44:25 -0700') en epoch, indépendamment de la locale"""
+    if not isinstance(value, bytes):
+        return None
+    parsed = imaplib.Internaldate2tuple(b'INTERNALDATE "' + value + b'"')
+    return time.mktime(parsed) if parsed else None
+
+def fetch_internaldates(mail, uids):
+    """Balayage des seules dates de réception (INTERNALDATE) d'un ensemble d'emails, en une commande
+
+    Retourne {uid: epoch}. Quelques dizaines d'octets par email : un arriéré de plusieurs
+    centaines d'alertes se trie sans en télécharger le contenu.
+    """
+    status, data = mail.uid("FETCH", format_message_set(uids), "(UID INTERNALDATE)")
+    if status != "OK":
+        raise imaplib.IMAP4.error("FETCH INTERNALDATE en échec")
+    return {uid: parse_internaldate(items.get("INTERNALDATE")) for uid, items in parse_fetch_response(data).items()}
+
+def fetch_alert_messages(mail, uids):
+    """Récupère le texte et les en-têtes utiles de plusieurs alertes en un minimum d'allers-retours
+
+    Retourne {uid: {"text": ..., "message_id": ..., "sent_at": ..., "received_at": ...}} sans
+    télécharger les emails complets ni les marquer comme lus (sent_at : en-tête Date,
+    received_at : INTERNALDATE, en epoch) :
+    1. un seul FETCH BODYSTRUCTURE (+ Message-ID, Date, INTERNALDATE) sur tout l'ensemble de messages
+    2. un FETCH BODY.PEEK[section]<0.BODY_FETCH_LIMIT> par section distincte (en général une seule)
+    3. un FETCH BODY.PEEK[] groupé, avec le module email, pour les structures inhabituelles
+    """
+    if not uids:
+        return {}
+    status, data = mail.uid("FETCH", format_message_set(uids), "(UID INTERNALDATE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (MESSAGE-ID DATE)])")
+    if status != "OK":
+        raise imaplib.IMAP4.error("FETCH BODYSTRUCTURE en échec")
+
+    messages = {}
+    fallback = set()
+    by_section = {}
+    for uid, items in parse_fetch_response(data).items():
+        raw_headers = next((value for key, value in items.items() if key.startswith("BODY[HEADER.FIELDS")), None)
+        headers = parse_header_fields(raw_headers)
+        messages[uid] = {"text": None, "message_id": headers.get("message-id"),
+                         "sent_at": parse_email_date(headers.get("date")),
+                         "received_at": parse_internaldate(items.get("INTERNALDATE"))}
+        text_part = find_text_part(items.get("BODYSTRUCTURE"))
+        if text_part:
+            by_section.setdefault(text_part[0], {})[uid] = text_part
+        else:
+            fallback.add(uid)
+
+    for section, parts in by_section.items():
+        status, data = mail.uid("FETCH", format_message_set(parts), f"(UID BODY.PEEK[{section}]<0.{BODY_FETCH_LIMIT}>)")
+        fetched = parse_fetch_response(data) if status == "OK" else {}
+        for uid, (_, encoding, charset) in parts.items():
+            items = fetched.get(uid, {})
+            raw_part = next((value for key, value in items.items() if key.startswith(f"BODY[{section}]")), None)
+            try:
+                if not isinstance(raw_part, bytes):
+                    raise ValueError("Partie texte absente de la réponse")
+                messages[uid]["text"] = decode_text_part(raw_part, encoding, charset)
+            except (ValueError, LookupError):
+                fallback.add(uid)
+
+    if fallback:
+        status, data = mail.uid("FETCH", format_message_set(fallback), "(UID BODY.PEEK[])")
+        fetched = parse_fetch_response(data) if status == "OK" else {}
+        for uid in fallback:
+            raw_email = fetched.get(uid, {}).get("BODY[]")
+            if isinstance(raw_email, bytes):
+                messages[uid]["text"] = extract_text_payload(raw_email)
+
+    return messages
+
+# État persistant (SQLite en mode WAL, partagé entre les threads)
+_state_db = None
+_state_lock = threading.Lock()
+
+def get_state_db():
+    """Ouvre (une seule fois) la base d'état locale"""
+    global _state_db
+    with _state_lock:
+        if _state_db is None:
+            db = sqlite3.connect(STATE_DB, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS watermark (
+                              mailbox TEXT PRIMARY KEY,
+                              uidvalidity INTEGER NOT NULL,
+                              last_uid INTEGER NOT NULL,
+                              highestmodseq INTEGER)""")
+            # Registre des signaux envoyés (ajout seul) et compteur quotidien associé
+            db.execute("""CREATE TABLE IF NOT EXISTS signals (
+                              id INTEGER PRIMARY KEY,
+                              mailbox TEXT NOT NULL,
+                              uid INTEGER,
+                              side TEXT NOT NULL,
+                              day TEXT NOT NULL,
+                              detected_at TEXT NOT NULL,
+                              sent_at TEXT NOT NULL,
+                              webhook_result TEXT,
+                              delivered INTEGER NOT NULL)""")
+            # Compteur quotidien global des versions mono-compte : remplacé par le compteur par boîte
+            db.execute("DROP TABLE IF EXISTS daily_counts")
+            # Compteur quotidien par boîte surveillée (limite propre à chaque compte)
+            db.execute("""CREATE TABLE IF NOT EXISTS mailbox_daily_counts (
+                              mailbox TEXT NOT NULL,
+                              day TEXT NOT NULL,
+                              count INTEGER NOT NULL,
+                              PRIMARY KEY (mailbox, day))""")
+            # Limiteur : signaux admis par jour et par portée ("total", "side:BUY", "symbol:BTCUSDT"),
+            # outbox comprise, et seau à jetons de la limite de rafale
+            db.execute("""CREATE TABLE IF NOT EXISTS limiter_counts (
+                              mailbox TEXT NOT NULL,
+                              day TEXT NOT NULL,
+                              scope TEXT NOT NULL,
+                              count INTEGER NOT NULL,
+                              PRIMARY KEY (mailbox, day, scope))""")
+            db.execute("""CREATE TABLE IF NOT EXISTS limiter_buckets (
+                              mailbox TEXT PRIMARY KEY,
+                              tokens REAL NOT NULL,
+                              updated_at REAL NOT NULL)""")
+            # Outbox : signaux détectés en attente d'envoi (queued → in_flight → delivered | dead)
+            db.execute("""CREATE TABLE IF NOT EXISTS outbox (
+                              id INTEGER PRIMARY KEY,
+                              idempotency_key TEXT NOT NULL UNIQUE,
+                              mailbox TEXT NOT NULL,
+                              uid INTEGER,
+                              side TEXT NOT NULL,
+                              payload TEXT NOT NULL,
+                              state TEXT NOT NULL,
+                              attempts INTEGER NOT NULL DEFAULT 0,
+                              created_at REAL NOT NULL,
+                              next_attempt_at REAL NOT NULL,
+                              last_error TEXT,
+                              seen_committed INTEGER NOT NULL DEFAULT 0,
+                              delivered_targets TEXT)""")
+            # Bases créées avant l'envoi multi-cibles : cibles ayant déjà accusé réception du signal
+            if "delivered_targets" not in {row[1] for row in db.execute("PRAGMA table_info(outbox)")}:
+                db.execute("ALTER TABLE outbox ADD COLUMN delivered_targets TEXT")
+            db.execute("CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, next_attempt_at)")
+            # Historiques du tableau de bord enregistrés à l'arrêt (PERSIST_HISTORY)
+            db.execute("""CREATE TABLE IF NOT EXISTS history (
+                              kind TEXT NOT NULL,
+                              at_ns INTEGER NOT NULL,
+                              side TEXT,
+                              uid INTEGER,
+                              account TEXT,
+                              text TEXT)""")
+            _state_db = db
+    return _state_db
+
+def load_watermark(mailbox):
+    """Retourne (uidvalidity, last_uid, highestmodseq) pour la boîte, ou None"""
+    db = get_state_db()
+    with _state_lock:
+        return db.execute("SELECT uidvalidity, last_uid, highestmodseq FROM watermark WHERE mailbox = ?",
+                          (mailbox,)).fetchone()
+
+def save_watermark(mailbox, watermark):
+    """Enregistre le filigrane (uidvalidity, last_uid, highestmodseq) de la boîte"""
+    db = get_state_db()
+    with _state_lock:
+        db.execute("INSERT OR REPLACE INTO watermark (mailbox, uidvalidity, last_uid, highestmodseq) VALUES (?, ?, ?, ?)",
+                   (mailbox, *watermark))
+
+def get_signal_day(moment=None):
+    """Jour de référence du compteur quotidien (fuseau Europe/Paris)"""
+    return (moment or datetime.now(PARIS_TZ)).astimezone(PARIS_TZ).date().isoformat()
+
+def record_signal(mailbox, uid, side, detected_at, webhook_result, delivered):
+    """Ajoute une tentative d'envoi au registre et incrémente le compteur du jour si elle a abouti"""
+    sent_at = datetime.now(timezone.utc)
+    day = get_signal_day(sent_at)
+    db = get_state_db()
+    with _state_lock:
+        db.execute("BEGIN")
+        db.execute("""INSERT INTO signals (mailbox, uid, side, day, detected_at, sent_at, webhook_result, delivered)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                   (mailbox, uid, side, day, detected_at.isoformat(), sent_at.isoformat(),
+                    str(webhook_result), int(delivered)))
+        if delivered:
+            db.execute("""INSERT INTO mailbox_daily_counts (mailbox, day, count) VALUES (?, ?, 1)
+                          ON CONFLICT(mailbox, day) DO UPDATE SET count = count + 1""", (mailbox, day))
+        db.execute("COMMIT")
+
+def load_todays_signal_count(mailbox):
+    """Nombre de signaux envoyés aujourd'hui pour une boîte, lu dans le registre"""
+    day = get_signal_day()
+    db = get_state_db()
+    with _state_lock:
+        row = db.execute("SELECT count FROM mailbox_daily_counts WHERE mailbox = ? AND day = ?",
+                         (mailbox, day)).fetchone()
+        if row is None:
+            # Registre antérieur aux compteurs par boîte : recompté une fois depuis le registre
+            row = db.execute("SELECT COUNT(*) FROM signals WHERE mailbox = ? AND day = ? AND delivered = 1",
+                             (mailbox, day)).fetchone()
+    return row[0] if row else 0
+
+def load_signal_history():
+    """Recharge l'historique affiché à partir des derniers signaux envoyés du registre"""
+    db = get_state_db()
+    with _state_lock:
+        rows = db.execute("SELECT side, sent_at, mailbox FROM signals WHERE delivered = 1 ORDER BY id DESC LIMIT ?",
+                          (MAX_SIGNAL_HISTORY,)).fetchall()
+    events.clear("signal")
+    for side, sent_at, mailbox in reversed(rows):
+        account = accounts.get(mailbox)
+        add_to_signal_history(side, datetime.fromisoformat(sent_at).timestamp(), account.name if account else mailbox)
+
+def enqueue_signal(mailbox, uid, side, payload, idempotency_key):
+    """Place un signal dans l'outbox ; retourne False s'il y figure déjà (même clé d'idempotence)
+
+    `uid` vaut None pour une alerte reçue par HTTP : aucun email n'est alors à marquer comme lu.
+    """
+    now = time.time()
+    db = get_state_db()
+    with _state_lock:
+        cursor = db.execute("""INSERT OR IGNORE INTO outbox
+                                   (idempotency_key, mailbox, uid, side, payload, state, created_at, next_attempt_at,
+                                    seen_committed)
+                               VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)""",
+                            (idempotency_key, mailbox, uid, side, json.dumps(payload), now, now, int(uid is None)))
+    return cursor.rowcount == 1
+
+def count_pending_signals(mailbox=None):
+    """Nombre de signaux de l'outbox pas encore envoyés (en file ou en cours d'envoi), pour une boîte ou au total"""
+    db = get_state_db()
+    with _state_lock:
+        if mailbox is None:
+            return db.execute("SELECT COUNT(*) FROM outbox WHERE state IN ('queued', 'in_flight')").fetchone()[0]
+        return db.execute("SELECT COUNT(*) FROM outbox WHERE mailbox = ? AND state IN ('queued', 'in_flight')",
+                          (mailbox,)).fetchone()[0]
+
+def claim_outbox_entry():
+    """Réserve le prochain signal à envoyer
+
+    Retourne (entrée, délai avant la prochaine échéance) ; l'entrée vaut None si aucun
+    signal n'est prêt, le délai vaut None si l'outbox est vide.
+    """
+    now = time.time()
+    db = get_state_db()
+    with _state_lock:
+        row = db.execute("""SELECT id, idempotency_key, mailbox, uid, side, payload, attempts + 1, created_at,
+                                   delivered_targets
+                            FROM outbox WHERE state = 'queued' AND next_attempt_at <= ?
+                            ORDER BY id LIMIT 1""", (now,)).fetchone()
+        if row:
+            db.execute("UPDATE outbox SET state = 'in_flight', attempts = attempts + 1 WHERE id = ?", (row[0],))
+            return row, 0
+        next_attempt = db.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE state = 'queued'").fetchone()[0]
+    return None, (max(0.0, next_attempt - now) if next_attempt is not None else None)
+
+def finish_outbox_entry(entry_id, state, error=None, retry_in=None, delivered_targets=None):
+    """Enregistre l'issue d'une tentative : delivered, dead, ou queued avec une nouvelle échéance
+
+    `delivered_targets` : cibles ayant accusé réception, qui ne recevront plus ce signal.
+    """
+    db = get_state_db()
+    with _state_lock:
+        db.execute("""UPDATE outbox SET state = ?, last_error = ?, next_attempt_at = ?,
+                                        delivered_targets = COALESCE(?, delivered_targets)
+                      WHERE id = ?""",
+                   (state, error, time.time() + (retry_in or 0),
+                    json.dumps(sorted(delivered_targets)) if delivered_targets is not None else None, entry_id))
+
+def cancel_outbox_entry(idempotency_key):
+    """Annule un signal encore en file dans l'outbox
+
+    Retourne (charge utile, date d'entrée dans l'outbox) du signal annulé, ou None s'il est
+    déjà parti (ou en cours d'envoi).
+    """
+    db = get_state_db()
+    with _state_lock:
+        row = db.execute("SELECT id, payload, created_at FROM outbox WHERE idempotency_key = ? AND state = 'queued'",
+                         (idempotency_key,)).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE outbox SET state = 'dead', last_error = 'cancelled' WHERE id = ?", (row[0],))
+    return json.loads(row[1]), row[2]
+
+def commit_outbox_flags(mail, mailbox):
+    """Marque comme lus, en une seule commande, les emails dont le signal a quitté l'outbox"""
+    db = get_state_db()
+    with _state_lock:
+        rows = db.execute("""SELECT id, uid FROM outbox
+                             WHERE mailbox = ? AND seen_committed = 0 AND state IN ('delivered', 'dead')""",
+                          (mailbox,)).fetchall()
+    if not rows:
+        return
+    mail.uid("STORE", format_message_set(uid for _, uid in rows), "+FLAGS.SILENT", "(\\Seen)")
+    with _state_lock:
+        db.executemany("UPDATE outbox SET seen_committed = 1 WHERE id = ?", [(entry_id,) for entry_id, _ in rows])
+    log_event("flagged", mailbox=mailbox, uids=[uid for _, uid in rows], reason="outbox")
+
+def quote_mailbox(name):
+    """Nom de dossier IMAP, entre guillemets s'il contient des espaces ou caractères spéciaux"""
+    if re.fullmatch(r"[A-Za-z0-9_./-]+", name):
+        return name
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def find_new_uids(mail, account, saved=None):
+    """Détermine les UID TradingView arrivés depuis le dernier filigrane
+
+    Retourne (uids, filigrane). uids vaut None quand rien de nouveau n'est arrivé : le tick
+    se limite alors à une seule recherche UID. STATUS n'est pas utilisé, la RFC 3501
+    (§6.3.10) le déconseillant sur la boîte sélectionnée ; UIDVALIDITY vient du SELECT.
+    Le filigrane n'est enregistré par l'appelant qu'une fois les emails traités ; `saved`
+    permet de partir d'un filigrane déjà transmis mais pas encore enregistré (moteur
+    async) plutôt que de celui de la base. HIGHESTMODSEQ (valeur du SELECT) est seulement
+    enregistré avec le filigrane, pour diagnostic : aucune décision ne s'appuie dessus.
+    """
+    box = mail.selected
+    uidvalidity = box["UIDVALIDITY"]
+    saved = saved or load_watermark(account.key)
+
+    if saved and saved[0] == uidvalidity:
+        # "n+1:*" renvoie toujours au moins le dernier message, d'où le filtrage ci-dessous
+        last_uid, floor = saved[1], saved[1]
+        status, data = mail.uid("SEARCH", None, f'UID {last_uid + 1}:* FROM "{account.sender}"')
+    else:
+        # Premier démarrage ou UIDVALIDITY changé : on reprend les emails non lus, et le
+        # filigrane part de l'UIDNEXT annoncé au SELECT pour ne pas relire les emails déjà lus
+        last_uid, floor = 0, box.get("UIDNEXT", 1) - 1
+        status, data = mail.uid("SEARCH", None, f'UNSEEN FROM "{account.sender}"')
+
+    if status != "OK":
+        raise imaplib.IMAP4.error("Recherche des nouveaux emails en échec")
+    uids = [uid for uid in (data[0] or b"").split() if int(uid) > last_uid]
+    if last_uid == floor and not uids:
+        return None, saved
+    new_last_uid = max([floor] + [int(uid) for uid in uids])
+    return uids, (uidvalidity, new_last_uid, box.get("HIGHESTMODSEQ"))
+
+class SignalLimiter:
+    """Admission des signaux : limite de rafale et budgets quotidiens, par compte
+
+    - rafale : seau à jetons de `signals_per_minute` jetons, rechargé en continu sur une minute
+    - budgets du jour : total (`max_daily_signals`), par sens et par symbole ; ils comptent
+      les signaux admis (outbox comprise) et sont rendus si le signal n'est finalement pas envoyé
+
+    Une décision ne coûte que des accès à des dictionnaires en mémoire ; l'état est recopié
+    dans la base d'état à chaque admission pour survivre aux redémarrages. Le changement de
+    jour (minuit, Europe/Paris) est déclenché par start_daily_rollover(), et vérifié à chaque
+    décision au cas où la machine aurait été en veille. Quel que soit son déclencheur, il
+    appelle `on_rollover(jour)` pour remettre à zéro les compteurs affichés.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.on_rollover = None  # Rappel du changement de jour, avec le nouveau jour
+        self._counts = {}   # (clé de boîte, portée) → signaux admis aujourd'hui
+        self._buckets = {}  # clé de boîte → [jetons, instant de la dernière mise à jour]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scopes(signal):
+        scopes = ["total", f"side:{signal['side']}"]
+        if signal.get("symbol"):
+            scopes.append(f"symbol:{signal['symbol']}")
+        return scopes
+
+    def load(self):
+        """Recharge les compteurs du jour et les seaux à jetons depuis la base d'état"""
+        day = get_signal_day()
+        db = get_state_db()
+        with self._lock, _state_lock:
+            # Base antérieure au limiteur : budgets du jour repris du registre des signaux envoyés
+            db.execute("""INSERT OR IGNORE INTO limiter_counts (mailbox, day, scope, count)
+                          SELECT mailbox, day, 'total', count FROM mailbox_daily_counts WHERE day = ?""", (day,))
+            db.execute("""INSERT OR IGNORE INTO limiter_counts (mailbox, day, scope, count)
+                          SELECT mailbox, day, 'side:' || side, COUNT(*) FROM signals
+                          WHERE day = ? AND delivered = 1 GROUP BY mailbox, side""", (day,))
+            self.day = day
+            self._counts = {(mailbox, scope): count for mailbox, scope, count in
+                            db.execute("SELECT mailbox, scope, count FROM limiter_counts WHERE day = ?", (day,))}
+            self._buckets = {mailbox: [tokens, updated_at] for mailbox, tokens, updated_at in
+                             db.execute("SELECT mailbox, tokens, updated_at FROM limiter_buckets")}
+
+    def rollover(self, day=None):
+        """Passe au jour suivant : budgets quotidiens remis à zéro (la limite de rafale est conservée)"""
+        day = day or get_signal_day()
+        with self._lock:
+            if day == self.day:
+                return False
+            self.day = day
+            self._counts = {}
+        db = get_state_db()
+        with _state_lock:
+            db.execute("DELETE FROM limiter_counts WHERE day < ?", (day,))
+        if self.on_rollover:
+            self.on_rollover(day)
+        return True
 
-            if not raw_email or not isinstance(raw_email, bytes):
-                continue
+    def used(self, mailbox, scope="total"):
+        return self._counts.get((mailbox, scope), 0)
+
+    def _limits(self, account, signal):
+        symbol = signal.get("symbol")
+        symbol_limit = (account.symbol_daily_limits.get(symbol, account.symbol_daily_limits.get("*"))
+                        if symbol else None)
+        return [("total", account.max_daily_signals, f"limite quotidienne de {account.max_daily_signals} signaux"),
+                (f"side:{signal['side']}", account.side_daily_limits.get(signal["side"]),
+                 f"budget quotidien {signal['side']}"),
+                (f"symbol:{symbol}", symbol_limit, f"budget quotidien du symbole {symbol}")]
+
+    def acquire(self, account, signal, now=None):
+        """Décide de l'admission d'un signal ; retourne (admis, motif du refus ou du dépassement toléré)
+
+        Un sens de LIMIT_EXEMPT_SIDES est toujours admis (le motif signale alors le dépassement).
+        Un signal admis consomme un jeton et une unité de chacun de ses budgets.
+        """
+        now = time.time() if now is None else now
+        # Jour du signal, pas de l'horloge : le rejeu d'une archive remet les budgets à zéro à chaque minuit rejoué
+        self.rollover(get_signal_day(datetime.fromtimestamp(now, timezone.utc)))
+        key = account.key
+        with self._lock:
+            reason = None
+            bucket = None
+            if account.signals_per_minute:
+                capacity = float(account.signals_per_minute)
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0.0, now - updated_at) * capacity / 60)
+                if tokens < 1:
+                    reason = f"rafale de plus de {account.signals_per_minute} signaux par minute"
+                bucket = [max(0.0, tokens - 1), now]
+            for scope, limit, label in self._limits(account, signal):
+                if reason is None and limit is not None and self._counts.get((key, scope), 0) >= limit:
+                    reason = label
+            allowed = reason is None or signal["side"] in LIMIT_EXEMPT_SIDES
+            if not allowed:
+                return False, reason
+            scopes = self._scopes(signal)
+            for scope in scopes:
+                self._counts[(key, scope)] = self._counts.get((key, scope), 0) + 1
+            if bucket is not None:
+                self._buckets[key] = bucket
+            day = self.day
+        db = get_state_db()
+        with _state_lock:
+            db.execute("BEGIN")
+            db.executemany("""INSERT INTO limiter_counts (mailbox, day, scope, count) VALUES (?, ?, ?, 1)
+                              ON CONFLICT(mailbox, day, scope) DO UPDATE SET count = count + 1""",
+                           [(key, day, scope) for scope in scopes])
+            if bucket is not None:
+                db.execute("INSERT OR REPLACE INTO limiter_buckets (mailbox, tokens, updated_at) VALUES (?, ?, ?)",
+                           (key, *bucket))
+            db.execute("COMMIT")
+        return True, reason
+
+    def release(self, mailbox, signal, admitted_at):
+        """Rend les budgets d'un signal admis mais jamais envoyé (abandonné, annulé), s'il date d'aujourd'hui"""
+        day = get_signal_day(datetime.fromtimestamp(admitted_at, timezone.utc))
+        scopes = self._scopes(signal)
+        with self._lock:
+            if day != self.day:
+                return
+            for scope in scopes:
+                self._counts[(mailbox, scope)] = max(0, self._counts.get((mailbox, scope), 0) - 1)
+        db = get_state_db()
+        with _state_lock:
+            db.executemany("""UPDATE limiter_counts SET count = MAX(0, count - 1)
+                              WHERE mailbox = ? AND day = ? AND scope = ?""",
+                           [(mailbox, day, scope) for scope in scopes])
+
+limiter = SignalLimiter()
+
+def seconds_until_midnight(now=None):
+    """Secondes jusqu'au prochain minuit à Paris (changements d'heure compris)"""
+    now = now or datetime.now(PARIS_TZ)
+    midnight = datetime.combine(now.astimezone(PARIS_TZ).date() + timedelta(days=1), datetime.min.time(), PARIS_TZ)
+    # Soustraction en UTC : entre deux dates du même fuseau, Python ignore le changement d'heure
+    return (midnight.astimezone(timezone.utc) - now.astimezone(timezone.utc)).total_seconds()
+
+def reset_signal_counter(mode, day):
+    """Changement de jour (rappel de limiter.rollover()) : remet à zéro les compteurs affichés"""
+    previous = signal_count
+    for account in accounts.values():
+        account.signal_count = 0
+    sync_signal_count()
+    log_event("daily_reset", day=day, previous_signal_count=previous)
+    update_display(mode, None, signal_count,
+                   last_event=f"[📊] {get_current_time()} Réinitialisation du compteur de signaux quotidiens ({previous} → 0)")
+
+def start_daily_rollover(mode, stop):
+    """Thread qui déclenche le changement de jour du limiteur à chaque minuit (Europe/Paris), jusqu'à `stop`
+
+    Le changement de jour peut aussi venir de limiter.acquire() (réveil de veille) : dans
+    les deux cas, reset_signal_counter() est appelé par le rappel on_rollover.
+    """
+    limiter.on_rollover = lambda day: reset_signal_counter(mode, day)
+
+    def run():
+        while not stop.wait(seconds_until_midnight() + 0.5):
+            try:
+                limiter.rollover()
+            except Exception as e:
+                update_display(mode, None, signal_count,
+                               error=f"[❌] {get_current_time()} Erreur lors du changement de jour : {e}")
+    threading.Thread(target=run, name="daily-rollover", daemon=True).start()
+
+class AlertNotifier:
+    """Envoi des emails d'alerte en arrière-plan, sur une connexion SMTP authentifiée réutilisée
+
+    notify() ne fait que déposer l'alerte dans une file : la boucle de surveillance n'attend
+    jamais SMTP. Une alerte identique (même sujet) reçue moins de ALERT_COOLDOWN secondes
+    après la précédente n'est pas envoyée tout de suite : elle rejoint un récapitulatif
+    envoyé à la fin du délai. Chaque opération SMTP est bornée par SMTP_TIMEOUT, et la
+    connexion est fermée après SMTP_IDLE_TIMEOUT secondes d'inactivité.
+    """
+
+    def __init__(self, cooldown=ALERT_COOLDOWN, max_pending=100):
+        self.cooldown = cooldown
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._last_sent = {}  # sujet → instant du dernier envoi (monotonic)
+        self._digests = {}    # sujet → alertes retenues pendant le délai
+        self._server = None
+        self._last_used = 0.0
+        self._thread = None
+        self.muted = False    # Rejeu d'archive : les limites atteintes ne déclenchent aucun email
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="alert-notifier", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Envoie les récapitulatifs en attente puis ferme la connexion (attente bornée)"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join(timeout=SMTP_TIMEOUT * 2)
+
+    def notify(self, subject, message):
+        """Dépose une alerte ; retourne False si la file est pleine (alerte perdue)"""
+        if self.muted:
+            return False
+        try:
+            self._queue.put_nowait((subject, message, datetime.now(PARIS_TZ)))
+            return True
+        except queue.Full:
+            metrics.inc("alert_emails_total", outcome="dropped")
+            log_event("alert_dropped", level=logging.WARNING, subject=subject)
+            return False
 
-            email_msg = email.message_from_bytes(raw_email)
-            
-            payload = None
-            if email_msg.is_multipart():
-                for part in email_msg.walk():
-                    if part.get_content_type() == "text/plain":
-                        payload = part.get_payload(decode=True)
-                        break
-            else:
-                payload = email_msg.get_payload(decode=True)
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._next_wakeup())
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                self._accept(*item)
+            self._flush_digests()
+            if self._server and time.monotonic() - self._last_used >= SMTP_IDLE_TIMEOUT:
+                self._close()
+        self._flush_digests(force=True)
+        self._close()
+
+    def _next_wakeup(self):
+        now = time.monotonic()
+        deadlines = [self._last_sent[subject] + self.cooldown for subject in self._digests]
+        if self._server:
+            deadlines.append(self._last_used + SMTP_IDLE_TIMEOUT)
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def _accept(self, subject, message, received_at):
+        last = self._last_sent.get(subject)
+        if last is not None and time.monotonic() - last < self.cooldown:
+            digest = self._digests.setdefault(subject, {"count": 0, "first": received_at})
+            digest.update(count=digest["count"] + 1, last=received_at, message=message)
+            metrics.inc("alert_emails_total", outcome="coalesced")
+            log_event("alert_coalesced", subject=subject, pending=digest["count"])
+            return
+        self._send(subject, message)
+        self._last_sent[subject] = time.monotonic()
 
-            if not payload:
+    def _flush_digests(self, force=False):
+        now = time.monotonic()
+        for subject, digest in list(self._digests.items()):
+            if not force and now - self._last_sent[subject] < self.cooldown:
                 continue
+            del self._digests[subject]
+            fmt = "%H:%M:%S"
+            self._send(f"{subject} (×{digest['count']})",
+                       f"{digest['count']} alerte(s) identique(s) regroupée(s) entre {digest['first'].strftime(fmt)} "
+                       f"et {digest['last'].strftime(fmt)} (au plus une alerte toutes les {self.cooldown}s).\n\n"
+                       f"Dernière alerte reçue :\n{digest['message']}")
+            self._last_sent[subject] = now
+
+    def _connect(self):
+        import smtplib
+        context = ssl.create_default_context()
+        if SMTP_PORT == 465:
+            server = smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT, context=context)
+        else:
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            server.starttls(context=context)
+        server.login(EMAIL_ACCOUNT, APP_PASSWORD)
+        return server
 
-            signal = payload.decode('utf-8').strip()
-            if "BUY" in signal or "SELL" in signal:
-                count += 1
-        except:
-            continue
-            
-    return count
-
-def reset_signal_counter():
-    global signal_count, last_signal_date
-    current_date = datetime.now(ZoneInfo("Europe/Paris")).date()
-    if current_date != last_signal_date:
-        if signal_count > 0:
-            log_success(f"\n[📊] Réinitialisation du compteur de signaux quotidiens")
-            log_info(f"    ├── Précédent : {signal_count} signaux")
-            log_info(f"    └── Nouveau   : 0 signal")
-        signal_count = 0
-        last_signal_date = current_date
+    def _close(self):
+        import smtplib
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
 
-def send_alert_email(subject, message):
-    """Envoie un email d'alerte via iCloud SMTP"""
-    try:
+    def _send(self, subject, message):
+        # Modules chargés au premier email d'alerte, pas au démarrage
+        import smtplib
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
         msg = MIMEMultipart()
         msg['From'] = EMAIL_ACCOUNT
         msg['To'] = EMAIL_ACCOUNT
         msg['Subject'] = subject
-        
         msg.attach(MIMEText(message, 'plain'))
-        
-        # Connexion au serveur SMTP d'iCloud
-        server = smtplib.SMTP_SSL('smtp.mail.me.com', 587)
-        server.login(EMAIL_ACCOUNT, APP_PASSWORD)
-        
-        # Envoi de l'email
-        server.send_message(msg)
-        server.quit()
-        print(f"[📧] {get_current_time()} Email d'alerte envoyé avec succès")
-        return True
-    except Exception as e:
-        print(f"[❌] {get_current_time()} Erreur lors de l'envoi de l'email d'alerte : {str(e)}")
-        return False
+        # Une connexion réutilisée a pu être fermée par le serveur : une reconnexion, pas plus
+        for attempt in range(2):
+            reused = self._server is not None
+            try:
+                if not reused:
+                    self._server = self._connect()
+                self._server.send_message(msg)
+                self._last_used = time.monotonic()
+                metrics.inc("alert_emails_total", outcome="sent")
+                log_event("alert_sent", subject=subject, reused_connection=reused)
+                log_success(f"[📧] {get_current_time()} Email d'alerte envoyé avec succès")
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                self._close()
+                # SMTPException hérite d'OSError : identifiants ou destinataire refusés (5xx) ne
+                # seraient pas mieux reçus sur une nouvelle connexion
+                permanent = (isinstance(e, (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused))
+                             or isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500)
+                if reused and attempt == 0 and not permanent:
+                    continue
+                metrics.inc("alert_emails_total", outcome="failed")
+                log_error(f"[❌] {get_current_time()} Erreur lors de l'envoi de l'email d'alerte : {str(e)}")
+                return False
 
-def check_signal_limit(signal):
-    global signal_count
-    if signal_count >= MAX_DAILY_SIGNALS:
-        if signal == "SELL":
-            log_warning(f"\n[⚠️] Limite de {MAX_DAILY_SIGNALS} signaux atteinte mais exécution du SELL final autorisée")
+notifier = AlertNotifier()
+
+def send_alert_email(subject, message):
+    """Confie un email d'alerte au notificateur en arrière-plan (ne bloque jamais)"""
+    return notifier.notify(subject, message)
+
+def check_signal_limit(account, signal, now=None):
+    """Soumet le signal (dict de AlertParser) au limiteur du compte ; retourne True s'il est admis"""
+    side = signal["side"]
+    allowed, reason = limiter.acquire(account, signal, now)
+    if reason is not None:
+        log_event("limit_hit", level=logging.WARNING, side=side, symbol=signal.get("symbol"), account=account.name,
+                  reason=reason, signal_count=account.signal_count, allowed=allowed)
+        metrics.inc("signal_limit_hits_total", side=side, account=account.name, allowed=str(allowed).lower())
+        if allowed:
+            log_warning(f"\n[⚠️] {reason.capitalize()} atteinte pour {account.name} mais exécution du {side} autorisée")
             return True
             
         # Envoyer un email d'alerte
-        subject = "⚠️ Alerte TradingView Monitor - Limite de signaux atteinte"
+        subject = f"⚠️ Alerte TradingView Monitor - Limite de signaux atteinte ({account.name})"
         message = f"""
 Bonjour,
 
-Le moniteur TradingView a atteint sa limite de {MAX_DAILY_SIGNALS} signaux pour aujourd'hui.
-Le dernier signal reçu a été ignoré.
+Le moniteur TradingView a atteint une limite sur le compte {account.name} ({account.key}) :
+{reason}.
+Le dernier signal reçu ({side}{' ' + signal['symbol'] if signal.get('symbol') else ''}) a été ignoré.
 
 Il est recommandé de vérifier :
 1. Le bon fonctionnement de vos indicateurs
 2. L'historique des signaux de la journée
 3. L'état de vos positions actuelles
 
-Timestamp: {datetime.now(ZoneInfo("Europe/Paris")).strftime('%Y-%m-%d %H:%M:%S (Europe/Paris)')}
+Timestamp: {datetime.now(PARIS_TZ).strftime('%Y-%m-%d %H:%M:%S (Europe/Paris)')}
 
 Ce message est automatique, merci de ne pas y répondre.
 """
         send_alert_email(subject, message)
-        log_error(f"\n[🛑] Limite de {MAX_DAILY_SIGNALS} signaux atteinte - Signal ignoré jusqu'à demain")
+        log_error(f"\n[🛑] {reason.capitalize()} atteinte pour {account.name} - Signal ignoré")
         return False
     return True
 
 def get_current_time():
-    return datetime.now(ZoneInfo("Europe/Paris")).strftime("%H:%M:%S")
+    return format_paris_time(int(time.time()), "%H:%M:%S")
 
 def format_email_id(email_id):
     """Formate l'ID de l'email pour un meilleur affichage"""
     return f"#{str(int(email_id))}"
 
+# Journalisation structurée du mode --headless
+logger = logging.getLogger("tradingview_monitor")
+headless = False
+
+class JsonFormatter(logging.Formatter):
+    """Formate chaque événement en une ligne JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "event": getattr(record, "event", "log"),
+        }
+        message = _ANSI_RE.sub("", record.getMessage()).strip()
+        if message:
+            entry["message"] = message
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def start_headless_logging():
+    """Active la sortie JSON non bloquante
+
+    Les threads ne font qu'empiler les événements dans une file ; l'écriture sur la sortie
+    standard est faite par le thread du QueueListener, jamais par le chemin du signal.
+    """
+    global headless
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    headless = True
+    return listener
+
+def log_event(event, message="", level=logging.INFO, **fields):
+    """Émet un événement structuré (signal détecté, envoyé, reconnexion…) en mode --headless"""
+    if headless:
+        logger.log(level, message, extra={"event": event, "fields": fields})
+
+# L'affichage est mis à jour depuis la boucle IMAP et depuis le thread de l'outbox
+_display_lock = threading.RLock()
+
+def _log(color, message, end, is_alert):
+    if headless:
+        log_event("log", message, level=logging.WARNING if is_alert else logging.INFO)
+    # Quand le tableau de bord est actif, les messages rejoignent les historiques affichés
+    elif dashboard.running:
+        with _display_lock:
+            add_to_history(message.strip(), is_alert=is_alert)
+        dashboard.refresh()
+    else:
+        print(f"{color}{message}{Colors.ENDC}", end=end, flush=True)
+
 def log_info(message, end="\n"):
-    print(f"{Colors.BLUE}{message}{Colors.ENDC}", end=end, flush=True)
+    _log(Colors.BLUE, message, end, is_alert=False)
 
 def log_success(message, end="\n"):
-    print(f"{Colors.GREEN}{message}{Colors.ENDC}", end=end, flush=True)
+    _log(Colors.GREEN, message, end, is_alert=False)
 
 def log_warning(message, end="\n"):
-    print(f"{Colors.YELLOW}{message}{Colors.ENDC}", end=end, flush=True)
+    _log(Colors.YELLOW, message, end, is_alert=True)
 
 def log_error(message, end="\n"):
-    print(f"{Colors.RED}{message}{Colors.ENDC}", end=end, flush=True)
+    _log(Colors.RED, message, end, is_alert=True)
 
 def log_header(message, end="\n"):
-    print(f"{Colors.HEADER}{message}{Colors.ENDC}", end=end, flush=True)
-
-def clear_screen():
-    """Efface l'écran du terminal"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    _log(Colors.HEADER, message, end, is_alert=False)
 
 def get_terminal_width():
     """Récupère la largeur du terminal"""
     return shutil.get_terminal_size().columns
 
-def display_banner():
-    """Affiche le titre et la description du script"""
-    version = get_version()
-    width = get_terminal_width()
-    separator = "─" * width
+_ANSI_RE = re.compile(r"(\033\[[0-9;]*m)")
 
-    clear_screen()
-    print("")  # Ligne vide avant le titre
-    print(separator)
-    print("")  # Ligne vide avant le titre
-    print(f"📧 TradingView Email Monitor {version}".center(width))
-    print(f"{separator}")
-    print(f"{Colors.BLUE}Ce script :{Colors.ENDC}")
-    print("• Se connecte à iCloud Mail via IMAP")
-    print("• Surveille les emails provenant des alertes de la stratégie TradingView en place")
-    print("• Détecte les signaux BUY/SELL dans les messages")
-    print("• Transmet les signaux au bot de trading pour qu'il puisse BUY/SELL")
-    print(f"• Limite à {Colors.BOLD}{MAX_DAILY_SIGNALS}{Colors.ENDC} signaux BUY/SELL envoyés par jour pour éviter les emballements")
-    print("• Envoie une alerte email si la limite est atteinte\n")
-
-def display_status(mode, webhook_url):
-    """Affiche l'état du service"""
-    print(f"🔵 Mode {mode.upper()} activé (envoi des alertes de trading vers un serveur {mode.lower()})")
-    print(f"✅ Connexion IMAP établie et vérifiée\n")
-
-def display_stats(signal_count, last_signal=None):
-    """Affiche les statistiques et l'historique des signaux"""
-    width = get_terminal_width()
-    print(f"\n📊 DERNIERS SIGNAUX")
-    print("─" * width)
-    print(f"Signaux traités    : {signal_count}/{MAX_DAILY_SIGNALS} (prochain reset à minuit)")
-    print(f"Historique ({len(signal_history)}/{MAX_SIGNAL_HISTORY}) :")
-    if signal_history:
-        for signal in reversed(signal_history):
-            print(f"• {signal}")
-    else:
-        print("• Aucun signal")
-    print()
-
-def display_last_event(message):
-    """Affiche le dernier événement et son historique"""
-    width = get_terminal_width()
-    print(f"\n📝 DERNIERS ÉVÉNEMENTS RELATIFS AUX SIGNAUX ({len(message_history)}/{MAX_EVENT_HISTORY})")
-    print("─" * width)
-    
-    if message and not message.startswith('[🔌]') and not message.startswith('[✅]'):
-        add_to_history(message)
-    
-    if message_history:
-        for msg in reversed(message_history):
-            print(msg)
+def fit_to_width(line, width):
+    """Tronque une ligne à la largeur visible du terminal (séquences ANSI ignorées)"""
+    result = []
+    visible = 0
+    for token in _ANSI_RE.split(line):
+        if token.startswith("\033["):
+            result.append(token)
+            continue
+        for char in token:
+            if unicodedata.combining(char) or char == "\ufe0f":
+                char_width = 0
+            else:
+                char_width = 2 if unicodedata.east_asian_width(char) in "WF" else 1
+            if visible + char_width > width:
+                return "".join(result) + Colors.ENDC
+            result.append(char)
+            visible += char_width
+    return "".join(result)
+
+def banner_lines(width, version):
+    """Titre et description du script"""
+    separator = "─" * width
+    return [
+        "",  # Ligne vide avant le titre
+        separator,
+        "",  # Ligne vide avant le titre
+        f"📧 TradingView Email Monitor {version}".center(width),
+        separator,
+        f"{Colors.BLUE}Ce script :{Colors.ENDC}",
+        "• Se connecte à iCloud Mail via IMAP",
+        "• Surveille les emails provenant des alertes de la stratégie TradingView en place",
+        "• Détecte les signaux BUY/SELL dans les messages",
+        "• Transmet les signaux au bot de trading pour qu'il puisse BUY/SELL",
+        f"• Limite à {Colors.BOLD}{MAX_DAILY_SIGNALS}{Colors.ENDC} signaux BUY/SELL envoyés par jour pour éviter les emballements",
+        "• Envoie une alerte email si la limite est atteinte",
+        "",
+    ]
+
+def status_lines(mode):
+    """État du service"""
+    lines = [
+        f"🔵 Mode {mode.upper()} activé (envoi des alertes de trading vers un serveur {mode.lower()})",
+        "✅ Connexion IMAP établie et vérifiée",
+    ]
+    if len(accounts) > 1 or any(len(account.targets) > 1 for account in accounts.values()):
+        lines += [f"📬 {account.name} : {account.key} → {', '.join(target.url for target in account.targets)}"
+                  for account in accounts.values()]
+    return lines + [""]
+
+def stats_lines(width, signal_count):
+    """Statistiques et historique des signaux"""
+    lines = [
+        "",
+        "📊 DERNIERS SIGNAUX",
+        "─" * width,
+    ]
+    if len(accounts) > 1:
+        lines.append("Signaux traités    : (prochain reset à minuit)")
+        lines += [f"• {account.name:<17}: {account.signal_count}/{account.max_daily_signals}" for account in accounts.values()]
     else:
-        print("• Aucun événement")
-    print()
-
-def display_error_zone(error_message=None):
-    """Affiche la zone d'erreurs"""
-    width = get_terminal_width()
-    print(f"\n⚠️ ALERTES ET ERREURS ({len(alert_history)}/{MAX_ALERT_HISTORY})")
-    print("─" * width)
-    
+        limit = next(iter(accounts.values())).max_daily_signals if accounts else MAX_DAILY_SIGNALS
+        lines.append(f"Signaux traités    : {signal_count}/{limit} (prochain reset à minuit)")
+    lines.append(f"Historique ({events.count('signal')}/{events.capacity('signal')}) :")
+    lines += [f"• {format_signal_line(record)}" for record in events.query("signal")] or ["• Aucun signal"]
+    stats = latency.percentiles()
+    if stats:
+        lines += ["", f"Latences (ms, {latency.count} signaux) :        p50       p95       p99"]
+        lines += [f"• {name:<10} ({n:>4}) {p50:>10.0f}{p95:>10.0f}{p99:>10.0f}"
+                  for name, (n, p50, p95, p99) in stats.items()]
+    return lines + [""]
+
+def event_lines(width):
+    """Historique des événements relatifs aux signaux"""
+    lines = [
+        "",
+        f"📝 DERNIERS ÉVÉNEMENTS RELATIFS AUX SIGNAUX ({events.count('event')}/{events.capacity('event')})",
+        "─" * width,
+    ]
+    lines += [format_history_line(record.ns, record.text) for record in events.query("event")] or ["• Aucun événement"]
+    return lines + [""]
+
+def alert_lines(width, error_message=None):
+    """Zone des alertes et erreurs"""
+    lines = [
+        "",
+        f"⚠️ ALERTES ET ERREURS ({events.count('alert')}/{events.capacity('alert')})",
+        "─" * width,
+    ]
     if error_message:
-        print(f"{Colors.RED}{error_message}{Colors.ENDC}")
-        # Ajouter l'erreur à l'historique des alertes
-        add_to_history(error_message, is_alert=True)
-    
-    if alert_history:
-        for msg in reversed(alert_history):
-            print(msg)
-    else:
-        print("Aucune alerte ni erreur")
-    
-    print()
-    # Ajouter le message d'aide pour quitter
-    print(f"{Colors.BLUE}Pour quitter le programme, appuyez sur Ctrl+C{Colors.ENDC}")
+        lines.append(f"{Colors.RED}{error_message}{Colors.ENDC}")
+    lines += [format_history_line(record.ns, record.text) for record in events.query("alert")] or ["Aucune alerte ni erreur"]
+    return lines + ["", f"{Colors.BLUE}Pour quitter le programme, appuyez sur Ctrl+C{Colors.ENDC}"]
+
+class Dashboard:
+    """Tableau de bord du terminal, redessiné uniquement là où il a changé
+
+    update_display() ne fait que mettre à jour l'état. Un thread dédié compose l'écran au
+    plus DISPLAY_MAX_FPS fois par seconde et ne réécrit, par adressage du curseur ANSI,
+    que les lignes modifiées depuis le rendu précédent : l'affichage ne retarde jamais
+    le traitement des signaux.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.webhook_url = None
+        self.signal_count = 0
+        self.error = None
+        self.status_line = None
+        self.version = None
+        self._frame = []
+        self._width = None
+        self._thread = None
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    def start(self, mode, webhook_url):
+        self.mode, self.webhook_url = mode, webhook_url
+        self.version = get_version()  # Calculée une seule fois pour toute la session
+        self._thread = threading.Thread(target=self._run, name="dashboard", daemon=True)
+        self._thread.start()
+        self.refresh()
+
+    def stop(self):
+        """Arrête le thread de rendu après un dernier affichage complet"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._dirty.set()
+        self._thread.join(timeout=1)
+        self._render()
+
+    def refresh(self):
+        self._dirty.set()
+
+    def _run(self):
+        interval = 1 / DISPLAY_MAX_FPS
+        while not self._stop.is_set():
+            self._dirty.wait()
+            if self._stop.is_set():
+                break
+            self._dirty.clear()
+            try:
+                self._render()
+            except Exception:
+                pass  # Un incident d'affichage ne doit jamais interrompre la surveillance
+            self._stop.wait(interval)
+
+    def _compose(self, width, height):
+        with _display_lock:
+            lines = (banner_lines(width, self.version)
+                     + status_lines(self.mode)
+                     + stats_lines(width, self.signal_count)
+                     + event_lines(width)
+                     + alert_lines(width, self.error))
+            if self.status_line:
+                lines.append(self.status_line)
+        frame = [fit_to_width(part, width - 1) for line in lines for part in line.split("\n")]
+        # Comme un affichage qui défile : seul le bas du tableau reste visible
+        return frame[-(height - 1):] if len(frame) >= height else frame
+
+    def _render(self):
+        width, height = shutil.get_terminal_size()
+        frame = self._compose(width, height)
+        output = []
+        previous = self._frame
+        if width != self._width:
+            output.append("\033[2J")
+            previous = []
+            self._width = width
+        for row, line in enumerate(frame):
+            if row >= len(previous) or previous[row] != line:
+                output.append(f"\033[{row + 1};1H{line}\033[K")
+        if len(frame) < len(previous):
+            output.append(f"\033[{len(frame) + 1};1H\033[J")
+        if output:
+            output.append(f"\033[{len(frame) + 1};1H")
+            sys.stdout.write("".join(output))
+            sys.stdout.flush()
+        self._frame = frame
+
+dashboard = Dashboard()
 
 def update_display(mode, webhook_url, signal_count, last_signal=None, last_event=None, error=None):
-    """Met à jour l'affichage complet"""
-    display_banner()
-    display_status(mode, webhook_url)
-    display_stats(signal_count, last_signal)
-    display_last_event(last_event)
-    display_error_zone(error)
+    """Met à jour l'état affiché ; le rendu est fait en différé par le tableau de bord"""
+    if headless:
+        # Les autres messages ont leur équivalent structuré émis via log_event()
+        if error:
+            log_event("error", error, level=logging.ERROR)
+        return
+    with _display_lock:
+        if last_event and not last_event.startswith('[🔌]') and not last_event.startswith('[✅]'):
+            add_to_history(last_event)
+        if error:
+            # Ajouter l'erreur à l'historique des alertes
+            add_to_history(error, is_alert=True)
+        dashboard.signal_count = signal_count
+        dashboard.error = error
+        dashboard.status_line = None
+    dashboard.refresh()
+
+def set_status_line(message):
+    """Met à jour la ligne d'état en bas du tableau de bord (sans l'ajouter à l'historique)"""
+    if headless:
+        return
+    with _display_lock:
+        dashboard.status_line = message
+    dashboard.refresh()
 
 def get_version():
-    """Récupère la version depuis le dernier tag Git"""
+    """Version inscrite dans le fichier VERSION au déploiement, sinon dernier tag Git
+
+    Le fichier évite de lancer git à chaque démarrage (voir « Déploiement » dans le README).
+    """
+    try:
+        with open(os.path.join(SCRIPT_DIR, "VERSION"), encoding="utf-8") as f:
+            version = f.read().strip()
+        if version:
+            return version
+    except OSError:
+        pass
     try:
         import subprocess
-        result = subprocess.run(['git', 'describe', '--tags', '--abbrev=0'], 
+        result = subprocess.run(['git', 'describe', '--tags', '--abbrev=0'], cwd=SCRIPT_DIR,
                               capture_output=True, text=True)
         if result.returncode == 0:
             return result.stdout.strip()
@@ -395,213 +2215,1737 @@ def get_version():
     except Exception:
         return "version inconnue"
 
-def check_email(mail, webhook_url, mode):
-    global signal_count
+class MonitoredIMAP4_SSL(imaplib.IMAP4_SSL):
+    """Connexion IMAP instrumentée, avec reprise de session TLS
+
+    Chaque commande alimente l'histogramme imap_command_duration_seconds. La session TLS
+    obtenue après le login est conservée par serveur : la connexion suivante la présente et
+    évite une négociation complète (échange de clés et vérification du certificat).
+    """
+
+    # La reprise de session exige le même contexte SSL d'une connexion à l'autre
+    shared_context = ssl.create_default_context()
+    _tls_sessions = {}  # (hôte, port) → dernière session TLS
+    _tls_lock = threading.Lock()
+
+    def __init__(self, host, port=imaplib.IMAP4_SSL_PORT, timeout=IMAP_TIMEOUT):
+        super().__init__(host, port, ssl_context=self.shared_context, timeout=timeout)
+        self.tls_resumed = self.sock.session_reused
+        metrics.inc("imap_tls_handshakes_total", resumed=str(self.tls_resumed).lower())
+
+    def _create_socket(self, timeout):
+        sock = imaplib.IMAP4._create_socket(self, timeout)
+        with self._tls_lock:
+            session = self._tls_sessions.get((self.host, self.port))
+        return self.ssl_context.wrap_socket(sock, server_hostname=self.host, session=session)
+
+    def remember_tls_session(self):
+        """Mémorise la session TLS pour les prochaines connexions
+
+        À appeler après le login : en TLS 1.3, le ticket de session n'est envoyé par le
+        serveur qu'après la négociation, avec les premières réponses.
+        """
+        session = self.sock.session
+        if session is not None and session.has_ticket:
+            with self._tls_lock:
+                self._tls_sessions[(self.host, self.port)] = session
+
+    def select(self, mailbox="INBOX", readonly=False):
+        """SELECT qui conserve UIDVALIDITY, UIDNEXT (et HIGHESTMODSEQ si CONDSTORE) annoncés par le serveur"""
+        status, data = super().select(mailbox, readonly)
+        if status == "OK":
+            self.selected = {name: int(self.untagged_responses[name][-1])
+                             for name in ("UIDVALIDITY", "UIDNEXT", "HIGHESTMODSEQ") if name in self.untagged_responses}
+        return status, data
+
+    def _simple_command(self, name, *args):
+        command = f"UID {args[0]}".upper() if name == "UID" and args else name
+        started = time.perf_counter()
+        try:
+            return super()._simple_command(name, *args)
+        finally:
+            metrics.observe("imap_command_duration_seconds", time.perf_counter() - started, command=command)
+
+def supports_idle(mail):
+    """Indique si le serveur IMAP annonce la capacité IDLE (RFC 2177)"""
+    return "IDLE" in mail.capabilities
+
+def has_buffered_input(mail):
+    """Indique, sans bloquer, si une réponse du serveur attend déjà d'être lue
+
+    select() ne voit ni les lignes déjà lues par imaplib dans son tampon (« + idling » et
+    « * 3 EXISTS » reçus d'un bloc), ni les données déjà déchiffrées par la couche SSL.
+    """
+    sock = mail.socket()
+    timeout = sock.gettimeout()
+    sock.settimeout(0)
     try:
-        # Vérifier la connexion sans ajouter de message
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        sock.settimeout(timeout)
+
+def wait_for_new_mail(mail, timeout, wake=None):
+    """Met la boîte sélectionnée en IDLE jusqu'à l'arrivée d'un nouvel email
+
+    Retourne True dès que le serveur signale un EXISTS/RECENT, False si le délai
+    est écoulé sans nouveauté. L'appelant relance IDLE en boucle, ce qui renouvelle
+    la commande avant le timeout de 29 minutes imposé par la RFC 2177. Un octet écrit
+    sur l'autre extrémité du socket `wake` termine IDLE immédiatement (arrêt depuis
+    un autre thread).
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+
+    # Attente de la réponse de continuation "+ idling"
+    while True:
+        line = mail.readline()
+        if not line:
+            raise mail.abort("Connexion fermée à l'entrée en IDLE")
+        if line.startswith(b"+"):
+            break
+        if line.startswith(tag):
+            raise mail.error(f"IDLE refusé par le serveur : {line.decode(errors='replace').strip()}")
+
+    sock = mail.socket()
+    deadline = time.monotonic() + timeout
+    new_mail = False
+    try:
+        while not new_mail:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not has_buffered_input(mail):
+                readable, _, _ = select.select([sock] + ([wake] if wake else []), [], [], remaining)
+                if not readable:
+                    break
+                if wake in readable:
+                    wake.recv(64)
+                    break
+            line = mail.readline()
+            if not line:
+                raise mail.abort("Connexion fermée pendant IDLE")
+            words = line.split()
+            if len(words) >= 3 and words[0] == b"*" and words[2].upper() in (b"EXISTS", b"RECENT"):
+                new_mail = True
+    except BaseException:
+        # Ctrl+C ou erreur pendant IDLE : on tente de terminer la commande avant de propager,
+        # sinon le serveur attendrait DONE et la déconnexion propre resterait bloquée
         try:
-            mail.noop()
-        except:
-            update_display(mode, webhook_url, signal_count, error=f"[🔄] {get_current_time()} La connexion semble inactive, déclenchement d'une reconnexion...")
-            raise imaplib.IMAP4.error("Connection check failed")
-
-        status, messages = mail.search(None, 'UNSEEN FROM "noreply@tradingview.com"')
-        
-        if status != "OK" or not messages[0]:
-            # Mise à jour de l'affichage sans ajouter à l'historique
-            display_banner()
-            display_status(mode, webhook_url)
-            display_stats(signal_count)
-            display_last_event(None)
-            display_error_zone(None)
-            print(f"[🔍] {get_current_time()} Surveillance active...")
-            return
-
-        # Récupérer tous les IDs d'emails non lus
-        email_ids = messages[0].split()
-        if len(email_ids) > 1:
-            update_display(mode, webhook_url, signal_count, 
-                         last_event=f"[⚠️] {get_current_time()} Attention: {len(email_ids)} emails non lus détectés")
-
-        # On va d'abord identifier le dernier email avec un signal valide
-        last_valid_signal = None
-        last_valid_id = None
-        
-        # Parcourir les emails dans l'ordre inverse
-        for e_id in reversed(email_ids):
-            try:
-                update_display(mode, webhook_url, signal_count, 
-                             last_event=f"[📧] {get_current_time()} Analyse de l'email {format_email_id(e_id)}")
-                
-                status, msg_data = mail.fetch(e_id, '(BODY[])')
-                
-                if not msg_data or not msg_data[0]:
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} msg_data est vide ou invalide")
-                    continue
-
-                # Extraction du contenu brut de l'email
-                raw_email = None
-                for part in msg_data:
-                    if isinstance(part, tuple) and len(part) > 1:
-                        raw_email = part[1]
-                        break
-
-                if not raw_email or not isinstance(raw_email, bytes):
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} Format invalide : raw_email est de type {type(raw_email)} (attendu: bytes)")
-                    continue
-
-                email_msg = email.message_from_bytes(raw_email)
-                
-                # Extraction du signal (corps du message)
-                payload = None
-                if email_msg.is_multipart():
-                    for part in email_msg.walk():
-                        if part.get_content_type() == "text/plain":
-                            payload = part.get_payload(decode=True)
-                            break
-                else:
-                    payload = email_msg.get_payload(decode=True)
+            end_idle(mail, tag)
+        except Exception:
+            pass
+        raise
 
-                if not payload:
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} Aucun contenu text/plain trouvé dans l'email")
-                    continue
+    end_idle(mail, tag)
+    return new_mail
 
-                signal = payload.decode('utf-8').strip()
-                
-                # Vérification du signal
-                if "BUY" in signal:
-                    signal = "BUY"
-                    last_valid_signal = signal
-                    last_valid_id = e_id
-                    update_display(mode, webhook_url, signal_count, 
-                                 last_event=f"[✅] {get_current_time()} Signal {Colors.BOLD}BUY{Colors.ENDC} valide trouvé dans l'email {format_email_id(e_id)}")
-                    break
-                elif "SELL" in signal:
-                    signal = "SELL"
-                    last_valid_signal = signal
-                    last_valid_id = e_id
-                    update_display(mode, webhook_url, signal_count, 
-                                 last_event=f"[✅] {get_current_time()} Signal {Colors.BOLD}SELL{Colors.ENDC} valide trouvé dans l'email {format_email_id(e_id)}")
-                    break
-                else:
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} Pas de signal valide dans cet email")
+def end_idle(mail, tag):
+    """Termine une commande IDLE : le serveur répond par la réponse étiquetée de la commande"""
+    mail.send(b"DONE\r\n")
+    while True:
+        line = mail.readline()
+        if not line:
+            raise mail.abort("Connexion fermée à la sortie d'IDLE")
+        if line.startswith(tag):
+            if not line[len(tag):].strip().upper().startswith(b"OK"):
+                raise mail.error(f"Fin d'IDLE en erreur : {line.decode(errors='replace').strip()}")
+            break
+
+class AmbiguousNumber(ValueError):
+    """Nombre dont la virgule peut être un séparateur de milliers comme une virgule décimale
+
+    Exemple : « 1234,567 », « 1.234,5 » ou « 1.234.567 ». Le signal est alors refusé plutôt
+    qu'envoyé au bot avec un prix peut-être faux d'un facteur mille.
+    """
+
+    def __init__(self, field, value):
+        super().__init__(f"{field} ambigu : {value!r}")
+        self.field = field
+        self.value = value
+        self.uid = None  # Email concerné, renseigné par select_signal()
+
+class AlertParser:
+    """Analyse du texte d'une alerte TradingView : sens, symbole, prix, quantité, stratégie, horodatage
+
+    Deux formats sont reconnus :
+    - un corps JSON (message d'alerte du type {"action": "{{strategy.order.action}}", ...})
+    - du texte libre, analysé par une expression régulière précompilée par champ
+      (remplaçable champ par champ via ALERT_PATTERNS, groupe 1 = valeur)
+    Le sens doit être un mot entier : "BUYSELL ratio" n'est plus pris pour un signal.
+    """
+
+    PATTERNS = {
+        # Forme explicite (side=buy, action: sell), sinon BUY/SELL en majuscules, en mot entier
+        "side": r"\b(?i:side|action|order|ordre|signal)\s*[:=]\s*\"?(?i:(buy|sell))\b|\b(BUY|SELL)\b",
+        "symbol": r"\b(?i:ticker|symbol|symbole)\s*[:=]\s*\"?([A-Za-z0-9._!/-]+(?::[A-Za-z0-9._!/-]+)?)",
+        # Nombre capturé en entier, points et virgules compris : _number() le classe ou le refuse
+        "price": r"\b(?i:price|prix|close)\s*[:=@]?\s*\"?([0-9][0-9.,]*)",
+        "quantity": r"\b(?i:qty|quantity|quantit[ée]|size|contracts)\s*[:=]\s*\"?([0-9][0-9.,]*)",
+        "strategy": r"\b(?i:strategy|strat[ée]gie|strategy_id)\s*[:=]\s*\"?([\w.-]+)",
+        "alert_time": r"\b(?i:time|timenow|timestamp|date)\s*[:=]\s*\"?(\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?Z?)",
+    }
+    # Clés acceptées dans un corps JSON, par champ
+    JSON_KEYS = {
+        "side": ("side", "action", "order_action", "signal"),
+        "symbol": ("symbol", "ticker"),
+        "price": ("price", "close"),
+        "quantity": ("quantity", "qty", "contracts", "size"),
+        "strategy": ("strategy", "strategy_id"),
+        "alert_time": ("alert_time", "time", "timenow", "timestamp"),
+    }
+    NUMERIC = ("price", "quantity")
+    # "65,000", "1,234,567" : virgules séparant des groupes de 3 chiffres (milliers), le premier
+    # groupe ne commençant pas par 0
+    _THOUSANDS_RE = re.compile(r"[+-]?[1-9]\d{0,2}(?:,\d{3})+")
+    # "1234,5", "0,001" : virgule décimale, jamais suivie d'exactement 3 chiffres sauf après un 0 seul
+    _DECIMAL_COMMA_RE = re.compile(r"[+-]?(?:0,\d+|\d+,(?:\d{1,2}|\d{4,}))")
+
+    def __init__(self, patterns=None):
+        self.patterns = {field: re.compile(pattern)
+                         for field, pattern in dict(self.PATTERNS, **(patterns or {})).items()}
+
+    @classmethod
+    def _number(cls, field, value):
+        """Valeur numérique du champ ; lève AmbiguousNumber si la virgule ne permet pas de trancher"""
+        if isinstance(value, (int, float)):
+            return float(value)
+        value = str(value).strip().rstrip(",.")  # "price=1,234, qty=2." : ponctuation
+        if value.count(".") > 1 or "," in value and "." in value:
+            # "1.234,5", "1,234.5", "1.234.567" : séparateurs mêlés ou points de milliers
+            raise AmbiguousNumber(field, value)
+        if "," in value:
+            if cls._THOUSANDS_RE.fullmatch(value):
+                value = value.replace(",", "")
+            elif cls._DECIMAL_COMMA_RE.fullmatch(value):
+                value = value.replace(",", ".")
+            else:
+                raise AmbiguousNumber(field, value)
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    def parse(self, text):
+        """Retourne le signal sous forme de dict (clé "side" toujours présente), ou None sans sens valide
+
+        Lève AmbiguousNumber si le prix ou la quantité ne peut pas être lu sans risque d'erreur.
+        """
+        if not text:
+            return None
+        alert = self._parse_json(text) if text.lstrip().startswith("{") else None
+        if alert is None:
+            alert = {}
+            # Le sens d'abord : un message sans signal ne paie qu'une recherche
+            for field, pattern in self.patterns.items():
+                match = pattern.search(text)
+                if match:
+                    alert[field] = next((group for group in match.groups() if group is not None), match.group(0))
+                elif field == "side":
+                    return None
+        side = str(alert.get("side") or "").upper()
+        if side not in ("BUY", "SELL"):
+            return None
+        alert["side"] = side
+        for field in self.NUMERIC:
+            if field in alert:
+                alert[field] = self._number(field, alert[field])
+        return {field: value for field, value in alert.items() if value is not None}
+
+    def _parse_json(self, text):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        lowered = {str(key).lower(): value for key, value in data.items()}
+        return {field: next((lowered[key] for key in keys if key in lowered), None)
+                for field, keys in self.JSON_KEYS.items()}
+
+alert_parser = AlertParser(ALERT_PATTERNS)
+
+class SignalDeduplicator:
+    """Cache borné, à expiration, des signaux récemment placés dans l'outbox
+
+    Deux clés par signal : le Message-ID de l'email, et (boîte, stratégie, symbole, sens).
+    Dans la fenêtre, un signal déjà vu est un doublon ; un signal de sens opposé annule
+    le précédent s'il n'a pas encore été envoyé (voir submit_signal). La fenêtre part du
+    premier signal : une rafale d'alertes identiques ne la prolonge pas.
+
+    Avec l'écoute HTTP, chaque alerte arrive aussi en deux exemplaires (email et HTTP) :
+    pair() les rapproche par leur contenu complet, sur une fenêtre plus longue
+    (`cross_window`) qui couvre le retard de l'email.
+    """
+
+    def __init__(self, window, max_entries, cross_window=0):
+        self.window = window
+        self.max_entries = max_entries
+        self.cross_window = cross_window
+        self._entries = OrderedDict()  # clé → (instant, clé d'idempotence), par ordre d'insertion
+        self._copies = {}              # (boîte, empreinte) → deque de (instant, source, clé d'idempotence)
+        self._arrivals = deque()       # (instant, boîte, empreinte) par ordre d'arrivée, pour l'expiration
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signal_key(mailbox, signal, side=None):
+        return ("signal", mailbox, signal.get("strategy"), signal.get("symbol"), side or signal["side"])
+
+    def _purge(self, now):
+        while self._entries:
+            key, (moment, _) = next(iter(self._entries.items()))
+            if now - moment < self.window and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def check(self, mailbox, message_id, signal, now=None):
+        """Retourne (décision, clé d'idempotence du signal en cause)
+
+        décision : "new", "duplicate" (même Message-ID ou même signal) ou "opposite" (sens contraire).
+        """
+        if not self.window:
+            return "new", None
+        now = time.time() if now is None else now
+        opposite = "SELL" if signal["side"] == "BUY" else "BUY"
+        with self._lock:
+            self._purge(now)
+            for decision, key in (("duplicate", ("message", message_id) if message_id else None),
+                                  ("duplicate", self._signal_key(mailbox, signal)),
+                                  ("opposite", self._signal_key(mailbox, signal, opposite))):
+                if key in self._entries:
+                    return decision, self._entries[key][1]
+        return "new", None
+
+    def remember(self, mailbox, message_id, signal, idempotency_key, now=None):
+        if not self.window:
+            return
+        now = time.time() if now is None else now
+        with self._lock:
+            if message_id:
+                self._entries[("message", message_id)] = (now, idempotency_key)
+            self._entries[self._signal_key(mailbox, signal)] = (now, idempotency_key)
+            self._purge(now)
+
+    def pair(self, mailbox, signal, source, idempotency_key, now=None):
+        """Rapproche les exemplaires email et HTTP d'une même alerte
+
+        Retourne la clé d'idempotence de l'exemplaire reçu plus tôt par l'autre source (le
+        signal est alors un doublon), sinon None après avoir inscrit celui-ci. Un exemplaire
+        n'en efface qu'un de l'autre source : deux alertes identiques restent deux signaux.
+        """
+        if not self.cross_window:
+            return None
+        now = time.time() if now is None else now
+        fingerprint = (mailbox, json.dumps(signal, sort_keys=True, default=str))
+        with self._lock:
+            while self._arrivals and (now - self._arrivals[0][0] >= self.cross_window
+                                      or len(self._arrivals) > self.max_entries):
+                moment, *expired = self._arrivals.popleft()
+                expired = tuple(expired)
+                copies = self._copies.get(expired)
+                # Exemplaire pas encore rapproché : les plus anciens sont déjà partis, c'est la tête de sa file
+                if copies and copies[0][0] <= moment:
+                    copies.popleft()
+                if not copies:
+                    self._copies.pop(expired, None)
+            copies = self._copies.setdefault(fingerprint, deque())
+            for i, (_, copy_source, copy_key) in enumerate(copies):
+                if copy_source != source:
+                    del copies[i]
+                    return copy_key
+            copies.append((now, source, idempotency_key))
+            self._arrivals.append((now, *fingerprint))
+        return None
+
+    def cancel(self, mailbox, signal):
+        """Oublie le signal de sens opposé, annulé par `signal`"""
+        opposite = "SELL" if signal["side"] == "BUY" else "BUY"
+        with self._lock:
+            self._entries.pop(self._signal_key(mailbox, signal, opposite), None)
+
+deduplicator = SignalDeduplicator(DEDUP_WINDOW, DEDUP_MAX_ENTRIES)
+
+def split_stale(email_ids, received, now=None):
+    """Sépare (emails récents, emails périmés) d'après leur INTERNALDATE ({uid: epoch})
+
+    Un email est périmé s'il a été reçu plus de SIGNAL_MAX_AGE secondes avant `now` ; sans
+    date connue (rejeu), il est considéré comme récent. Avec STALE_SIGNAL_POLICY = "send",
+    rien n'est périmé.
+    """
+    if STALE_SIGNAL_POLICY == "send" or not SIGNAL_MAX_AGE:
+        return list(email_ids), []
+    limit = (time.time() if now is None else now) - SIGNAL_MAX_AGE
+    fresh, stale = [], []
+    for e_id in email_ids:
+        moment = received.get(int(e_id))
+        (stale if moment is not None and moment < limit else fresh).append(e_id)
+    return fresh, stale
+
+def catchup_fields(message, now=None):
+    """Champs ajoutés à un signal rapproché après coup (STALE_SIGNAL_POLICY = "reconcile")"""
+    return {"catchup": True, "alert_age": round((time.time() if now is None else now) - message["received_at"])}
+
+def is_superseded(account, signal, message):
+    """Un signal du même symbole est-il parti vers l'outbox après la réception de cet email ?"""
+    return account.last_queued_at.get(signal.get("symbol"), 0) > message["received_at"]
+
+def select_signal(email_ids, messages):
+    """Retourne (signal, uid) du dernier email contenant un signal valide, ou (None, None)
+
+    Le signal est le dict produit par AlertParser.parse() : c'est la charge utile envoyée au webhook.
+    Si le dernier signal a un prix ou une quantité ambigus, AmbiguousNumber est levée (avec l'UID
+    de l'email) : un signal plus ancien ne doit pas partir à sa place.
+    """
+    for e_id in reversed(email_ids):
+        try:
+            alert = alert_parser.parse(messages.get(int(e_id), {}).get("text"))
+        except AmbiguousNumber as e:
+            e.uid = e_id
+            raise
+        if alert:
+            return alert, e_id
+    return None, None
+
+def reject_signal(account, error, origin):
+    """Signal refusé pour une valeur ambiguë : événement, métrique et email d'alerte ; retourne le message affiché"""
+    metrics.inc("signals_rejected_total", reason="ambiguous_number", account=account.name)
+    log_event("signal_rejected", level=logging.WARNING, mailbox=account.key, reason="ambiguous_number",
+              field=error.field, value=error.value, uid=int(error.uid) if error.uid is not None else None)
+    send_alert_email(f"⚠️ Signal TradingView à vérifier ({account.name})",
+                     f"Le signal de {origin} n'a pas été transmis au bot : {error}.\n\n"
+                     "La virgule peut y séparer les milliers comme les décimales. Vérifiez l'alerte et, si besoin, "
+                     "passez l'ordre manuellement.\n\nCe message est automatique, merci de ne pas y répondre.")
+    return f"[🔎] {get_current_time()} Signal de {origin} non transmis : {error} (à vérifier manuellement)"
+
+def report_unconfirmed_signal(account_name, side, uid, error):
+    """Email de vérification d'un signal peut-être exécuté par le bot, qui ne sera pas renvoyé"""
+    origin = f"l'email {format_email_id(uid)}" if uid is not None else "l'alerte HTTP"
+    send_alert_email(f"⚠️ Signal TradingView à vérifier ({account_name})",
+                     f"Le signal {side} de {origin} a peut-être été exécuté par le bot sans que la réponse ne "
+                     f"parvienne au moniteur : {error}.\n\nIl n'est pas renvoyé pour ne pas passer l'ordre deux "
+                     "fois. Vérifiez vos positions et, si besoin, passez l'ordre manuellement.\n\n"
+                     "Ce message est automatique, merci de ne pas y répondre.")
+
+def submit_signal(outbox, account, signal, idempotency_key, source, uid=None, message_id=None, now=None,
+                  extra=None, **marks):
+    """Dédoublonnage, limites et mise en outbox d'un signal, qu'il vienne d'un email ou d'une alerte HTTP
+
+    `extra` complète la charge utile sans entrer dans le dédoublonnage (champs de rattrapage),
+    `marks` sont les jalons de LatencyRecorder déjà connus. Retourne (issue, messages
+    d'affichage), l'issue valant "queued", "coalesced", "limited" ou "duplicate" ; seul un
+    signal "queued" attend encore son envoi. `outbox` n'a besoin que d'une méthode notify() :
+    OutboxWorker, ou le moteur async.
+    """
+    mailbox_key = account.key
+    side = signal["side"]
+    origin = f"l'email {format_email_id(uid)}" if uid is not None else "l'alerte HTTP"
+    notices = []
+    # Même alerte reçue par l'autre source : un exemplaire en efface un seul de l'autre
+    paired_key = deduplicator.pair(mailbox_key, signal, source, idempotency_key, now)
+    if paired_key is not None:
+        decision, previous_key = "cross_source", paired_key
+    else:
+        decision, previous_key = deduplicator.check(mailbox_key, message_id, signal, now)
+    # Un signal opposé déjà parti vers le bot n'est plus annulable : le nouveau est alors légitime
+    cancelled = cancel_outbox_entry(previous_key) if decision == "opposite" else None
+    if decision == "opposite" and cancelled is None:
+        decision = "new"
+    if decision != "new":
+        metrics.inc("signals_coalesced_total", decision=decision, account=account.name)
+        log_event("signal_coalesced", side=side, uid=uid, mailbox=mailbox_key, source=source,
+                  decision=decision, previous_key=previous_key, idempotency_key=idempotency_key)
+        if decision == "opposite":
+            deduplicator.cancel(mailbox_key, signal)
+            limiter.release(mailbox_key, *cancelled)
+            latency.discard(previous_key)
+            notices.append(("last_event", f"[⇄] {get_current_time()} Signal {Colors.BOLD}{side}{Colors.ENDC} de {origin} annulé avec le signal opposé encore en attente"))
+        elif decision == "cross_source":
+            notices.append(("last_event", f"[♻️] {get_current_time()} Signal {Colors.BOLD}{side}{Colors.ENDC} de {origin} déjà reçu par {'email' if source == 'http' else 'HTTP'}, ignoré"))
+        else:
+            notices.append(("last_event", f"[♻️] {get_current_time()} Signal {Colors.BOLD}{side}{Colors.ENDC} de {origin} en double dans la fenêtre de {DEDUP_WINDOW}s, ignoré"))
+        return "coalesced", notices
+    if not check_signal_limit(account, signal, now):
+        notices.append(("last_event", f"[✓] {get_current_time()} Signal de {origin} ignoré (limite de signaux atteinte)"))
+        return "limited", notices
+    # Chronométrage ouvert avant l'enqueue : l'outbox peut envoyer le signal immédiatement
+    latency.begin(idempotency_key, **marks)
+    if not enqueue_signal(mailbox_key, uid, side, dict(signal, **extra) if extra else signal, idempotency_key):
+        latency.discard(idempotency_key)
+        log_event("duplicate_signal", side=side, uid=uid, mailbox=mailbox_key, source=source,
+                  idempotency_key=idempotency_key)
+        notices.append(("last_event", f"[♻️] {get_current_time()} Signal de {origin} déjà traité, ignoré"))
+        return "duplicate", notices
+    deduplicator.remember(mailbox_key, message_id, signal, idempotency_key, now)
+    account.last_queued_at[signal.get("symbol")] = time.time()
+    outbox.notify()
+    log_event("signal_queued", side=side, uid=uid, mailbox=mailbox_key, source=source, idempotency_key=idempotency_key)
+    notices.append(("last_event", f"[🎯] {get_current_time()} Signal {Colors.BOLD}{side}{Colors.ENDC} transmis à l'outbox"))
+    return "queued", notices
+
+def process_alerts(outbox, account, email_ids, messages, watermark, detected_at, fetched_at, now=None):
+    """Analyse un lot d'emails, place le signal retenu dans l'outbox et avance le filigrane
+
+    Retourne (uids à marquer comme lus, messages d'affichage). Ne touche pas à la connexion
+    IMAP : l'appelant se charge du STORE. `now` est l'instant de référence du dédoublonnage
+    et des budgets (date de l'email en rejeu, horloge par défaut).
+    """
+    mailbox_key = account.key
+    # Les messages d'affichage sont accumulés et rendus après l'envoi du signal
+    notices = []
+    log_event("new_emails", mailbox=mailbox_key, count=len(email_ids))
+    if len(email_ids) > 1:
+        notices.append(("last_event", f"[⚠️] {get_current_time()} Attention: {len(email_ids)} nouveaux emails détectés"))
+
+    # Identifier le dernier email avec un signal valide (parcours dans l'ordre inverse), les emails
+    # reçus avant une coupure ne comptant que si aucun email récent ne porte de signal
+    fresh_ids, stale_ids = split_stale(email_ids, {uid: message.get("received_at") for uid, message in messages.items()}, now)
+    rejected = None
+    try:
+        signal, last_valid_id = select_signal(fresh_ids, messages)
+        from_stale = signal is None and bool(stale_ids)
+        if from_stale:
+            signal, last_valid_id = select_signal(stale_ids, messages)
+    except AmbiguousNumber as e:
+        signal, last_valid_id, from_stale, rejected = None, None, False, e
+    extra = None
+    stale_skipped = False
+    if from_stale:
+        if signal:
+            message = messages[int(last_valid_id)]
+            age = round(time.time() - message["received_at"])
+            if STALE_SIGNAL_POLICY == "reconcile" and not is_superseded(account, signal, message):
+                extra = catchup_fields(message)
+            else:
+                action = "skipped" if STALE_SIGNAL_POLICY != "reconcile" else "superseded"
+                metrics.inc("stale_signals_total", action=action, account=account.name)
+                log_event("stale_signal", side=signal["side"], uid=int(last_valid_id), mailbox=mailbox_key,
+                          age=age, action=action)
+                notices.append(("last_event", f"[⌛] {get_current_time()} Signal {Colors.BOLD}{signal['side']}{Colors.ENDC} de l'email {format_email_id(last_valid_id)} reçu il y a {age}s, ignoré"
+                                              + (f" (plus de {SIGNAL_MAX_AGE}s)" if action == "skipped" else " (remplacé par un signal plus récent)")))
+                signal, last_valid_id = None, None
+                stale_skipped = True
+    last_valid_signal = signal["side"] if signal else None
+    parsed_at = time.time()
+
+    # Emails ignorés marqués comme lus en une seule commande STORE ; l'email du signal
+    # ne l'est qu'une fois le signal sorti de l'outbox (voir commit_outbox_flags)
+    # L'email d'un signal refusé reste non lu, pour vérification manuelle
+    seen_ids = [e_id for e_id in email_ids if e_id != last_valid_id and (rejected is None or e_id != rejected.uid)]
+
+    if last_valid_signal:
+        log_event("signal_detected", uid=int(last_valid_id), mailbox=mailbox_key, source="email", **signal, **(extra or {}))
+        metrics.inc("signals_detected_total", side=last_valid_signal, account=account.name, source="email")
+        notices.append(("last_event", f"[✅] {get_current_time()} Signal {Colors.BOLD}{last_valid_signal}{Colors.ENDC} valide trouvé dans l'email {format_email_id(last_valid_id)}"))
+        # Clé d'idempotence : Message-ID, sinon UID dans la boîte (stable tant que UIDVALIDITY l'est)
+        message = messages.get(int(last_valid_id), {})
+        idempotency_key = message.get("message_id") or f"{mailbox_key}:{watermark[0]}:{int(last_valid_id)}"
+        outcome, signal_notices = submit_signal(outbox, account, signal, idempotency_key, "email", uid=int(last_valid_id),
+                                                message_id=message.get("message_id"), now=now, extra=extra,
+                                                sent=message.get("sent_at"), internaldate=message.get("received_at"),
+                                                detected=detected_at, fetched=fetched_at, parsed=parsed_at)
+        notices += signal_notices
+        if outcome != "queued":
+            seen_ids.append(last_valid_id)
+        elif extra:
+            metrics.inc("stale_signals_total", action="reconciled", account=account.name)
+    elif rejected is not None:
+        notices.append(("error", reject_signal(account, rejected, f"l'email {format_email_id(rejected.uid)}")))
+    elif not stale_skipped:
+        log_event("no_signal", mailbox=mailbox_key, count=len(email_ids))
+        notices.append(("error", f"[❌] {get_current_time()} Pas de signal valide dans les {len(email_ids)} nouveaux emails"
+                                 if len(email_ids) > 1 else f"[❌] {get_current_time()} Pas de signal valide dans cet email"))
+
+    # Le signal est durablement enregistré dans l'outbox : le filigrane peut avancer
+    save_watermark(mailbox_key, watermark)
+    return seen_ids, notices
+
+def mark_seen(mail, mailbox_key, seen_ids, notices):
+    """Marque comme lus, en une seule commande STORE, les emails ignorés d'un ou plusieurs lots"""
+    try:
+        mail.uid("STORE", format_message_set(seen_ids), "+FLAGS.SILENT", "(\\Seen)")
+        log_event("flagged", mailbox=mailbox_key, uids=[int(e_id) for e_id in seen_ids], reason="ignored")
+        notices.append(("last_event", f"[✓] {get_current_time()} {len(seen_ids)} email(s) marqué(s) comme lu(s)"))
+    except Exception as e:
+        notices.append(("error", f"[❌] {get_current_time()} Erreur lors du marquage des emails {format_message_set(seen_ids)} : {e}"))
 
-            except Exception as e:
-                update_display(mode, webhook_url, signal_count, 
-                             error=f"[❌] {get_current_time()} Erreur lors de l'analyse de l'email {format_email_id(e_id)}: {e}")
-                continue
+def render_notices(mode, webhook_url, notices):
+    for kind, message in notices:
+        update_display(mode, webhook_url, signal_count, **{kind: message})
 
-        # Marquer les autres emails comme lus
-        for e_id in email_ids:
-            if e_id != last_valid_id:
-                try:
-                    mail.store(e_id, "+FLAGS", "\\Seen")
-                    update_display(mode, webhook_url, signal_count, 
-                                 last_event=f"[✓] {get_current_time()} Email {format_email_id(e_id)} marqué comme lu (ignoré)")
-                except Exception as e:
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} Erreur lors du marquage de l'email {format_email_id(e_id)}: {e}")
+def poll_mailbox(mail, mode, account, saved=None):
+    """Cherche les nouveaux emails TradingView et récupère leur texte
 
-        # Traiter le dernier signal valide
-        if last_valid_signal and last_valid_id:
-            if not check_signal_limit(last_valid_signal):
-                try:
-                    mail.store(last_valid_id, "+FLAGS", "\\Seen")
-                    update_display(mode, webhook_url, signal_count, 
-                                 last_event=f"[✓] {get_current_time()} Email marqué comme lu (limite de signaux atteinte)")
-                except Exception as e:
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} Erreur lors du marquage de l'email : {e}")
-                return
+    Retourne None si la boîte n'a pas bougé, sinon (uids, messages, filigrane, détection, fetch).
+    """
+    # La recherche UID sert aussi de vérification de la connexion (plus besoin de NOOP)
+    try:
+        commit_outbox_flags(mail, account.key)
+        email_ids, watermark = find_new_uids(mail, account, saved)
+    except (imaplib.IMAP4.abort, OSError):
+        update_display(mode, account.webhook_url, signal_count, error=f"[🔄] {get_current_time()} La connexion semble inactive, déclenchement d'une reconnexion...")
+        raise imaplib.IMAP4.error("Connection check failed")
+
+    if email_ids is None:
+        # Mise à jour de l'affichage sans ajouter à l'historique
+        set_status_line(f"[🔍] {get_current_time()} Surveillance active...")
+        return None
+
+    detected_at = time.time()
+    if len(email_ids) > CATCHUP_THRESHOLD:
+        # Arriéré après une coupure : tri sur les seules dates de réception, les emails périmés
+        # partent en rattrapage et la surveillance reprend aussitôt avec les récents
+        email_ids, stale_ids = split_stale(email_ids, fetch_internaldates(mail, email_ids))
+        if stale_ids:
+            catchup.submit(account, stale_ids, watermark[0])
+    # Récupération groupée du texte de tous les emails candidats
+    messages = fetch_alert_messages(mail, email_ids)
+    return email_ids, messages, watermark, detected_at, time.time()
+
+def check_email(mail, outbox, mode, account):
+    webhook_url = account.webhook_url
+    try:
+        batch = poll_mailbox(mail, mode, account)
+        if batch is None:
+            return
+        email_ids, messages, watermark, detected_at, fetched_at = batch
+        if not email_ids:
+            # Nouveaux messages sans alerte TradingView : on avance simplement le filigrane
+            save_watermark(account.key, watermark)
+            set_status_line(f"[🔍] {get_current_time()} Surveillance active...")
+            return
 
-            update_display(mode, webhook_url, signal_count, 
-                         last_event=f"[🎯] {get_current_time()} Traitement du signal {Colors.BOLD}{last_valid_signal}{Colors.ENDC}")
-            payload = {"side": last_valid_signal}
-            
-            try:
-                response = requests.post(webhook_url, json=payload, headers=HEADERS)
-                if response.status_code == 200:
-                    mail.store(last_valid_id, "+FLAGS", "\\Seen")
-                    signal_count += 1
-                    add_to_signal_history(last_valid_signal)  # Ajouter le signal à l'historique
-                    update_display(mode, webhook_url, signal_count, 
-                                 last_event=f"[🚀] {get_current_time()} Signal {last_valid_signal} envoyé avec succès")
-                else:
-                    update_display(mode, webhook_url, signal_count, 
-                                 error=f"[❌] {get_current_time()} Erreur lors de l'envoi : code {response.status_code}\n[📝] Réponse : {response.text}")
-            except requests.exceptions.ConnectionError:
-                update_display(mode, webhook_url, signal_count, 
-                             error=f"[❌] {get_current_time()} Impossible de se connecter au serveur webhook : {webhook_url}\n[💡] Vérifiez que le serveur est bien en ligne et accessible")
-            except Exception as e:
-                update_display(mode, webhook_url, signal_count, 
-                             error=f"[❌] {get_current_time()} Erreur lors de l'envoi au webhook : {str(e)}")
+        seen_ids, notices = process_alerts(outbox, account, email_ids, messages, watermark, detected_at, fetched_at)
+        if seen_ids:
+            mark_seen(mail, account.key, seen_ids, notices)
+        render_notices(mode, webhook_url, notices)
 
     except Exception as e:
         update_display(mode, webhook_url, signal_count, 
                       error=f"[❌] {get_current_time()} Erreur lors de la vérification des emails : {str(e)}")
         raise
 
-def main():
-    args = parse_arguments()
-    webhook_url = get_webhook_url(args.mode)
-    
-    reconnect_delay = RECONNECT_DELAY
+class CatchUpWorker:
+    """Rattrapage en arrière-plan des arriérés d'emails après une coupure
+
+    poll_mailbox() ne garde en direct que les emails récents ; les emails reçus plus de
+    SIGNAL_MAX_AGE secondes plus tôt sont confiés à ce thread, qui travaille sur sa propre
+    connexion IMAP : l'arrivée d'une nouvelle alerte n'attend jamais la fin du rattrapage.
+    - "skip" : tout l'arriéré est marqué comme lu, en une seule commande STORE
+    - "reconcile" : le signal le plus récent de l'arriéré est d'abord cherché (texte récupéré
+      par paquets de CHUNK, du plus récent au plus ancien) puis transmis avec les champs
+      catchup et alert_age, sauf si un signal plus récent du même symbole est déjà parti
+    """
+
+    CHUNK = 50     # Emails dont le texte est récupéré par FETCH pendant la recherche du dernier signal
+    ATTEMPTS = 3   # Tentatives (connexion comprise) avant de laisser l'arriéré non lu
+
+    def __init__(self):
+        self.outbox = None
+        self.mode = None
+        self._jobs = queue.Queue()
+
+    def start(self, outbox, mode):
+        self.outbox = outbox
+        self.mode = mode
+        threading.Thread(target=self._run, name="catchup", daemon=True).start()
+
+    def submit(self, account, uids, uidvalidity):
+        """Confie un arriéré au rattrapage (appelé par la boucle de surveillance, qui n'attend pas)"""
+        log_event("catchup_started", mailbox=account.key, emails=len(uids), policy=STALE_SIGNAL_POLICY)
+        add_to_history(f"[⏩] {get_current_time()} {len(uids)} emails reçus pendant l'interruption : rattrapage en arrière-plan", is_alert=True)
+        self._jobs.put((account, uids, uidvalidity))
+
+    def _run(self):
+        while True:
+            account, uids, uidvalidity = self._jobs.get()
+            for attempt in range(1, self.ATTEMPTS + 1):
+                try:
+                    self._catch_up(account, uids, uidvalidity)
+                    break
+                except (imaplib.IMAP4.error, OSError) as e:
+                    log_event("catchup_failed", level=logging.WARNING, mailbox=account.key, attempt=attempt, error=str(e))
+                    if attempt == self.ATTEMPTS:
+                        # Aucun signal envoyé : les emails restent simplement non lus
+                        update_display(self.mode, account.webhook_url, signal_count,
+                                       error=f"[❌] {get_current_time()} Rattrapage de {len(uids)} emails abandonné : {e}")
+                    else:
+                        time.sleep(next_reconnect_delay(attempt))
+
+    def _catch_up(self, account, uids, uidvalidity):
+        started = time.monotonic()
+        mail = ConnectionManager(account, standby=False).open()
+        try:
+            queued_uid = None
+            if STALE_SIGNAL_POLICY == "reconcile":
+                queued_uid = self._reconcile(mail, account, uids, uidvalidity)
+            # L'email du signal rapproché est marqué par l'outbox une fois le signal envoyé
+            flagged = [uid for uid in uids if uid != queued_uid]
+            if flagged:
+                mail.uid("STORE", format_message_set(flagged), "+FLAGS.SILENT", "(\\Seen)")
+        finally:
+            logout_quietly(mail)
+        metrics.inc("catchup_emails_total", len(uids), account=account.name)
+        log_event("catchup_finished", mailbox=account.key, emails=len(uids), flagged=len(flagged),
+                  reconciled=queued_uid is not None, seconds=round(time.monotonic() - started, 3))
+        update_display(self.mode, account.webhook_url, signal_count,
+                       last_event=f"[⏩] {get_current_time()} Rattrapage terminé : {len(flagged)} emails en retard marqués comme lus")
+
+    def _reconcile(self, mail, account, uids, uidvalidity):
+        """Transmet le signal le plus récent de l'arriéré ; retourne l'UID de son email s'il est en outbox"""
+        for end in range(len(uids), 0, -self.CHUNK):
+            chunk = uids[max(0, end - self.CHUNK):end]
+            messages = fetch_alert_messages(mail, chunk)
+            try:
+                signal, uid = select_signal(chunk, messages)
+            except AmbiguousNumber as e:
+                update_display(self.mode, account.webhook_url, signal_count,
+                               error=reject_signal(account, e, f"l'email en retard {format_email_id(e.uid)}"))
+                return None
+            if signal:
+                break
+        else:
+            return None
+        message = messages[int(uid)]
+        if is_superseded(account, signal, message):
+            # Un signal plus récent du même symbole est parti entre-temps (en direct, ou par HTTP) : il fait foi
+            metrics.inc("stale_signals_total", action="superseded", account=account.name)
+            log_event("stale_signal", side=signal["side"], uid=int(uid), mailbox=account.key, action="superseded")
+            return None
+        extra = catchup_fields(message)
+        log_event("signal_detected", uid=int(uid), mailbox=account.key, source="email", **signal, **extra)
+        metrics.inc("signals_detected_total", side=signal["side"], account=account.name, source="email")
+        idempotency_key = message.get("message_id") or f"{account.key}:{uidvalidity}:{int(uid)}"
+        outcome, notices = submit_signal(self.outbox, account, signal, idempotency_key, "email", uid=int(uid),
+                                         message_id=message.get("message_id"), extra=extra)
+        render_notices(self.mode, account.webhook_url, notices)
+        if outcome != "queued":
+            return None
+        metrics.inc("stale_signals_total", action="reconciled", account=account.name)
+        return uid
+
+catchup = CatchUpWorker()
+
+# Réception directe des alertes webhook de TradingView, en parallèle de l'IMAP
+class AlertIngestHandler(BaseHTTPRequestHandler):
+    """Reçoit les alertes webhook natives de TradingView (POST /alert, corps = message de l'alerte)
+
+    TradingView ne permet pas d'ajouter d'en-tête : le secret HTTP_INGEST_TOKEN est lu dans
+    l'URL (?token=...), dans l'en-tête X-WEBHOOK-TOKEN ou dans un champ "token" ou
+    "passphrase" du corps JSON. Le signal suit ensuite le chemin d'un email (submit_signal) :
+    dédoublonnage, limites, outbox. La réponse part dès l'inscription dans l'outbox, sans
+    attendre le webhook.
+    """
+
+    protocol_version = "HTTP/1.1"   # Connexion keep-alive pour les expéditeurs qui la réutilisent
+    disable_nagle_algorithm = True  # En-têtes et corps partent sans attendre l'ACK du client
+    STATUS = {"queued": 202, "coalesced": 200, "duplicate": 200, "limited": 429}
+
+    def do_POST(self):
+        received_at = time.time()
+        started = time.perf_counter()
+        try:
+            status, outcome, reply, account, notices = self._handle(received_at)
+        except Exception as e:
+            status, outcome, reply, account, notices = 500, "error", {}, None, []
+            update_display(self.server.mode, None, signal_count,
+                           error=f"[❌] {get_current_time()} Erreur lors de la réception d'une alerte HTTP : {e}")
+        body = json.dumps(dict(reply, status=outcome)).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # Métriques et affichage après la réponse : TradingView n'attend pas le rendu
+        metrics.observe("http_ingest_duration_seconds", time.perf_counter() - started, outcome=outcome)
+        metrics.inc("http_alerts_total", outcome=outcome)
+        if account is not None:
+            render_notices(self.server.mode, account.webhook_url, notices)
+
+    def _client_address(self):
+        # Derrière ngrok ou un reverse proxy local, l'adresse d'origine est dans X-Forwarded-For.
+        # Chaque proxy ajoute à droite l'adresse qu'il voit : seules les HTTP_INGEST_TRUSTED_PROXIES
+        # dernières entrées sont fiables, celles de gauche viennent du client et peuvent être forgées.
+        address = self.client_address[0]
+        if address not in ("127.0.0.1", "::1") or HTTP_INGEST_TRUSTED_PROXIES <= 0:
+            return address
+        forwarded = [entry.strip() for header in self.headers.get_all("X-Forwarded-For", [])
+                     for entry in header.split(",") if entry.strip()]
+        if len(forwarded) < HTTP_INGEST_TRUSTED_PROXIES:
+            return address  # Moins d'entrées que de proxys : origine inconnue, l'adresse locale n'est pas autorisée
+        return forwarded[-HTTP_INGEST_TRUSTED_PROXIES]
+
+    def _handle(self, received_at):
+        """Retourne (code HTTP, issue, réponse JSON, compte, messages d'affichage)"""
+        url = urlsplit(self.path)
+        if url.path != "/alert":
+            return 404, "not_found", {}, None, []
+        if HTTP_INGEST_ALLOWED_IPS and self._client_address() not in HTTP_INGEST_ALLOWED_IPS:
+            self.close_connection = True
+            return 403, "forbidden", {}, None, []
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            self.close_connection = True
+            return 411, "length_required", {}, None, []
+        if int(length) > HTTP_INGEST_MAX_BODY:
+            self.close_connection = True  # Corps non lu : la connexion ne peut pas resservir
+            return 413, "too_large", {}, None, []
+        text = self.rfile.read(int(length)).decode("utf-8", "replace")
+
+        query = parse_qs(url.query)
+        token = (query.get("token") or [None])[0] or self.headers.get("X-WEBHOOK-TOKEN")
+        if token is None and text.lstrip().startswith("{"):
+            try:
+                data = json.loads(text)
+                token = data.get("token") or data.get("passphrase") if isinstance(data, dict) else None
+            except ValueError:
+                pass
+        if not isinstance(token, str) or not hmac.compare_digest(token.encode(), HTTP_INGEST_TOKEN.encode()):
+            log_event("http_alert_rejected", level=logging.WARNING, reason="unauthorized", client=self._client_address())
+            return 401, "unauthorized", {}, None, []
+
+        name = (query.get("account") or [None])[0]
+        account = next((account for account in accounts.values() if name in (None, account.name)), None)
+        if account is None:
+            return 404, "unknown_account", {}, None, []
+        try:
+            signal = alert_parser.parse(text)
+        except AmbiguousNumber as e:
+            return 422, "ambiguous_number", {"field": e.field, "value": e.value}, account, [
+                ("error", reject_signal(account, e, "l'alerte HTTP"))]
+        if signal is None:
+            log_event("no_signal", mailbox=account.key, source="http", count=1)
+            return 422, "no_signal", {}, account, [("error", f"[❌] {get_current_time()} Pas de signal valide dans l'alerte HTTP")]
+
+        log_event("signal_detected", mailbox=account.key, source="http", **signal)
+        metrics.inc("signals_detected_total", side=signal["side"], account=account.name, source="http")
+        idempotency_key = f"http:{uuid.uuid4().hex}"
+        outcome, notices = submit_signal(self.server.outbox, account, signal, idempotency_key, "http",
+                                         now=received_at, fetched=received_at, parsed=time.time())
+        return self.STATUS[outcome], outcome, {"idempotency_key": idempotency_key}, account, notices
+
+    def log_message(self, format, *args):
+        pass  # Chaque alerte est déjà tracée par log_event
+
+def start_ingest_server(host, port, outbox, mode):
+    """Lance l'écoute des alertes HTTP dans un thread en arrière-plan (un thread par connexion)"""
+    server = ThreadingHTTPServer((host, port), AlertIngestHandler)
+    server.daemon_threads = True
+    server.outbox = outbox
+    server.mode = mode
+    threading.Thread(target=server.serve_forever, name="alert-ingest", daemon=True).start()
+    return server
+
+class ConnectionManager:
+    """Connexions IMAP d'un compte : connexion de secours, sonde de santé et maintien adaptatif
+
+    - une connexion de secours (IMAP_STANDBY) est ouverte, authentifiée et positionnée sur le
+      dossier en arrière-plan : à la panne de la connexion active, la bascule ne coûte qu'un NOOP
+    - la sonde garde cette connexion vivante par des NOOP espacés d'un intervalle adaptatif,
+      divisé par deux quand la connexion a été coupée entre deux sondes (serveur, NAT),
+      allongé progressivement tant qu'elle tient
+    - la connexion active, en IDLE, est renouvelée selon le même principe : un IDLE coupé
+      avant son terme raccourcit les suivants
+    - chaque nouvelle connexion reprend la session TLS précédente (MonitoredIMAP4_SSL)
+    L'état (filigrane, compteurs, outbox) vit dans la base locale : une reconnexion ne relit
+    jamais la boîte.
+    """
+
+    def __init__(self, account, standby=IMAP_STANDBY):
+        self.account = account
+        self.standby_enabled = standby
+        self.keepalive = STANDBY_KEEPALIVE   # Intervalle courant des NOOP de la connexion de secours
+        self.idle_timeout = IDLE_TIMEOUT     # Durée courante d'un IDLE de la connexion active
+        self._standby = None
+        self._first = None                   # Connexion initiale ouverte pendant le démarrage (prefetch)
+        self._lock = threading.Lock()        # Tenu pendant les NOOP de la sonde : pas de bascule concurrente
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.standby_enabled:
+            threading.Thread(target=self._probe, name=f"imap-standby-{self.account.name}", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            mail, self._standby = self._standby, None
+        logout_quietly(mail)
+        first, self._first = self._first, None
+        if first is not None and first.done() and first.exception() is None:
+            logout_quietly(first.result())
+
+    def prefetch(self):
+        """Ouvre la première connexion en arrière-plan, pendant que le programme s'initialise"""
+        first = self._first = Future()
+
+        def run():
+            try:
+                first.set_result(self.open())
+            except BaseException as e:
+                first.set_exception(e)
+        threading.Thread(target=run, name=f"imap-prefetch-{self.account.name}", daemon=True).start()
+
+    def open(self):
+        """Nouvelle connexion authentifiée, dossier du compte sélectionné"""
+        mail = MonitoredIMAP4_SSL(self.account.imap_server)
+        try:
+            mail.login(self.account.email, self.account.password)
+            mail.remember_tls_session()
+            mail.select(quote_mailbox(self.account.folder))
+        except BaseException:
+            logout_quietly(mail)
+            raise
+        return mail
+
+    def connect(self):
+        """Connexion prête à l'emploi ; retourne (mail, True si c'est la connexion de secours)"""
+        if self._first is not None:
+            # Connexion initiale déjà ouverte (ou en cours) : pas de NOOP, elle vient d'être établie ;
+            # en cas d'échec, l'erreur suit le chemin habituel de reconnexion
+            first, self._first = self._first, None
+            mail = first.result()
+            self._wake.set()
+            return mail, False
+        with self._lock:
+            mail, self._standby = self._standby, None
+        from_standby = False
+        if mail is not None:
+            try:
+                mail.noop()
+                from_standby = True
+            except (imaplib.IMAP4.error, OSError):
+                logout_quietly(mail)
+                self._shorten_keepalive()
+        if not from_standby:
+            mail = self.open()
+        self._wake.set()  # La sonde prépare la connexion de secours suivante
+        return mail, from_standby
+
+    def idle(self, mail, wake=None):
+        """IDLE de la connexion active, d'une durée adaptée aux coupures observées"""
+        started = time.monotonic()
+        try:
+            new_mail = wait_for_new_mail(mail, self.idle_timeout, wake)
+        except (imaplib.IMAP4.abort, OSError):
+            elapsed = time.monotonic() - started
+            # Coupure en plein IDLE : un équipement réseau ferme sans doute les connexions inactives
+            if elapsed >= KEEPALIVE_MIN:
+                self.idle_timeout = max(KEEPALIVE_MIN, min(self.idle_timeout, elapsed * 0.8))
+                log_event("keepalive_adjusted", account=self.account.name, idle_timeout=round(self.idle_timeout))
+            raise
+        if time.monotonic() - started >= self.idle_timeout:
+            self.idle_timeout = min(IDLE_TIMEOUT, self.idle_timeout * 1.25)
+        return new_mail
+
+    def _shorten_keepalive(self):
+        self.keepalive = max(KEEPALIVE_MIN, self.keepalive / 2)
+        log_event("keepalive_adjusted", account=self.account.name, standby_keepalive=round(self.keepalive))
+
+    def _probe(self):
+        # La connexion de secours n'est ouverte qu'après la connexion active, sans la concurrencer
+        self._wake.wait()
+        self._wake.clear()
+        failures = 0
+        while not self._stop.is_set():
+            with self._lock:
+                mail = self._standby
+                if mail is not None:
+                    try:
+                        mail.noop()
+                        self.keepalive = min(KEEPALIVE_MAX, self.keepalive * 1.25)
+                    except (imaplib.IMAP4.error, OSError):
+                        self._standby = None
+                        logout_quietly(mail)
+                        self._shorten_keepalive()
+                        metrics.inc("imap_standby_lost_total", account=self.account.name)
+                        continue
+            if mail is None:
+                try:
+                    mail = self.open()
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    log_event("standby_failed", level=logging.WARNING, account=self.account.name, error=str(e))
+                    self._wake.wait(min(RECONNECT_DELAY * 2 ** (failures - 1), MAX_RECONNECT_DELAY))
+                    self._wake.clear()
+                    continue
+                with self._lock:
+                    if self._stop.is_set():
+                        logout_quietly(mail)
+                        return
+                    self._standby = mail
+                log_event("standby_ready", account=self.account.name, tls_resumed=mail.tls_resumed)
+            self._wake.wait(self.keepalive)
+            self._wake.clear()
+
+def open_mailbox(args, account, manager):
+    """Connexion IMAP prête à surveiller le dossier du compte ; retourne (mail, IDLE actif)
+
+    La connexion de secours du gestionnaire est utilisée si elle existe (bascule immédiate).
+    """
+    label = f"iCloud ({account.name})" if len(accounts) > 1 else "iCloud"
+    update_display(args.mode, account.webhook_url, signal_count, last_event=f"[🔌] {get_current_time()} Connexion à {label}...")
+    mail, from_standby = manager.connect()
+    # Compteurs repris de la base locale, sans relire la boîte
+    account.signal_count = load_todays_signal_count(account.key)
+    sync_signal_count()
+
+    # Ajouter les messages de connexion une seule fois dans les alertes
+    add_to_history(f"[⚡] Bascule sur la connexion de secours ({label})" if from_standby
+                   else f"[🔌] Connexion à {label}...", is_alert=True)
+    add_to_history(f"[✅] Connecté et prêt à surveiller les emails de TradingView ({account.key})"
+                   if len(accounts) > 1 else "[✅] Connecté et prêt à surveiller les emails de TradingView", is_alert=True)
+
+    # IDLE uniquement si le serveur l'annonce, sinon on conserve le polling
+    use_idle = args.idle and supports_idle(mail)
+    if args.idle and not use_idle:
+        add_to_history(f"[⚠️] {get_current_time()} IDLE non supporté par le serveur, retour au polling ({CHECK_INTERVAL}s)", is_alert=True)
+    log_event("connected", server=account.imap_server, account=account.name, mailbox=account.key, idle=use_idle,
+              signal_count=account.signal_count, standby=from_standby, tls_resumed=mail.tls_resumed)
+
+    update_display(args.mode, account.webhook_url, signal_count)
+
+    # /healthz échoue si aucune vérification n'aboutit pendant un cycle complet (+ marge)
+    metrics.watch(account.key, (IDLE_TIMEOUT if use_idle else CHECK_INTERVAL) + HEALTH_GRACE)
+    return mail, use_idle
+
+def close_mailbox(mail):
+    """Déconnexion propre (CLOSE + LOGOUT) à l'arrêt du programme"""
+    try:
+        if mail:
+            mail.close()
+            mail.logout()
+        add_to_history("[✅] Déconnexion effectuée", is_alert=True)
+    except Exception:
+        pass
 
-    while True:
+def logout_quietly(mail):
+    """LOGOUT après une erreur de connexion (la connexion est peut-être déjà perdue)"""
+    try:
+        if mail:
+            mail.logout()
+    except:
+        pass
+
+def report_connection_error(args, account, error, reconnect_delay):
+    error_msg = (f"[❌] {get_current_time()} Erreur de connexion ({account.name}) : {str(error)}" if len(accounts) > 1
+                 else f"[❌] {get_current_time()} Erreur de connexion : {str(error)}")
+    add_to_history(error_msg, is_alert=True)
+    reconnect_msg = (f"[🔄] {get_current_time()} Nouvelle tentative dans {reconnect_delay} secondes..." if reconnect_delay
+                     else f"[🔄] {get_current_time()} Reconnexion immédiate...")
+    add_to_history(reconnect_msg, is_alert=True)
+    log_event("reconnect", level=logging.WARNING, account=account.name, error=str(error), delay=reconnect_delay)
+    metrics.inc("imap_reconnects_total", account=account.name)
+    update_display(args.mode, account.webhook_url, signal_count)
+
+def record_reconnect(account, lost_at):
+    """Mesure le temps entre la perte de la connexion et la reprise de la surveillance"""
+    if lost_at is not None:
+        duration = time.monotonic() - lost_at
+        metrics.observe("imap_reconnect_duration_seconds", duration, account=account.name)
+        log_event("reconnected", account=account.name, seconds=round(duration, 3))
+
+def next_reconnect_delay(failures):
+    """Première tentative immédiate (connexion de secours), puis backoff exponentiel"""
+    return 0 if failures == 0 else min(RECONNECT_DELAY * 2 ** (failures - 1), MAX_RECONNECT_DELAY)
+
+# Gestionnaires de connexion créés au démarrage (connexion initiale ouverte en parallèle de l'initialisation)
+connections = {}
+
+# Extrémité d'écriture de la paire de sockets d'IDLE de chaque compte, par clé de boîte
+idle_wakers = {}
+
+def wake_idle(mailbox):
+    """Interrompt l'IDLE du compte (arrêt, ou email traité à marquer comme lu sans attendre)
+
+    Le tick qui suit le réveil pose le flag lu dès la sortie du signal de l'outbox, au lieu
+    d'attendre la fin d'IDLE (jusqu'à IDLE_TIMEOUT). L'écriture est non bloquante : en mode
+    polling, personne ne lit la paire et un tampon plein est simplement ignoré.
+    """
+    writer = idle_wakers.get(mailbox)
+    if writer is not None:
+        try:
+            writer.send(b"\0")
+        except OSError:
+            pass
+
+def open_idle_waker(account):
+    """Paire de sockets incluse dans le select() d'IDLE pour l'interrompre (arrêt, email à marquer)"""
+    wake, wake_writer = socket.socketpair()
+    wake_writer.setblocking(False)
+    idle_wakers[account.key] = wake_writer
+    return wake, wake_writer
+
+def watch_account(args, account, outbox, stop, wake):
+    """Boucle de surveillance d'un compte : vérification, IDLE/attente et reconnexion"""
+    manager = connections.get(account.key) or ConnectionManager(account)
+    manager.start()
+    failures = 0
+    lost_at = None
+    while not stop.is_set():
         mail = None
         try:
-            update_display(args.mode, webhook_url, 0, last_event=f"[🔌] {get_current_time()} Connexion à iCloud...")
-            mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-            mail.login(EMAIL_ACCOUNT, APP_PASSWORD)
-            mail.select("inbox")
-            
-            global signal_count
-            signal_count = count_todays_signals(mail)
-            
-            # Ajouter les messages de connexion une seule fois dans les alertes
-            add_to_history("[🔌] Connexion à iCloud...", is_alert=True)
-            add_to_history("[✅] Connecté et prêt à surveiller les emails de TradingView", is_alert=True)
-            
-            update_display(args.mode, webhook_url, signal_count)
-            
-            reconnect_delay = RECONNECT_DELAY
+            mail, use_idle = open_mailbox(args, account, manager)
+
+            while not stop.is_set():
+                check_email(mail, outbox, args.mode, account)
+                metrics.tick(account.key)
+                if failures or lost_at is not None:
+                    record_reconnect(account, lost_at)
+                    failures, lost_at = 0, None
+                if use_idle:
+                    manager.idle(mail, wake)
+                else:
+                    stop.wait(CHECK_INTERVAL)
+            close_mailbox(mail)
 
-            while True:
-                check_email(mail, webhook_url, args.mode)
-                time.sleep(CHECK_INTERVAL)
+        except Exception as e:
+            logout_quietly(mail)
+            if stop.is_set():
+                break
+            lost_at = lost_at or time.monotonic()
+            reconnect_delay = next_reconnect_delay(failures)
+            failures += 1
+            report_connection_error(args, account, e, reconnect_delay)
+            stop.wait(reconnect_delay)
+    manager.stop()
+
+def run_thread_engine(args, outbox):
+    """Moteur par défaut : un thread de surveillance par compte, le thread principal attend Ctrl+C"""
+    stop = threading.Event()
+    watchers = []
+    for account in accounts.values():
+        wake, wake_writer = open_idle_waker(account)
+        thread = threading.Thread(target=watch_account, args=(args, account, outbox, stop, wake),
+                                  name=f"imap-{account.name}", daemon=True)
+        thread.start()
+        watchers.append((thread, wake, wake_writer))
+    try:
+        while any(thread.is_alive() for thread, _, _ in watchers):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        # Ajouter le message d'arrêt dans les alertes
+        add_to_history("[👋] Arrêt du programme...", is_alert=True)
+        stop.set()
+        for account in accounts.values():
+            wake_idle(account.key)
+        for thread, wake, wake_writer in watchers:
+            thread.join(timeout=5)
+            wake.close()
+            wake_writer.close()
+        raise
 
-        except KeyboardInterrupt:
-            # Ajouter le message d'arrêt dans les alertes
+class AsyncEngine:
+    """Moteur asyncio (--engine async) : trois étapes reliées par des files bornées
+
+    - ingestion : une tâche par compte pour SEARCH, FETCH groupé, STORE et IDLE, sur un
+      thread dédié à sa connexion IMAP (imaplib est bloquant et une connexion ne se partage pas)
+    - analyse : sélection du signal, limite quotidienne, outbox et filigrane (commune aux comptes)
+    - envoi : vidage de l'outbox vers les webhooks (même logique que OutboxWorker)
+    L'email d'alerte de limite part en arrière-plan (AlertNotifier). Une rafale n'est donc
+    limitée que par l'étape la plus lente : la détection n'attend ni le webhook ni SMTP.
+    """
+
+    class Session:
+        """État d'ingestion propre à un compte"""
+
+        def __init__(self, account):
+            self.account = account
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"imap-{account.name}")
+            self.mail = None
+            self.cursor = None   # Filigrane déjà transmis à l'étape d'analyse
+            self.generation = 0  # Incrémenté quand un lot échoue : les lots déjà en file sont ignorés
+            self.seen = deque()  # UID à marquer comme lus au prochain tick (ajoutés par l'analyse)
+            self.manager = connections.get(account.key) or ConnectionManager(account)
+            self.wake, self.wake_writer = open_idle_waker(account)
+
+    def __init__(self, args, outbox):
+        self.args = args
+        self.outbox = outbox
+        self.loop = None
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.sessions = [self.Session(account) for account in accounts.values()]
+        self.batches = asyncio.Queue(maxsize=ASYNC_QUEUE_SIZE)
+        self._dispatch_wake = asyncio.Event()
+        for session in self.sessions:
+            session.manager.start()
+        coros = [self.ingest(session) for session in self.sessions] + [self.classify(), self.dispatch()]
+        tasks = [asyncio.create_task(coro) for coro in coros]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
             add_to_history("[👋] Arrêt du programme...", is_alert=True)
+            for session in self.sessions:
+                wake_idle(session.account.key)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for session in self.sessions:
+                # Exécuté sur le thread IMAP du compte, donc après la fin de l'éventuel IDLE en cours
+                await self.loop.run_in_executor(session.executor, close_mailbox, session.mail)
+                session.manager.stop()
+                session.executor.shutdown()
+                session.wake.close()
+                session.wake_writer.close()
+
+    def notify(self):
+        """Réveille l'étape d'envoi ; appelé depuis submit_signal (thread de l'exécuteur ou de l'écoute HTTP)
+
+        Avant le démarrage de la boucle, rien à réveiller : l'étape d'envoi vide l'outbox en démarrant.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._dispatch_wake.set)
+
+    def _poll(self, session):
+        """Un tick d'ingestion, exécuté sur le thread IMAP du compte"""
+        seen_ids = []
+        while session.seen:
+            seen_ids.append(session.seen.popleft())
+        if seen_ids:
+            notices = []
+            mark_seen(session.mail, session.account.key, seen_ids, notices)
+            render_notices(self.args.mode, session.account.webhook_url, notices)
+        return poll_mailbox(session.mail, self.args.mode, session.account, session.cursor)
+
+    async def ingest(self, session):
+        account = session.account
+        on_imap = lambda func, *args: self.loop.run_in_executor(session.executor, func, *args)
+        failures = 0
+        lost_at = None
+        while True:
             try:
+                session.mail, use_idle = await on_imap(open_mailbox, self.args, account, session.manager)
+                while True:
+                    generation = session.generation
+                    batch = await on_imap(self._poll, session)
+                    if batch is not None and generation == session.generation:
+                        # File bornée : si l'analyse prend du retard, l'ingestion attend
+                        await self.batches.put((session, generation, *batch))
+                        # Un échec d'analyse pendant l'attente a remis le curseur au filigrane enregistré
+                        if generation == session.generation:
+                            session.cursor = batch[2]
+                    metrics.tick(account.key)
+                    if failures or lost_at is not None:
+                        record_reconnect(account, lost_at)
+                        failures, lost_at = 0, None
+                    if use_idle:
+                        await on_imap(session.manager.idle, session.mail, session.wake)
+                    else:
+                        await asyncio.sleep(CHECK_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                mail, session.mail = session.mail, None
                 if mail:
-                    mail.close()
-                    mail.logout()
-                add_to_history("[✅] Déconnexion effectuée", is_alert=True)
-            except:
+                    await on_imap(logout_quietly, mail)
+                lost_at = lost_at or time.monotonic()
+                reconnect_delay = next_reconnect_delay(failures)
+                failures += 1
+                report_connection_error(self.args, account, e, reconnect_delay)
+                await asyncio.sleep(reconnect_delay)
+
+    async def classify(self):
+        while True:
+            session, generation, email_ids, messages, watermark, detected_at, fetched_at = await self.batches.get()
+            account = session.account
+            if generation != session.generation:
+                continue  # Lot suivant un lot en échec : il sera relu depuis le filigrane enregistré
+            try:
+                if not email_ids:
+                    # Nouveaux messages sans alerte TradingView : on avance simplement le filigrane
+                    await asyncio.to_thread(save_watermark, account.key, watermark)
+                    continue
+                seen_ids, notices = await asyncio.to_thread(process_alerts, self, account, email_ids, messages,
+                                                            watermark, detected_at, fetched_at)
+                session.seen.extend(seen_ids)
+                if seen_ids:
+                    wake_idle(account.key)
+                render_notices(self.args.mode, account.webhook_url, notices)
+            except Exception as e:
+                # Lot non analysé : le filigrane n'a pas avancé. Un nouveau tick repart tout de suite du
+                # filigrane enregistré, et les lots déjà en file (au-delà de celui-ci) sont écartés
+                session.cursor = None
+                session.generation += 1
+                wake_idle(account.key)
+                update_display(self.args.mode, account.webhook_url, signal_count,
+                               error=f"[❌] {get_current_time()} Erreur lors de l'analyse des emails : {str(e)}")
+
+    async def dispatch(self):
+        while True:
+            try:
+                wait = await asyncio.to_thread(self.outbox.deliver_next)
+            except Exception as e:
+                update_display(self.args.mode, None, signal_count,
+                               error=f"[❌] {get_current_time()} Erreur de l'outbox : {e}")
+                wait = OUTBOX_RETRY_DELAY
+            if wait == 0:
+                continue
+            try:
+                await asyncio.wait_for(self._dispatch_wake.wait(), wait)
+            except asyncio.TimeoutError:
                 pass
-            add_to_history("[✅] Programme arrêté", is_alert=True)
-            update_display(args.mode, webhook_url, signal_count)
-            sys.exit(0)
+            self._dispatch_wake.clear()
+
+# Rechargement de config.py à chaud (SIGHUP ou modification du fichier), sans toucher aux connexions IMAP
+# Réglages appliqués à chaud ; les autres (identifiants et serveur IMAP, ports d'écoute, base
+# d'état, tailles des historiques) ne changent qu'au redémarrage
+RELOADABLE_SETTINGS = (
+    "MAX_DAILY_SIGNALS", "SIGNALS_PER_MINUTE", "SIDE_DAILY_LIMITS", "SYMBOL_DAILY_LIMITS", "LIMIT_EXEMPT_SIDES",
+    "WEBHOOK_URL_LOCAL", "WEBHOOK_URL_PUBLIC", "WEBHOOK_TOKEN", "DISPATCH_TARGETS", "DISPATCH_QUORUM",
+    "WEBHOOK_CONNECT_TIMEOUT", "WEBHOOK_READ_TIMEOUT", "WEBHOOK_RETRIES", "WEBHOOK_RETRY_BACKOFF",
+    "WEBHOOK_KEEPALIVE_INTERVAL", "OUTBOX_MAX_ATTEMPTS", "OUTBOX_RETRY_DELAY", "SIGNAL_TTL",
+    "CHECK_INTERVAL", "IDLE_TIMEOUT", "RECONNECT_DELAY", "MAX_RECONNECT_DELAY", "HEALTH_GRACE",
+    "DEDUP_WINDOW", "CROSS_SOURCE_WINDOW", "ALERT_COOLDOWN", "SIGNAL_MAX_AGE", "STALE_SIGNAL_POLICY",
+    "CATCHUP_THRESHOLD", "CONFIG_WATCH_INTERVAL",
+)
+# Réglages d'un compte repris du compte relu (les cibles d'envoi sont comparées à part)
+RELOADABLE_ACCOUNT_FIELDS = ("sender", "webhook_url", "max_daily_signals", "signals_per_minute",
+                             "side_daily_limits", "symbol_daily_limits", "quorum")
+
+# Clients webhook partagés entre cibles de même configuration (clé : DispatchTarget.client_key)
+webhook_clients = {}
+
+def attach_clients(targets):
+    """Rattache à chaque cible le client webhook de sa configuration, créé et préchauffé au besoin"""
+    for target in targets:
+        client = webhook_clients.get(target.client_key)
+        if client is None:
+            client = webhook_clients[target.client_key] = WebhookClient(target.url, target.headers, *target.timeouts,
+                                                                        target.retries, target.retry_backoff)
+            client.start_keepalive()
+        target.client = client
+
+def reload_config(mode, idle):
+    """Relit config.py et applique les réglages à chaud ; retourne les réglages modifiés
+
+    Les limites, cibles d'envoi et intervalles sont relus à chaque usage : les nouveaux
+    s'appliquent au prochain signal ou au prochain cycle, sans reconnexion IMAP. Si config.py
+    est invalide, la configuration en cours reste en place et l'erreur est propagée.
+    """
+    importlib.reload(config)
+    module = globals()
+    previous = {name: module[name] for name in RELOADABLE_SETTINGS}
+    changed = []
+    for name in RELOADABLE_SETTINGS:
+        if hasattr(config, name):
+            value = getattr(config, name)
+            if name == "LIMIT_EXEMPT_SIDES":
+                value = tuple(value)
+            if value != previous[name]:
+                module[name] = value
+                changed.append(name)
+    try:
+        fresh = load_accounts(mode)
+    except Exception:
+        module.update(previous)
+        raise
 
-        except Exception as e:
-            error_msg = f"[❌] {get_current_time()} Erreur de connexion : {str(e)}"
-            add_to_history(error_msg, is_alert=True)
+    for key, account in accounts.items():
+        new = fresh.get(key)
+        if new is None:
+            continue
+        updated = [field for field in RELOADABLE_ACCOUNT_FIELDS if getattr(new, field) != getattr(account, field)]
+        if ([(t.name, t.client_key, t.template, t.required) for t in new.targets]
+                != [(t.name, t.client_key, t.template, t.required) for t in account.targets]):
+            updated.append("targets")
+        if not updated:
+            continue
+        attach_clients(new.targets)
+        for field in RELOADABLE_ACCOUNT_FIELDS:
+            setattr(account, field, getattr(new, field))
+        account.targets = new.targets  # Remplacement en bloc : l'outbox lit l'ancienne ou la nouvelle liste
+        changed.append(f"{account.name} ({', '.join(updated)})")
+    added, removed = fresh.keys() - accounts.keys(), accounts.keys() - fresh.keys()
+    if added or removed:
+        log_event("config_restart_required", level=logging.WARNING, added=sorted(added), removed=sorted(removed))
+
+    # Clients dont plus aucune cible ne se sert
+    used = {target.client_key for account in accounts.values() for target in account.targets}
+    for client_key in [client_key for client_key in webhook_clients if client_key not in used]:
+        webhook_clients.pop(client_key).stop()
+    deduplicator.window = DEDUP_WINDOW
+    if deduplicator.cross_window:
+        deduplicator.cross_window = CROSS_SOURCE_WINDOW
+    notifier.cooldown = ALERT_COOLDOWN
+    for key, manager in connections.items():
+        manager.idle_timeout = min(manager.idle_timeout, IDLE_TIMEOUT)
+        metrics.watch(key, (IDLE_TIMEOUT if idle else CHECK_INTERVAL) + HEALTH_GRACE)
+    if not headless:
+        with _display_lock:
+            dashboard.webhook_url = get_webhook_url(mode)
+    return changed
+
+def start_config_watcher(args, stop):
+    """Thread qui recharge config.py sur SIGHUP, ou dès que le fichier est modifié
+
+    Le fichier est surveillé par un stat() toutes les CONFIG_WATCH_INTERVAL secondes (None :
+    SIGHUP seulement). Le gestionnaire de signal se contente de réveiller le thread.
+    """
+    requested = threading.Event()
+    path = getattr(config, "__file__", None)
+
+    def modified_at():
+        try:
+            return os.stat(path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def run():
+        last = modified_at()
+        while not stop.is_set():
+            requested.wait(CONFIG_WATCH_INTERVAL)
+            current = modified_at()
+            if stop.is_set() or (not requested.is_set() and current == last):
+                continue
+            requested.clear()
+            last = current
             try:
-                if mail:
-                    mail.logout()
-            except:
-                pass
+                changed = reload_config(args.mode, args.idle)
+            except Exception as e:
+                metrics.inc("config_reloads_total", outcome="failed")
+                update_display(args.mode, None, signal_count,
+                               error=f"[❌] {get_current_time()} config.py non rechargé (configuration en cours conservée) : {e}")
+                continue
+            metrics.inc("config_reloads_total", outcome="applied")
+            log_event("config_reloaded", changed=changed)
+            update_display(args.mode, None, signal_count,
+                           last_event=f"[🔄] {get_current_time()} Configuration rechargée : "
+                                      + (", ".join(changed) if changed else "aucun changement"))
+
+    if hasattr(os_signal, "SIGHUP"):
+        os_signal.signal(os_signal.SIGHUP, lambda signum, frame: requested.set())
+    threading.Thread(target=run, name="config-watcher", daemon=True).start()
+
+# Rejeu d'archives (--replay) : mêmes étapes que la surveillance, emails lus sur disque
+REPLAY_CHUNK = 256  # Emails analysés par tâche d'un processus de rejeu
+
+def read_archive(path):
+    """Emails bruts d'une archive mbox (fichier) ou Maildir (dossier), dans l'ordre de l'archive
+
+    Les emails sont lus un par un : d'un mbox, seule la table des positions reste en mémoire.
+    Un Maildir est parcouru dans l'ordre de ses noms de fichiers, qui commencent par l'heure
+    de livraison.
+    """
+    import mailbox
+    if os.path.isdir(path):
+        archive = mailbox.Maildir(path, factory=None, create=False)
+        keys = sorted(archive.keys())
+    else:
+        archive = mailbox.mbox(path, factory=None, create=False)
+        keys = archive.keys()
+    try:
+        for key in keys:
+            yield archive.get_bytes(key)
+    finally:
+        archive.close()
+
+def parse_archived_emails(raw_emails):
+    """Analyse un lot d'emails archivés (exécuté dans les processus du rejeu)
+
+    Retourne, pour chaque email, (expéditeur, Message-ID, Date en epoch, texte) : les champs
+    que fetch_alert_messages() obtient du serveur IMAP en surveillance.
+    """
+    parsed = []
+    for raw_email in raw_emails:
+        email_msg = email.message_from_bytes(raw_email)
+        message_id = email_msg.get("Message-ID")
+        parsed.append((str(email_msg.get("From", "")), str(message_id) if message_id else None,
+                       parse_email_date(email_msg.get("Date")), text_payload(email_msg)))
+    return parsed
+
+def parse_archive(path, workers):
+    """Emails analysés de l'archive, dans l'ordre, répartis sur `workers` processus
+
+    Au plus deux lots par processus sont en cours : la mémoire reste bornée quelle que soit
+    la taille de l'archive.
+    """
+    raw_emails = read_archive(path)
+    chunks = iter(lambda: list(islice(raw_emails, REPLAY_CHUNK)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from parse_archived_emails(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_archived_emails, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+class RecordingSink:
+    """Destination des signaux rejoués (--replay-sink) : une ligne JSON par envoi
+
+    Chaque ligne porte la cible, la clé d'idempotence, la date de l'email rejoué et la charge
+    utile telle que la cible l'aurait reçue.
+    """
+
+    RESPONSE = SimpleNamespace(status_code=200, text="")
+
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()  # Cibles d'un même compte servies en parallèle par l'outbox
+        self.email_date = None         # Date de l'email en cours de rejeu (epoch)
+        self.count = 0
+
+    def write(self, target, payload, idempotency_key):
+        email_date = datetime.fromtimestamp(self.email_date, timezone.utc).isoformat() if self.email_date else None
+        line = json.dumps({"target": target, "idempotency_key": idempotency_key, "email_date": email_date,
+                           "payload": payload}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self.count += 1
+
+    def close(self):
+        self._file.close()
+
+class RecordingClient:
+    """Client d'une cible pendant le rejeu : même interface que WebhookClient, envoi dans le RecordingSink"""
+
+    def __init__(self, sink, target):
+        self.sink = sink
+        self.target = target
+
+    def post(self, payload, headers=None):
+        self.sink.write(self.target, payload, (headers or {}).get("X-Idempotency-Key"))
+        return RecordingSink.RESPONSE
+
+    def stop(self):
+        pass
+
+def run_replay(args):
+    """Rejoue une archive à travers l'analyse, le dédoublonnage, le limiteur et l'outbox
+
+    Chaque email passe par process_alerts() comme s'il venait d'arriver seul, puis l'outbox
+    est vidée avant l'email suivant. L'état (outbox, budgets, filigrane) vit dans une base
+    temporaire : la base de la surveillance n'est pas touchée. Le dédoublonnage et les
+    budgets suivent l'en-tête Date des emails et non l'horloge : une année rejouée en
+    quelques secondes garde ses fenêtres et ses remises à zéro quotidiennes.
+    Retourne le code de sortie du programme.
+    """
+    global STATE_DB, _state_db
+    if args.replay_account:
+        account = next((account for account in accounts.values() if account.name == args.replay_account), None)
+        if account is None:
+            log_error(f"[❌] Compte inconnu : {args.replay_account}")
+            return 2
+    else:
+        account = next(iter(accounts.values()))
+    if not os.path.exists(args.replay):
+        log_error(f"[❌] Archive introuvable : {args.replay}")
+        return 2
+    # Sans sink, un rejeu ne doit atteindre que des webhooks locaux : une cible à "url" fixe
+    # (identique quel que soit le mode) peut être le bot réel
+    remote = [target.name for target in account.targets if not target.local]
+    if remote and not args.replay_sink:
+        log_error(f"[❌] Rejeu refusé : cibles sans url_local ({', '.join(remote)}) ; utilisez --replay-sink")
+        return 2
+    if args.headless:
+        log_listener = start_headless_logging()
+
+    sink = RecordingSink(args.replay_sink) if args.replay_sink else None
+    for target in account.targets:
+        if sink:
+            target.client = RecordingClient(sink, target.name)
+        else:
+            target.client = WebhookClient(target.url, target.headers, *target.timeouts, target.retries, target.retry_backoff)
+            target.client.warm()
+    # Les durées mesurées pendant un rejeu ne remplacent pas l'export de la surveillance,
+    # et une limite atteinte dans l'archive ne doit pas déclencher d'email d'alerte
+    latency.export_path = None
+    notifier.muted = True
+    workers = args.replay_workers or os.cpu_count() or 1
+    log_event("replay_started", archive=args.replay, account=account.name, workers=workers,
+              speed=args.replay_speed, sink=args.replay_sink)
+    log_info(f"[⏪] Rejeu de {args.replay} ({account.name}, {workers} processus d'analyse)")
+
+    emails = alerts = 0
+    interrupted = False
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="replay-") as workdir:
+        STATE_DB = os.path.join(workdir, "replay_state.db")
+        limiter.load()
+        # Chaque minuit rejoué remet aussi à zéro les compteurs par compte
+        limiter.on_rollover = lambda day: reset_signal_counter(args.mode, day)
+        outbox = OutboxWorker(args.mode)
+        moment = None
+        origin = None  # (date du premier email, instant de son rejeu) pour --replay-speed
+        try:
+            for sender, message_id, sent_at, text in parse_archive(args.replay, workers):
+                emails += 1
+                # Même filtre que la recherche IMAP (FROM, sans distinction de casse)
+                if account.sender.lower() not in sender.lower():
+                    continue
+                alerts += 1
+                # Horloge du rejeu : date de l'email, sans jamais reculer (archives pas toujours triées)
+                if sent_at is not None:
+                    moment = max(moment, sent_at) if moment else sent_at
+                elif moment is None:
+                    moment = time.time()
+                if args.replay_speed:
+                    origin = origin or (moment, time.monotonic())
+                    delay = origin[1] + (moment - origin[0]) / args.replay_speed - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                if sink:
+                    sink.email_date = moment
+                process_alerts(outbox, account, [str(alerts).encode()],
+                               {alerts: {"text": text, "message_id": message_id}},
+                               (0, alerts, None), None, None, now=moment)
+                # Envoi avant l'email suivant, comme en surveillance où il ne prend que quelques ms
+                while outbox.deliver_next() == 0:
+                    pass
+            # Signaux en attente de nouvelle tentative : vidés avant le bilan (le TTL borne l'attente)
+            wait = outbox.deliver_next()
+            while wait is not None:
+                time.sleep(wait)
+                wait = outbox.deliver_next()
+        except KeyboardInterrupt:
+            interrupted = True
+        finally:
+            outbox.stop()
+            with _state_lock:
+                if _state_db is not None:
+                    _state_db.close()
+                    _state_db = None
+
+    elapsed = time.monotonic() - started
+    summary = {
+        "emails": emails,
+        "alerts": alerts,
+        "signals": metrics.total("signals_detected_total"),
+        "dispatched": metrics.total("signals_dispatched_total"),
+        "coalesced": metrics.total("signals_coalesced_total"),
+        "refused": metrics.total("signal_limit_hits_total", allowed="false"),
+        "tolerated": metrics.total("signal_limit_hits_total", allowed="true"),
+        "dead": metrics.total("signals_dead_total"),
+        "seconds": round(elapsed, 2),
+        "emails_per_second": round(emails / elapsed, 1) if elapsed else None,
+        "interrupted": interrupted,
+    }
+    if sink:
+        sink.close()
+    else:
+        for target in account.targets:
+            target.client.stop()
+    log_event("replay_finished", **summary)
+    if args.headless:
+        log_listener.stop()
+    else:
+        log_success(f"[⏹] Rejeu {'interrompu' if interrupted else 'terminé'} en {summary['seconds']}s : "
+                    f"{emails} emails, {alerts} alertes TradingView, {summary['signals']} signaux, "
+                    f"{summary['dispatched']} envoyés, {summary['coalesced']} dédoublonnés, "
+                    f"{summary['refused']} refusés par les limites ({summary['tolerated']} tolérés), "
+                    f"{summary['dead']} abandonnés")
+    return 130 if interrupted else 0
+
+def main():
+    args = parse_arguments()
+    accounts.update(load_accounts(args.mode))
+    if args.replay:
+        sys.exit(run_replay(args))
+    # Connexion et login IMAP lancés tout de suite : ils se déroulent pendant le reste de l'initialisation
+    for account in accounts.values():
+        connections[account.key] = ConnectionManager(account)
+        connections[account.key].prefetch()
+    webhook_url = get_webhook_url(args.mode)
+    if args.headless:
+        log_listener = start_headless_logging()
+        log_event("startup", mode=args.mode, idle=args.idle, engine=args.engine, webhook_url=webhook_url,
+                  accounts=[account.key for account in accounts.values()])
+    else:
+        dashboard.start(args.mode, webhook_url)
 
-            reconnect_msg = f"[🔄] {get_current_time()} Nouvelle tentative dans {reconnect_delay} secondes..."
-            add_to_history(reconnect_msg, is_alert=True)
-            update_display(args.mode, webhook_url, signal_count)
-            time.sleep(reconnect_delay)
-            reconnect_delay = min(reconnect_delay * 2, MAX_RECONNECT_DELAY)
+    # Connexions aux cibles d'envoi ouvertes dès le démarrage et maintenues en keep-alive
+    # (un seul client, donc un seul pool, par configuration de cible : URL, token, timeouts, relances)
+    for account in accounts.values():
+        attach_clients(account.targets)
+
+    # Envoi des signaux découplé de la surveillance IMAP (thread dédié, ou tâche du moteur async)
+    outbox = OutboxWorker(args.mode)
+    if args.engine == "async":
+        outbox.recover()
+    else:
+        outbox.start()
+
+    # Métriques et santé servies par un thread dédié (le scraping ne touche pas à la boucle IMAP)
+    metrics_server = None
+    for account in accounts.values():
+        metrics.watch(account.key, (IDLE_TIMEOUT if args.idle else CHECK_INTERVAL) + HEALTH_GRACE)
+    if METRICS_PORT:
+        try:
+            metrics_server = start_metrics_server(METRICS_HOST, METRICS_PORT)
+            log_event("metrics_started", host=METRICS_HOST, port=METRICS_PORT)
+        except OSError as e:
+            update_display(args.mode, webhook_url, signal_count,
+                           error=f"[❌] {get_current_time()} Serveur de métriques indisponible sur le port {METRICS_PORT} : {e}")
+
+    # Compteurs et historique des signaux rechargés depuis le registre local (sans relire la boîte mail)
+    for account in accounts.values():
+        account.signal_count = load_todays_signal_count(account.key)
+    sync_signal_count()
+    load_signal_history()
+    if PERSIST_HISTORY:
+        events.load()
+    # Budgets du limiteur repris de la base d'état ; remise à zéro planifiée à minuit (Europe/Paris)
+    limiter.load()
+    notifier.start()
+    rollover_stop = threading.Event()
+    start_daily_rollover(args.mode, rollover_stop)
+    # Limites, cibles et intervalles rechargés à chaud (SIGHUP ou modification de config.py)
+    start_config_watcher(args, rollover_stop)
+
+    engine = AsyncEngine(args, outbox) if args.engine == "async" else None
+    # Arriérés après une coupure traités à part, sur leur propre connexion IMAP
+    catchup.start(engine or outbox, args.mode)
+    # Alertes TradingView reçues directement en HTTP ; l'IMAP reste la voie de secours
+    ingest_server = None
+    if HTTP_INGEST_PORT:
+        if not HTTP_INGEST_TOKEN:
+            update_display(args.mode, webhook_url, signal_count,
+                           error=f"[❌] {get_current_time()} HTTP_INGEST_TOKEN absent de config.py : écoute des alertes HTTP désactivée")
+        else:
+            try:
+                ingest_server = start_ingest_server(HTTP_INGEST_HOST, HTTP_INGEST_PORT, engine or outbox, args.mode)
+                deduplicator.cross_window = CROSS_SOURCE_WINDOW
+                log_event("ingest_started", host=HTTP_INGEST_HOST, port=HTTP_INGEST_PORT)
+            except OSError as e:
+                update_display(args.mode, webhook_url, signal_count,
+                               error=f"[❌] {get_current_time()} Écoute des alertes HTTP indisponible sur le port {HTTP_INGEST_PORT} : {e}")
+
+    # systemctl stop/restart envoie SIGTERM : même arrêt propre que Ctrl+C (envoi en cours
+    # terminé, historique enregistré)
+    os_signal.signal(os_signal.SIGTERM, os_signal.default_int_handler)
+    try:
+        if args.engine == "async":
+            asyncio.run(engine.run())
+        else:
+            run_thread_engine(args, outbox)
+    except KeyboardInterrupt:
+        rollover_stop.set()
+        outbox.stop()
+        notifier.stop()
+        for client in webhook_clients.values():
+            client.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+        if ingest_server:
+            ingest_server.shutdown()
+        add_to_history("[✅] Programme arrêté", is_alert=True)
+        update_display(args.mode, webhook_url, signal_count)
+        if PERSIST_HISTORY:
+            events.save()
+        if args.headless:
+            log_event("shutdown", signal_count=signal_count)
+            log_listener.stop()
+        else:
+            dashboard.stop()
+        sys.exit(0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+"""
+Tests de l'analyse des alertes (AlertParser) : lecture des nombres sans ambiguïté
+
+Le script est chargé comme dans les benchmarks (config.py s'il existe, sinon
+config.example.py), avec les expressions régulières par défaut.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from harness import load_monitor
+
+monitor = load_monitor({"ALERT_PATTERNS": None, "STATE_DB": os.path.join(tempfile.mkdtemp(), "state.db")})
+
+class NumberTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = monitor.AlertParser()
+
+    def price(self, text):
+        return self.parser.parse(text)["price"]
+
+    def assertAmbiguous(self, text, value):
+        with self.assertRaises(monitor.AmbiguousNumber) as caught:
+            self.parser.parse(text)
+        self.assertEqual(caught.exception.value, value)
+
+    def test_plain_and_decimal_point(self):
+        self.assertEqual(self.price("BUY price=65000"), 65000.0)
+        self.assertEqual(self.price("BUY price=1.234"), 1.234)
+        self.assertEqual(self.price("BUY price: 0.5."), 0.5)
+
+    def test_thousands_separator(self):
+        self.assertEqual(self.price("BUY price=65,000"), 65000.0)
+        self.assertEqual(self.price("SELL price=1,234,567 qty=2"), 1234567.0)
+        self.assertEqual(self.price("BUY price=1,234, qty=2"), 1234.0)
+
+    def test_decimal_comma(self):
+        self.assertEqual(self.price("BUY price=1234,5"), 1234.5)
+        self.assertEqual(self.price("BUY prix: 0,12345"), 0.12345)
+        self.assertEqual(self.price("price: 0,001 BUY"), 0.001)
+
+    def test_ambiguous_comma(self):
+        self.assertAmbiguous("BUY price=1234,567", "1234,567")
+        self.assertAmbiguous("BUY price=012,345", "012,345")
+
+    def test_mixed_separators_rejected(self):
+        self.assertAmbiguous("BUY price=1.234,5", "1.234,5")
+        self.assertAmbiguous("BUY price=1,234.5", "1,234.5")
+        self.assertAmbiguous("BUY price=1.234.567", "1.234.567")
+
+    def test_quantity(self):
+        self.assertEqual(self.parser.parse("BUY qty=1,5")["quantity"], 1.5)
+        with self.assertRaises(monitor.AmbiguousNumber):
+            self.parser.parse("BUY qty=2.500,25")
+
+    def test_json_values(self):
+        self.assertEqual(self.price('{"action": "buy", "price": 65000.5}'), 65000.5)
+        self.assertEqual(self.price('{"action": "buy", "price": "65,000"}'), 65000.0)
+        self.assertAmbiguous('{"action": "sell", "price": "1.234,5"}', "1.234,5")
+
+if __name__ == "__main__":
+    unittest.main()
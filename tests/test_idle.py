@@ -0,0 +1,71 @@
+"""
+Tests de l'attente IDLE (wait_for_new_mail) face aux réponses reçues d'un seul bloc
+
+Un serveur IMAP minimal envoie la continuation et les notifications dans la même
+écriture : elles arrivent dans le tampon d'imaplib, invisible pour select().
+"""
+
+import imaplib
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from harness import load_monitor
+
+monitor = load_monitor({"STATE_DB": os.path.join(tempfile.mkdtemp(), "state.db")})
+
+def serve_idle(reply):
+    """Serveur d'une connexion : répond `reply` (d'un bloc) à IDLE, OK à DONE et aux autres commandes"""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def run():
+        conn, _ = listener.accept()
+        listener.close()
+        with conn, conn.makefile("rb") as lines:
+            conn.sendall(b"* OK [CAPABILITY IMAP4rev1 IDLE] test\r\n")
+            tag = None
+            for line in lines:
+                words = line.split()
+                if len(words) > 1 and words[1].upper() == b"IDLE":
+                    tag = words[0]
+                    conn.sendall(reply)
+                elif line.strip().upper() == b"DONE":
+                    conn.sendall(tag + b" OK idle done\r\n")
+                    return
+                elif words:
+                    conn.sendall(b"* CAPABILITY IMAP4rev1 IDLE\r\n" + words[0] + b" OK done\r\n")
+
+    threading.Thread(target=run, daemon=True).start()
+    return listener.getsockname()[1]
+
+class WaitForNewMailTests(unittest.TestCase):
+    def wait(self, reply, timeout=3):
+        mail = imaplib.IMAP4("127.0.0.1", serve_idle(reply))
+        started = time.monotonic()
+        try:
+            return monitor.wait_for_new_mail(mail, timeout), time.monotonic() - started
+        finally:
+            mail.shutdown()
+
+    def test_exists_in_same_segment_as_continuation(self):
+        new_mail, elapsed = self.wait(b"+ idling\r\n* 3 EXISTS\r\n")
+        self.assertTrue(new_mail)
+        self.assertLess(elapsed, 1)
+
+    def test_exists_after_expunge_in_one_read(self):
+        new_mail, elapsed = self.wait(b"+ idling\r\n* 2 EXPUNGE\r\n* 3 EXISTS\r\n")
+        self.assertTrue(new_mail)
+        self.assertLess(elapsed, 1)
+
+    def test_timeout_without_news(self):
+        new_mail, elapsed = self.wait(b"+ idling\r\n", timeout=0.3)
+        self.assertFalse(new_mail)
+        self.assertGreaterEqual(elapsed, 0.3)
+
+if __name__ == "__main__":
+    unittest.main()